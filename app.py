@@ -1,22 +1,69 @@
-import json
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file
-from flask_sqlalchemy import SQLAlchemy
-from flask_mail import Mail, Message
+import time
+_boot_started = time.perf_counter()
+
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, abort
+from sqlalchemy.orm import Session as OrmSession
 from datetime import datetime, timedelta
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-from functools import wraps
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import click
+import csv
+import io
 import os
 import random
+import secrets
 import string
+import sys
+
+from instance import decorators, jsonlib, search
+from instance.assets import AssetManifest, assets_outdated, build_assets
+from instance.decorators import IDEMPOTENCY_RETENTION_DAYS, count_failure, queue_owner, rate_limited, role_required
+from instance.events import EventBus, menu_item_stats_deltas, monthly_summary_deltas, preorder_users_by_day
+from instance.metrics import Metrics
+from instance.order_snapshot import SUFFIX as SNAPSHOT_SUFFIX, WEEKDAYS, open_snapshot, unfrozen, write_snapshot
+from instance.orders_store import read_orders, update_orders
+from instance.rate_limit import RateLimiter
+from instance.served_counters import ServedCounters
+from instance.tenants import TenantRouter, TenantSQLAlchemy
+
+# Время старта по фазам: imports, app, init_db (см. create_app)
+BOOT_TIMINGS = {'imports': time.perf_counter() - _boot_started}
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///school_food.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///school_food.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
+# Файл предзаказов на неделю и папка для DOCX-отчётов (переопределяются, например, в бенчмарках)
+app.config['ORDERS_FILE'] = os.environ.get('ORDERS_FILE', os.path.join(app.instance_path, 'orders.json'))
+app.config['REPORTS_DIR'] = os.environ.get('REPORTS_DIR', os.path.join(app.instance_path, 'reports'))
+# fsync файла и папки на каждую запись orders.json: переживает отключение питания, но медленнее;
+# без него запись всё равно атомарна (os.replace) при падении процесса
+app.config['ORDERS_FSYNC'] = os.environ.get('ORDERS_FSYNC') == '1'
+# Замороженные недели предзаказов (см. freeze_orders_week)
+app.config['WEEKS_DIR'] = os.environ.get('WEEKS_DIR', os.path.join(app.instance_path, 'weeks'))
+# Время (UTC, ЧЧ:ММ) накануне дня, после которого предзаказы собираются в лист заготовки для кухни
+app.config['PREP_SHEET_CUTOFF'] = os.environ.get('PREP_SHEET_CUTOFF', '14:00')
+# JSON через orjson, если установлен; компактный вывод, отступы — только для отладки
+app.json = jsonlib.FastJSONProvider(app)
+if os.environ.get('JSON_PRETTY') == '1':
+    app.config['JSONIFY_PRETTY'] = True
+app.config['ORDERS_JSON_PRETTY'] = os.environ.get('JSON_PRETTY') == '1'
+# Несколько школ: TENANT_MODE=host|path, у каждой своя папка TENANTS_DIR/<slug>
+# с базой и orders.json (см. instance/tenants.py); без TENANT_MODE — одна школа
+app.config['TENANT_MODE'] = os.environ.get('TENANT_MODE') or None
+app.config['TENANTS_DIR'] = os.environ.get('TENANTS_DIR', os.path.join(app.instance_path, 'tenants'))
+# В режиме host школа — <slug>.TENANT_BASE_DOMAIN или хост из TENANT_HOSTS ({хост: slug})
+app.config['TENANT_BASE_DOMAIN'] = os.environ.get('TENANT_BASE_DOMAIN') or None
+app.config['TENANT_IDLE_TIMEOUT'] = float(os.environ.get('TENANT_IDLE_TIMEOUT', '300'))
+# Администраторы, которым доступна сводка по всем школам
+app.config['DISTRICT_ADMINS'] = [e.strip() for e in os.environ.get('DISTRICT_ADMINS', '').split(',') if e.strip()]
+
+db = TenantSQLAlchemy(app)
+tenants = TenantRouter()
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Пожалуйста, войдите в систему'
@@ -31,9 +78,57 @@ app.config['MAIL_USERNAME'] = 'predprof.hackaton@gmail.com'  # <-- ВАША ПО
 app.config['MAIL_PASSWORD'] = 'vxha cffy tcqd czug'     # <-- ПАРОЛЬ ПРИЛОЖЕНИЯ
 app.config['MAIL_DEFAULT_SENDER'] = 'predprof.hackaton@gmail.com'  # <-- ВАША ПОЧТА
 
-mail = Mail(app)
+# Flask-Mail (и smtplib за ним) подключается при первой отправке письма
+_mail = None
 verification_codes = {}
 
+def get_mail():
+    global _mail
+    if _mail is None:
+        from flask_mail import Mail
+        _mail = Mail(app)
+    return _mail
+
+# Профилирование запросов; включается переменной окружения или из админки на лету
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED') == '1'
+app.config['METRICS_N_PLUS_ONE_THRESHOLD'] = 10
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+metrics = Metrics(app)
+metrics.boot_timings = BOOT_TIMINGS
+
+# Счётчики выданных порций копятся в памяти процесса и сбрасываются в ServedMeals
+# не реже раза в SERVED_FLUSH_INTERVAL секунд (окно потери при падении); 0 — писать сразу
+app.config['SERVED_FLUSH_INTERVAL'] = float(os.environ.get('SERVED_FLUSH_INTERVAL', '1.0'))
+app.config['SERVED_FLUSH_THRESHOLD'] = 50
+app.config['SERVED_COUNTER_SHARDS'] = 8
+served_counters = ServedCounters()
+
+# Доменные события (transactional outbox): производные данные обновляются фоновым
+# потоком не реже раза в EVENTS_DISPATCH_INTERVAL секунд; 0 — сразу после commit
+app.config['EVENTS_DISPATCH_INTERVAL'] = float(os.environ.get('EVENTS_DISPATCH_INTERVAL', '0.5'))
+app.config['EVENTS_BATCH_SIZE'] = 200
+events = EventBus()
+
+# CSS/JS с хешем в имени и заранее сжатыми .gz/.br (flask build-assets)
+app.config['ASSETS_AUTO_BUILD'] = os.environ.get('ASSETS_AUTO_BUILD', '1') == '1'
+assets = AssetManifest(app)
+
+# Ограничение частоты входа, регистрации и повторной отправки кода (токен-бакеты по IP и email).
+# RATE_LIMIT_STORAGE: memory — вёдра в памяти процесса; при нескольких воркерах —
+# sqlite:///путь, общий файл. За reverse proxy IP берётся из request.remote_addr (нужен ProxyFix)
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+app.config['RATE_LIMIT_STORAGE'] = os.environ.get('RATE_LIMIT_STORAGE', 'memory')
+# Лимиты по IP во много раз выше, чем по email: вся школа выходит в интернет через один NAT
+app.config['RATE_LIMITS'] = {
+    # Считаются только неверные пароли: удачный вход токенов не тратит
+    'login': {'ip': '100/minute', 'email': '10/minute'},
+    # Каждый запрос — отправка письма по SMTP
+    'register': {'ip': '100/hour', 'email': '3/hour'},
+    'resend': {'ip': '200/hour', 'email': '5/hour'},
+}
+rate_limiter = RateLimiter(app)
+app.add_template_global(queue_owner)
+
 def generate_code(length=6):
     """Генерация случайного кода"""
     return ''.join(random.choices(string.digits, k=length))
@@ -81,8 +176,9 @@ def send_email(to_email, subject, code, template_type='verify'):
     '''
     
     try:
+        from flask_mail import Message
         msg = Message(subject=subject, recipients=[to_email], html=html_content)
-        mail.send(msg)
+        get_mail().send(msg)
         return True, None
     except Exception as e:
         return False, str(e)
@@ -140,6 +236,7 @@ def verify():
     return render_template('verify.html', email=email)
 
 @app.route('/resend')
+@rate_limited('resend', 'verify.html', email=lambda: session.get('pending_email'), methods=('GET',))
 def resend():
     email = session.get('pending_email')
     verify_type = session.get('verify_type', 'register')
@@ -165,6 +262,7 @@ def resend():
     return redirect(url_for('verify'))
 
 @app.route('/register', methods=['GET', 'POST'])
+@rate_limited('register', 'register.html', email=lambda: request.form.get('email'))
 def register():
     if current_user.is_authenticated:
         return redirect(url_for('index'))
@@ -213,16 +311,33 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     name = db.Column(db.String(100), nullable=False)
+    # name.lower() для поиска без учёта регистра: lower() в SQLite не понимает кириллицу
+    name_lower = db.Column(db.String(100), nullable=False, default='', server_default='')
     role = db.Column(db.String(20), nullable=False, default='student')
     student_class = db.Column(db.String(10))
     balance = db.Column(db.Float, default=0.0)
     allergies = db.Column(db.String(500), default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Битовая маска аллергий по таблице allergen, поддерживается вместе со строкой allergies
+    allergy_mask = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Отключённые (например, выпускники) не могут войти, но остаются в истории
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+    # Код для сканирования на раздаче (выдаётся при покупке абонемента, см. ensure_redeem_token)
+    redeem_token = db.Column(db.String(16))
     
     orders = db.relationship('Order', backref='user', lazy=True)
     reviews = db.relationship('Review', backref='user', lazy=True)
     notifications = db.relationship('Notification', backref='user', lazy=True)
 
+    # Индексы под keyset-пагинацию и префиксный поиск в админке
+    __table_args__ = (
+        db.Index('ix_user_name_id', 'name', 'id'),
+        db.Index('ix_user_name_lower', 'name_lower'),
+        db.Index('ix_user_class_id', 'student_class', 'id'),
+        db.Index('ix_user_role_id', 'role', 'id'),
+        db.Index('ix_user_redeem_token', 'redeem_token', unique=True),
+    )
+
 class MenuItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -230,11 +345,43 @@ class MenuItem(db.Model):
     price = db.Column(db.Float, nullable=False)
     calories = db.Column(db.Integer)
     allergens = db.Column(db.String(200), default='')
+    allergen_mask = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     image = db.Column(db.String(10), default='🍽️')
     available = db.Column(db.Boolean, default=True)
     
     reviews = db.relationship('Review', backref='menu_item', lazy=True)
 
+class MenuItemPrice(db.Model):
+    """История цен: отчёты за прошлые недели считают выручку по ценам того времени"""
+    id = db.Column(db.Integer, primary_key=True)
+    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    valid_from = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_menu_item_price_item_from', 'menu_item_id', 'valid_from'),
+    )
+
+class MenuItemStats(db.Model):
+    """Агрегаты по блюду: обновляются подписчиком событий, пересчёт — flask rebuild-stats"""
+    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'), primary_key=True)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+
+    menu_item = db.relationship('MenuItem', backref=db.backref('stats', uselist=False, lazy='joined'))
+
+    @property
+    def avg_rating(self):
+        return round(self.rating_sum / self.review_count, 1) if self.review_count else 0
+
+class Allergen(db.Model):
+    """Справочник аллергенов: каждому соответствует один бит в allergen_mask / allergy_mask"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    bit = db.Column(db.Integer, unique=True, nullable=False)
+    icon = db.Column(db.String(10), default='❌')
+
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -245,6 +392,11 @@ class Order(db.Model):
     
     items = db.relationship('OrderItem', backref='order', lazy=True)
 
+    # История заказов ученика: keyset-пагинация по (created_at, id)
+    __table_args__ = (
+        db.Index('ix_order_user_created_id', 'user_id', 'created_at', 'id'),
+    )
+
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
@@ -279,15 +431,41 @@ class PurchaseRequest(db.Model):
     
     product = db.relationship('Product')
 
+class InventoryMovement(db.Model):
+    """Журнал движения продуктов: каждое изменение остатка — отдельная строка"""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    delta = db.Column(db.Float, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)  # purchase/adjustment
+    purchase_request_id = db.Column(db.Integer, db.ForeignKey('purchase_request.id'))
+    created_by = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_inventory_movement_product_created', 'product_id', 'created_at'),
+    )
+
 class Subscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     sub_type = db.Column(db.String(20), nullable=False)  # week/month
     remaining_meals = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User')
 
+class MealRedemption(db.Model):
+    """Списание приёма пищи по абонементу; уникальность защищает от повторного скана"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    meal_type = db.Column(db.String(20), nullable=False)
+    scanned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'date', 'meal_type', name='uq_meal_redemption_user_date_meal'),
+    )
+
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -295,30 +473,444 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_notification_user_created', 'user_id', 'created_at'),
+        # Частичный индекс: счётчик и отметка непрочитанных не сканируют прочитанные
+        db.Index('ix_notification_user_unread', 'user_id', sqlite_where=db.text('is_read = 0')),
+        db.Index('ix_notification_created_at', 'created_at'),
+    )
+
+class ArchivedOrder(db.Model):
+    """Заказы выпускников и старые заказы, вынесенные из горячей таблицы order"""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    total = db.Column(db.Float, nullable=False)
+    meal_type = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ArchivedOrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    menu_item_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+
+class UserMonthlySummary(db.Model):
+    """Заказы ученика за месяц (включая архивные); обновляется в checkout"""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    total_spent = db.Column(db.Float, nullable=False, default=0.0)
+
 class ServedMeals(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
     breakfast_count = db.Column(db.Integer, default=0)
     lunch_count = db.Column(db.Integer, default=0)
 
+class IdempotencyKey(db.Model):
+    """Ответ на запрос с Idempotency-Key: повтор того же запроса получает его вместо повторной записи"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    endpoint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)  # NULL — запрос ещё выполняется
+    response = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_user_key'),
+    )
+
+class OutboxEvent(db.Model):
+    """Доменное событие, записанное в одной транзакции с изменением, которое его породило"""
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # AUTOINCREMENT: id не переиспользуются после очистки outbox, иначе новое событие
+    # получило бы id меньше checkpoint подписчиков и не было бы доставлено
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class OutboxCheckpoint(db.Model):
+    """До какого события (включительно) подписчик обработал outbox"""
+    subscriber = db.Column(db.String(64), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+
+class PrepSheet(db.Model):
+    """Лист заготовки: сколько порций блюда готовить на дату для класса (см. build_prep_sheet)"""
+    date = db.Column(db.Date, primary_key=True)
+    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'), primary_key=True)
+    student_class = db.Column(db.String(10), primary_key=True)  # '' — класс не указан
+    servings = db.Column(db.Integer, nullable=False, default=0)
+
+class PrepSheetEntry(db.Model):
+    """Предзаказ ученика, учтённый в листе: поздний предзаказ меняет PrepSheet на разницу с ним"""
+    date = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    menu_item_id = db.Column(db.Integer, db.ForeignKey('menu_item.id'), primary_key=True)
+    student_class = db.Column(db.String(10), nullable=False, default='')
+    servings = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_prep_sheet_entry_user', 'user_id'),
+    )
+
+class PrepSheetBuild(db.Model):
+    """Лист на дату сформирован: с этого момента поздние предзаказы применяются к нему сразу"""
+    date = db.Column(db.Date, primary_key=True)
+    built_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class DataVersion(db.Model):
+    """Счётчики версий данных: из них строятся ETag страниц и API (см. conditional)"""
+    key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# ============ DATA VERSIONS ============
+
+# Модели, изменение которых через ORM само увеличивает версию (ключ или функция от объекта)
+VERSIONED_MODELS = {
+    MenuItem: 'menu',
+    Allergen: 'menu',
+    MenuItemStats: 'menu_stats',
+    Product: 'inventory',
+    Notification: lambda n: f'notifications:{n.user_id}',
+}
+
+# Общие ключи версий (кроме персональных notifications:<user_id>)
+DATA_VERSION_KEYS = ('menu', 'menu_stats', 'inventory', 'notifications')
+
+def bump_versions(*keys, connection=None):
+    """+1 к версиям одним upsert в текущей транзакции (для массовых запросов мимо ORM)"""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    stmt = sqlite_insert(DataVersion).values([{'key': key, 'version': 1} for key in keys])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DataVersion.key], set_={'version': DataVersion.version + 1}
+    )
+    (connection or db.session).execute(stmt)
+
+def get_versions(keys):
+    """{ключ: версия} одним запросом по первичному ключу"""
+    rows = dict(db.session.execute(
+        db.select(DataVersion.key, DataVersion.version).where(DataVersion.key.in_(keys))
+    ).all())
+    return {key: rows.get(key, 0) for key in keys}
+
+@db.event.listens_for(OrmSession, 'after_flush')
+def _bump_versions_after_flush(session, flush_context):
+    keys = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        key = VERSIONED_MODELS.get(type(obj))
+        if key is not None:
+            keys.add(key(obj) if callable(key) else key)
+    if keys:
+        bump_versions(*keys, connection=session.connection())
+
+# ============ PRICE HISTORY ============
+
+# Начало истории для цен, которые были до её появления
+PRICE_HISTORY_EPOCH = datetime(2000, 1, 1)
+
+@db.event.listens_for(MenuItem, 'after_insert')
+@db.event.listens_for(MenuItem, 'after_update')
+def _record_menu_item_price(mapper, connection, target):
+    if db.inspect(target).attrs.price.history.has_changes():
+        connection.execute(db.insert(MenuItemPrice).values(
+            menu_item_id=target.id, price=target.price, valid_from=datetime.utcnow()
+        ))
+
+def backfill_price_history():
+    """Стартовая запись истории для блюд, у которых её ещё нет"""
+    has_history = db.select(MenuItemPrice.id).where(MenuItemPrice.menu_item_id == MenuItem.id).exists()
+    db.session.execute(db.insert(MenuItemPrice).from_select(
+        ['menu_item_id', 'price', 'valid_from'],
+        db.select(MenuItem.id, MenuItem.price, db.literal(PRICE_HISTORY_EPOCH)).where(~has_history)
+    ))
+    db.session.commit()
+
+# ============ MENU ITEM STATS ============
+
+def bump_menu_item_stats(deltas):
+    """Прибавляет дельты {menu_item_id: {столбец: n}} к статистике блюд одним upsert"""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    if not deltas:
+        return
+    rows = [{
+        'menu_item_id': menu_item_id,
+        'review_count': d.get('review_count', 0),
+        'rating_sum': d.get('rating_sum', 0),
+        'order_count': d.get('order_count', 0),
+    } for menu_item_id, d in deltas.items()]
+    bump_versions('menu_stats')
+    stmt = sqlite_insert(MenuItemStats).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MenuItemStats.menu_item_id],
+        set_={
+            'review_count': MenuItemStats.review_count + stmt.excluded.review_count,
+            'rating_sum': MenuItemStats.rating_sum + stmt.excluded.rating_sum,
+            'order_count': MenuItemStats.order_count + stmt.excluded.order_count,
+        },
+    )
+    db.session.execute(stmt)
+
+def rebuild_menu_item_stats():
+    """Полный пересчёт из review, order_item и архива заказов"""
+    reviews = db.select(
+        Review.menu_item_id, db.func.count(Review.id), db.func.sum(Review.rating)
+    ).group_by(Review.menu_item_id)
+    items = db.union_all(
+        db.select(OrderItem.menu_item_id.label('menu_item_id')),
+        db.select(ArchivedOrderItem.menu_item_id),
+    ).subquery()
+    orders = db.select(items.c.menu_item_id, db.func.count()).group_by(items.c.menu_item_id)
+
+    deltas = {}
+    for menu_item_id, count, rating_sum in db.session.execute(reviews):
+        deltas.setdefault(menu_item_id, {}).update(review_count=count, rating_sum=rating_sum or 0)
+    for menu_item_id, count in db.session.execute(orders):
+        deltas.setdefault(menu_item_id, {})['order_count'] = count
+
+    db.session.execute(db.delete(MenuItemStats))
+    bump_menu_item_stats(deltas)
+    events.set_checkpoint_to_latest('menu_item_stats')
+    db.session.commit()
+
+# ============ ORDER HISTORY ============
+
+ORDERS_PAGE_SIZE = 20
+ORDERS_MAX_PAGE_SIZE = 100
+
+def month_key(moment):
+    return moment.strftime('%Y-%m')
+
+def bump_user_monthly_summary(deltas):
+    """Прибавляет дельты {(user_id, 'YYYY-MM'): {столбец: n}} к месячным итогам одним upsert"""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    if not deltas:
+        return
+    rows = [{
+        'user_id': user_id,
+        'month': month,
+        'order_count': d.get('order_count', 0),
+        'total_spent': d.get('total_spent', 0.0),
+    } for (user_id, month), d in deltas.items()]
+    stmt = sqlite_insert(UserMonthlySummary).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserMonthlySummary.user_id, UserMonthlySummary.month],
+        set_={
+            'order_count': UserMonthlySummary.order_count + stmt.excluded.order_count,
+            'total_spent': UserMonthlySummary.total_spent + stmt.excluded.total_spent,
+        },
+    )
+    db.session.execute(stmt)
+
+def rebuild_user_monthly_summary():
+    """Полный пересчёт месячных итогов из order и архива заказов"""
+    orders = db.union_all(
+        db.select(Order.user_id.label('user_id'), Order.total.label('total'), Order.created_at.label('created_at')),
+        db.select(ArchivedOrder.user_id, ArchivedOrder.total, ArchivedOrder.created_at),
+    ).subquery()
+    month = db.func.strftime('%Y-%m', orders.c.created_at)
+    db.session.execute(db.delete(UserMonthlySummary))
+    db.session.execute(db.insert(UserMonthlySummary).from_select(
+        ['user_id', 'month', 'order_count', 'total_spent'],
+        db.select(orders.c.user_id, month, db.func.count(), db.func.coalesce(db.func.sum(orders.c.total), 0))
+        .where(orders.c.created_at.is_not(None))
+        .group_by(orders.c.user_id, month)
+    ))
+    events.set_checkpoint_to_latest('user_monthly_summary')
+    db.session.commit()
+
+def order_history_page(user_id, limit=ORDERS_PAGE_SIZE, before_created_at=None, before_id=None):
+    """Страница истории заказов по курсору (created_at, id); возвращает (orders, next_cursor)"""
+    from sqlalchemy.orm import selectinload
+
+    query = db.select(Order).where(Order.user_id == user_id).options(selectinload(Order.items))
+    if before_created_at is not None and before_id is not None:
+        query = query.where(db.tuple_(Order.created_at, Order.id) < db.tuple_(before_created_at, before_id))
+    # Берём на одну запись больше, чтобы узнать, есть ли следующая страница
+    orders = db.session.execute(
+        query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1)
+    ).scalars().all()
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = {'before_created_at': orders[-1].created_at.isoformat(), 'before_id': orders[-1].id}
+    return orders, next_cursor
+
+def _order_to_dict(order):
+    return {
+        'id': order.id,
+        'total': order.total,
+        'meal_type': order.meal_type,
+        'status': order.status,
+        'created_at': order.created_at.strftime('%d.%m.%Y %H:%M'),
+        'items': [{'name': item.name, 'price': item.price} for item in order.items],
+    }
+
+def top_menu_items(k=5, by='orders'):
+    """Топ-K блюд по количеству заказов или по среднему рейтингу"""
+    query = db.session.query(MenuItem, MenuItemStats).join(MenuItemStats)
+    if by == 'rating':
+        query = query.filter(MenuItemStats.review_count > 0).order_by(
+            (MenuItemStats.rating_sum * 1.0 / MenuItemStats.review_count).desc(),
+            MenuItemStats.review_count.desc(),
+        )
+    else:
+        query = query.filter(MenuItemStats.order_count > 0).order_by(MenuItemStats.order_count.desc())
+    return query.limit(k).all()
+
+# ============ DOMAIN EVENTS ============
+
+def _school_scope():
+    tenant = tenants.current()
+    return tenant.slug if tenant else None
+
+events.init_app(app, db, OutboxEvent, OutboxCheckpoint, scope=_school_scope, activate=tenants.activate)
+
+@app.cli.command('prune-outbox')
+@click.option('--school', help='Школа (slug); по умолчанию — все школы')
+def prune_outbox_command(school):
+    """Удалить события, доставленные всем подписчикам (для запуска по cron)"""
+    def prune():
+        events.drain(events.current_scope())
+        return f'Удалено событий: {events.prune()}'
+
+    each_school(school, prune)
+
+@events.subscribe('menu_item_stats', 'order.created', 'review.created')
+def _apply_menu_item_stats(batch):
+    bump_menu_item_stats(menu_item_stats_deltas(batch))
+
+@events.subscribe('user_monthly_summary', 'order.created')
+def _apply_user_monthly_summary(batch):
+    bump_user_monthly_summary(monthly_summary_deltas(batch))
+
+@events.subscribe('order_notifications', 'order.confirmed')
+def _notify_order_confirmed(batch):
+    now = datetime.utcnow()
+    db.session.execute(db.insert(Notification), [{
+        'user_id': event.payload['user_id'],
+        'text': f"Заказ №{event.payload['order_id']} выдан. Приятного аппетита!",
+        'is_read': False,
+        'created_at': now,
+    } for event in batch])
+    bump_versions(*{f"notifications:{event.payload['user_id']}" for event in batch})
+
+@events.subscribe('purchase_notifications', 'purchase.approved')
+def _notify_purchase_approved(batch):
+    approved = sum(len(event.payload['request_ids']) for event in batch)
+    broadcast_notification(f'Одобрено заявок на закупку: {approved}. Остатки на складе обновлены.', role='cook')
+
+# ============ ALLERGENS ============
+
+DEFAULT_ALLERGENS = [
+    ('глютен', '🌾'), ('молоко', '🥛'), ('яйца', '🥚'), ('орехи', '🥜'),
+    ('рыба', '🐟'), ('соя', '🫘'), ('арахис', '🥜'),
+]
+# Маска хранится в SQLite INTEGER (64 бита со знаком)
+MAX_ALLERGENS = 63
+
+# школа -> {name: bit}; справочник только дополняется, поэтому кеш процесса не устаревает.
+# У каждой школы свой справочник: биты новых аллергенов в разных базах могут не совпадать
+_allergen_bits_by_school = {}
+
+def _allergen_bits():
+    tenant = tenants.current()
+    return _allergen_bits_by_school.setdefault(tenant.slug if tenant else None, {})
+
+def _split_allergens(value):
+    return [a.strip() for a in (value or '').split(',') if a.strip()]
+
+def _load_allergen_bits(connection):
+    rows = connection.execute(db.select(Allergen.name, Allergen.bit)).all()
+    _allergen_bits().update((name, bit) for name, bit in rows)
+
+def allergen_mask(names, connection=None):
+    """Маска для списка названий; неизвестные аллергены добавляются в справочник"""
+    connection = connection or db.session.connection()
+    bits = _allergen_bits()
+    mask = 0
+    for name in names:
+        if name not in bits:
+            _load_allergen_bits(connection)
+        if name not in bits:
+            bit = max(bits.values(), default=-1) + 1
+            if bit >= MAX_ALLERGENS:
+                raise ValueError('Слишком много аллергенов в справочнике')
+            connection.execute(db.insert(Allergen).values(name=name, bit=bit))
+            bits[name] = bit
+        mask |= 1 << bits[name]
+    return mask
+
+def allergen_names(mask):
+    bits = _allergen_bits()
+    if not bits:
+        _load_allergen_bits(db.session.connection())
+    return [name for name, bit in sorted(bits.items(), key=lambda x: x[1]) if mask >> bit & 1]
+
+def allergen_catalog():
+    return Allergen.query.order_by(Allergen.bit).all()
+
+@db.event.listens_for(MenuItem, 'before_insert')
+@db.event.listens_for(MenuItem, 'before_update')
+def _sync_menu_item_mask(mapper, connection, target):
+    if db.inspect(target).attrs.allergens.history.has_changes():
+        target.allergen_mask = allergen_mask(_split_allergens(target.allergens), connection)
+
+@db.event.listens_for(User, 'before_insert')
+@db.event.listens_for(User, 'before_update')
+def _sync_user_mask(mapper, connection, target):
+    if db.inspect(target).attrs.allergies.history.has_changes():
+        target.allergy_mask = allergen_mask(_split_allergens(target.allergies), connection)
+
+def seed_allergens():
+    allergen_mask([name for name, _ in DEFAULT_ALLERGENS])
+    for name, icon in DEFAULT_ALLERGENS:
+        Allergen.query.filter_by(name=name).update({'icon': icon})
+    db.session.commit()
+
+def rebuild_allergen_masks():
+    """Пересчёт масок из строковых колонок (после миграции или массовых правок в обход ORM)"""
+    for model, source, target in ((MenuItem, 'allergens', 'allergen_mask'), (User, 'allergies', 'allergy_mask')):
+        rows = db.session.execute(db.select(model.id, getattr(model, source))).all()
+        updates = [{'id': row_id, target: allergen_mask(_split_allergens(value))} for row_id, value in rows]
+        for chunk in _chunks(updates, LIFECYCLE_CHUNK_SIZE):
+            db.session.execute(db.update(model), chunk)
+    bump_versions('menu')
+    db.session.commit()
+
+def menu_items_safe_for(mask, meal_type=None):
+    """Доступные блюда без аллергенов из маски — фильтр одним AND по целому в SQL"""
+    query = MenuItem.query.filter(MenuItem.available == True, MenuItem.allergen_mask.op('&')(mask) == 0)
+    if meal_type:
+        query = query.filter(MenuItem.meal_type == meal_type)
+    return query.order_by(MenuItem.meal_type, MenuItem.id).all()
+
 # ============ DECORATORS ============
 
-def role_required(*roles):
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            if not current_user.is_authenticated:
-                return redirect(url_for('login'))
-            if current_user.role not in roles:
-                flash('У вас нет доступа к этой странице', 'error')
-                return redirect(url_for('index'))
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
+# Меняется при выкладке новой версии: шаблоны могли измениться при тех же данных
+ETAG_RELEASE = os.environ.get('APP_RELEASE') or str(os.stat(__file__).st_mtime_ns)
+
+# Декораторы — в instance/decorators.py; здесь привязываются к моделям и версиям данных
+conditional = partial(decorators.conditional, versions=get_versions, release=ETAG_RELEASE)
+idempotent = partial(decorators.idempotent, db=db, model=IdempotencyKey)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user = User.query.get(int(user_id))
+    return user if user and user.is_active else None
 
 # ============ AUTH ROUTES ============
 
@@ -334,6 +926,7 @@ def index():
     return render_template('index.html')
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limited('login', 'login.html', email=lambda: request.form.get('email'), failures_only=True)
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('index'))
@@ -344,9 +937,13 @@ def login():
         user = User.query.filter_by(email=email).first()
         
         if user and check_password_hash(user.password_hash, password):
+            if not user.is_active:
+                flash('Аккаунт отключён. Обратитесь к администратору', 'error')
+                return redirect(url_for('login'))
             login_user(user)
             flash(f'Добро пожаловать, {user.name}!', 'success')
             return redirect(url_for('index'))
+        count_failure()
         flash('Неверный email или пароль', 'error')
     
     return render_template('login.html')
@@ -356,25 +953,57 @@ def login():
 def logout():
     logout_user()
     flash('Вы вышли из системы', 'info')
-    return redirect(url_for('login'))
+    response = redirect(url_for('login'))
+    # Сохранённые service worker'ом страницы персональные: следующему пользователю их не показываем
+    response.headers['Clear-Site-Data'] = '"cache"'
+    return response
 
 # ============ STUDENT ROUTES ============
 
 @app.route('/student/menu')
 @login_required
 @role_required('student')
+@conditional('menu', 'menu_stats')
 def student_menu():
-    breakfast = MenuItem.query.filter_by(meal_type='breakfast', available=True).all()
-    lunch = MenuItem.query.filter_by(meal_type='lunch', available=True).all()
-    user_allergies = current_user.allergies.split(',') if current_user.allergies else []
-    return render_template('student/menu.html', breakfast=breakfast, lunch=lunch, user_allergies=user_allergies)
+    items = MenuItem.query.filter_by(available=True).all()
+    mask = current_user.allergy_mask
+    # ?safe=1 — скрыть блюда с аллергенами пользователя, иначе только пометить их
+    if request.args.get('safe') == '1':
+        items = [item for item in items if not item.allergen_mask & mask]
+    flagged_ids = {item.id for item in items if item.allergen_mask & mask}
+    breakfast = [item for item in items if item.meal_type == 'breakfast']
+    lunch = [item for item in items if item.meal_type == 'lunch']
+    return render_template('student/menu.html', breakfast=breakfast, lunch=lunch, flagged_ids=flagged_ids)
 
 @app.route('/student/orders')
 @login_required
 @role_required('student')
 def student_orders():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
-    return render_template('student/orders.html', orders=orders)
+    orders, next_cursor = order_history_page(current_user.id)
+    summary = db.session.get(UserMonthlySummary, (current_user.id, month_key(datetime.utcnow())))
+    return render_template('student/orders.html', orders=orders, next_cursor=next_cursor,
+                           summary=summary, page_size=ORDERS_PAGE_SIZE)
+
+@app.route('/api/student/orders')
+@login_required
+@role_required('student')
+def api_student_orders():
+    """Следующая страница истории заказов; курсор — next_cursor предыдущей страницы"""
+    limit = min(max(request.args.get('limit', ORDERS_PAGE_SIZE, type=int), 1), ORDERS_MAX_PAGE_SIZE)
+    before_id = request.args.get('before_id', type=int)
+    before_created_at = request.args.get('before_created_at')
+    if before_created_at:
+        try:
+            before_created_at = datetime.fromisoformat(before_created_at)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Неверный курсор'}), 400
+
+    orders, next_cursor = order_history_page(current_user.id, limit, before_created_at or None, before_id)
+    return jsonify({
+        'orders': [_order_to_dict(o) for o in orders],
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    })
 
 @app.route('/student/make_order')
 @login_required
@@ -382,13 +1011,14 @@ def student_orders():
 def make_order():
     breakfast = MenuItem.query.filter_by(meal_type='breakfast', available=True).all()
     lunch = MenuItem.query.filter_by(meal_type='lunch', available=True).all()
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
+    orders, _ = order_history_page(current_user.id)
     return render_template('student/make_order.html', orders=orders, breakfast=breakfast, lunch=lunch)
 
 
 @app.route('/student/create_order')
 @login_required
 @role_required('student')
+@conditional('menu')
 def create_order():
     breakfast = MenuItem.query.filter_by(meal_type='breakfast', available=True).all()
     lunch = MenuItem.query.filter_by(meal_type='lunch', available=True).all()
@@ -402,37 +1032,33 @@ def create_order():
 @app.route('/api/create_order', methods=['POST'])
 @login_required
 @role_required('student')
+@idempotent
 def api_create_order():
     data = request.json
     user_id = current_user.id
 
-    # Define the path to the orders.json file in the instance directory
-    orders_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'orders.json')
+    user_key = f"user{current_user.id}"
 
-    # Load existing orders if the file exists
-    if os.path.exists(orders_file_path):
-        with open(orders_file_path, 'r', encoding='utf-8') as f:
-            try:
-                orders = json.load(f)
-            except json.JSONDecodeError:
-                orders = {}
-    else:
-        # Create the instance directory if it doesn't exist
-        os.makedirs(os.path.dirname(orders_file_path), exist_ok=True)
-        orders = {}
-
-    # Merge the new order data with existing data
-    for day, day_data in data.items():
-        if day not in orders:
-            orders[day] = {}
-        # Update the orders for the current user using user ID format
-        user_key = f"user{current_user.id}"
-        if user_key in day_data:
-            orders[day][user_key] = day_data[user_key]
-
-    # Save the updated orders back to the file
-    with open(orders_file_path, 'w', encoding='utf-8') as f:
-        json.dump(orders, f, ensure_ascii=False, indent=2)
+    def merge(orders):
+        # Merge the new order data with existing data
+        for day, day_data in data.items():
+            orders.setdefault(day, {})
+            if user_key in day_data:
+                orders[day][user_key] = day_data[user_key]
+
+    try:
+        update_orders(orders_file(), merge, pretty=app.config['ORDERS_JSON_PRETTY'],
+                      fsync=app.config['ORDERS_FSYNC'])
+    except jsonlib.JSONDecodeError:
+        # Повреждённый файл не перезаписываем пустым — иначе пропадут заказы всех учеников
+        app.logger.exception('orders.json не удалось разобрать')
+        return jsonify({'success': False, 'message': 'Не удалось сохранить заказ, попробуйте позже'}), 500
+
+    # Поздний предзаказ (после cutoff) попадёт в уже сформированный лист заготовки
+    days = sorted(day for day, day_data in data.items() if user_key in day_data)
+    if days:
+        events.publish('preorder.changed', {'user_id': user_id, 'days': days})
+        db.session.commit()
 
     return jsonify({'success': True, 'message': 'Заказ успешно создан', 'order_data': data})
 
@@ -441,20 +1067,23 @@ def api_create_order():
 @role_required('student')
 def student_payment():
     subscription = Subscription.query.filter_by(user_id=current_user.id).first()
-    return render_template('student/payment.html', subscription=subscription)
+    # GET ничего не пишет: код выдаётся при покупке абонемента или кнопкой (POST)
+    redeem_token = current_user.redeem_token if subscription else None
+    return render_template('student/payment.html', subscription=subscription, redeem_token=redeem_token)
 
 @app.route('/student/profile')
 @login_required
 @role_required('student')
 def student_profile():
-    all_allergens = ['глютен', 'молоко', 'яйца', 'орехи', 'рыба', 'соя', 'арахис']
-    user_allergies = current_user.allergies.split(',') if current_user.allergies else []
+    all_allergens = [a.name for a in allergen_catalog()]
+    user_allergies = allergen_names(current_user.allergy_mask)
     orders_count = Order.query.filter_by(user_id=current_user.id).count()
     return render_template('student/profile.html', all_allergens=all_allergens, user_allergies=user_allergies, orders_count=orders_count)
 
 @app.route('/api/cart/checkout', methods=['POST'])
 @login_required
 @role_required('student')
+@idempotent
 def checkout():
     data = request.json
     items = data.get('items', [])
@@ -482,6 +1111,15 @@ def checkout():
             price=item['price']
         )
         db.session.add(order_item)
+
+    # Статистика блюд и месячные итоги обновятся подписчиками события
+    events.publish('order.created', {
+        'order_id': order.id,
+        'user_id': current_user.id,
+        'month': month_key(datetime.utcnow()),
+        'total': total,
+        'menu_item_ids': [item['id'] for item in items],
+    })
     
     # Deduct balance
     current_user.balance -= total
@@ -530,6 +1168,7 @@ def buy_subscription():
     )
     db.session.add(subscription)
     db.session.commit()
+    ensure_redeem_token(current_user)
     
     return jsonify({'success': True, 'message': 'Абонемент активирован!'})
 
@@ -543,9 +1182,31 @@ def update_allergies():
     db.session.commit()
     return jsonify({'success': True})
 
+@app.route('/api/menu/safe')
+@login_required
+def api_safe_menu():
+    """Безопасные блюда для ?allergies=... или аллергий текущего пользователя"""
+    if 'allergies' in request.args:
+        mask = allergen_mask(_split_allergens(request.args['allergies']))
+    else:
+        mask = current_user.allergy_mask
+    items = menu_items_safe_for(mask, request.args.get('meal_type'))
+    result = {}
+    for item in items:
+        result.setdefault(item.meal_type, []).append({
+            'id': item.id,
+            'name': item.name,
+            'price': item.price,
+            'calories': item.calories,
+            'image': item.image,
+            'allergens': _split_allergens(item.allergens),
+        })
+    return jsonify({'mask': mask, 'allergies': allergen_names(mask), 'menu': result})
+
 @app.route('/api/review', methods=['POST'])
 @login_required
 @role_required('student')
+@idempotent
 def add_review():
     data = request.json
     review = Review(
@@ -555,9 +1216,25 @@ def add_review():
         text=data.get('text', '')
     )
     db.session.add(review)
+    events.publish('review.created', {'menu_item_id': review.menu_item_id, 'rating': int(review.rating)})
     db.session.commit()
     return jsonify({'success': True, 'message': 'Отзыв добавлен!'})
 
+@app.route('/api/menu/top')
+@login_required
+def api_top_menu_items():
+    k = min(max(request.args.get('k', 5, type=int), 1), 50)
+    by = request.args.get('by', 'orders')
+    return jsonify({'items': [{
+        'id': item.id,
+        'name': item.name,
+        'image': item.image,
+        'meal_type': item.meal_type,
+        'order_count': stats.order_count,
+        'review_count': stats.review_count,
+        'avg_rating': stats.avg_rating,
+    } for item, stats in top_menu_items(k, by)]})
+
 @app.route('/api/order/<int:order_id>/receive', methods=['POST'])
 @login_required
 @role_required('student')
@@ -569,19 +1246,52 @@ def mark_order_received(order_id):
     db.session.commit()
     return jsonify({'success': True})
 
+# ============ SERVED MEALS COUNTERS ============
+
+def increment_served_meals(counts):
+    """Атомарно прибавляет {date: {'breakfast': n, 'lunch': n}} к ServedMeals. Не коммитит."""
+    for day, by_type in counts.items():
+        row_id = db.select(db.func.min(ServedMeals.id)).where(ServedMeals.date == day).scalar_subquery()
+        result = db.session.execute(
+            db.update(ServedMeals).where(ServedMeals.id == row_id).values(
+                breakfast_count=db.func.coalesce(ServedMeals.breakfast_count, 0) + by_type.get('breakfast', 0),
+                lunch_count=db.func.coalesce(ServedMeals.lunch_count, 0) + by_type.get('lunch', 0),
+            )
+        )
+        if result.rowcount == 0:
+            db.session.add(ServedMeals(
+                date=day, breakfast_count=by_type.get('breakfast', 0), lunch_count=by_type.get('lunch', 0)
+            ))
+    db.session.flush()
+
+def _persist_served(counts, school=None):
+    # Отдельный app context — отдельная сессия и транзакция, не связанная с текущим запросом
+    with tenants.activate(school), app.app_context():
+        increment_served_meals(counts)
+        db.session.commit()
+
+def _read_served(day, school=None):
+    with tenants.activate(school), app.app_context():
+        row = db.session.execute(
+            db.select(ServedMeals.breakfast_count, ServedMeals.lunch_count)
+            .where(ServedMeals.date == day).order_by(ServedMeals.id).limit(1)
+        ).first()
+    return {'breakfast': row.breakfast_count, 'lunch': row.lunch_count} if row else {}
+
+served_counters.init_app(app, flush=_persist_served, read=_read_served, scope=_school_scope)
+
+def served_today():
+    return served_counters.totals(datetime.utcnow().date())
+
 # ============ COOK ROUTES ============
 
 @app.route('/cook/serve')
 @login_required
 @role_required('cook')
 def cook_serve():
-    today = datetime.utcnow().date()
     now = datetime.utcnow()
-    served = ServedMeals.query.filter_by(date=today).first()
-    if not served:
-        served = ServedMeals(date=today)
-        db.session.add(served)
-        db.session.commit()
+    totals = served_today()
+    served = {'breakfast_count': totals['breakfast'], 'lunch_count': totals['lunch']}
     
     pending_orders = Order.query.filter_by(status='pending').order_by(Order.created_at.desc()).all()
     return render_template('cook/serve.html', served=served, pending_orders=pending_orders, now=now)
@@ -589,6 +1299,7 @@ def cook_serve():
 @app.route('/cook/inventory')
 @login_required
 @role_required('cook')
+@conditional('inventory')
 def cook_inventory():
     products = Product.query.all()
     # Подсчитываем количество продуктов с низким запасом
@@ -610,19 +1321,14 @@ def serve_meal(meal_type):
     data = request.json
     count = data.get('count', 1)
     
+    if meal_type != 'breakfast':
+        meal_type = 'lunch'
     today = datetime.utcnow().date()
-    served = ServedMeals.query.filter_by(date=today).first()
-    if not served:
-        served = ServedMeals(date=today)
-        db.session.add(served)
-    
-    if meal_type == 'breakfast':
-        served.breakfast_count = max(0, served.breakfast_count + count)
-    else:
-        served.lunch_count = max(0, served.lunch_count + count)
+    # Счётчик не уходит в минус (кнопка «−» и сброс)
+    count = max(count, -served_counters.totals(today)[meal_type])
+    served_counters.add(today, meal_type, count)
     
-    db.session.commit()
-    return jsonify({'success': True, 'breakfast': served.breakfast_count, 'lunch': served.lunch_count})
+    return jsonify({'success': True, **served_today()})
 
 @app.route('/api/order/<int:order_id>/confirm', methods=['POST'])
 @login_required
@@ -630,17 +1336,11 @@ def serve_meal(meal_type):
 def confirm_order(order_id):
     order = Order.query.get_or_404(order_id)
     order.status = 'received'
+    events.publish('order.confirmed', {'order_id': order.id, 'user_id': order.user_id})
+    db.session.commit()
     
     # Update served count
-    today = datetime.utcnow().date()
-    served = ServedMeals.query.filter_by(date=today).first()
-    if served:
-        if order.meal_type == 'breakfast':
-            served.breakfast_count += 1
-        else:
-            served.lunch_count += 1
-    
-    db.session.commit()
+    served_counters.add(datetime.utcnow().date(), 'breakfast' if order.meal_type == 'breakfast' else 'lunch')
     return jsonify({'success': True})
 
 @app.route('/api/product/<int:product_id>/update', methods=['POST'])
@@ -649,7 +1349,13 @@ def confirm_order(order_id):
 def update_product(product_id):
     data = request.json
     product = Product.query.get_or_404(product_id)
-    product.quantity = data.get('quantity', product.quantity)
+    quantity = data.get('quantity', product.quantity)
+    if quantity != product.quantity:
+        db.session.add(InventoryMovement(
+            product_id=product.id, delta=quantity - product.quantity,
+            reason='adjustment', created_by=current_user.name
+        ))
+    product.quantity = quantity
     db.session.commit()
     return jsonify({'success': True})
 
@@ -669,6 +1375,513 @@ def create_purchase_request():
     db.session.commit()
     return jsonify({'success': True, 'message': 'Заявка создана'})
 
+# ============ FROZEN WEEKS ============
+
+def week_start_of(day):
+    return day - timedelta(days=day.weekday())
+
+def week_snapshot_path(week_start):
+    return os.path.join(weeks_dir(), week_start.isoformat() + SNAPSHOT_SUFFIX)
+
+def week_snapshot(day):
+    """Снапшот недели, в которую входит day; None — неделя не заморожена"""
+    return open_snapshot(week_snapshot_path(week_start_of(day)))
+
+def frozen_weeks():
+    """Понедельники замороженных недель по возрастанию"""
+    try:
+        names = os.listdir(weeks_dir())
+    except FileNotFoundError:
+        return []
+    weeks = []
+    for name in names:
+        if name.endswith(SNAPSHOT_SUFFIX):
+            try:
+                weeks.append(datetime.strptime(name[:-len(SNAPSHOT_SUFFIX)], '%Y-%m-%d').date())
+            except ValueError:
+                continue
+    return sorted(weeks)
+
+def freeze_orders_week(week_start):
+    """
+    Замораживает orders.json в снапшот недели week_start и очищает файл под его блокировкой.
+    Записи, которых снапшот не хранит, остаются в файле; возвращает (снапшот, их число).
+    """
+    if week_start.weekday() != 0:
+        raise ValueError('Неделя задаётся датой понедельника')
+    path = week_snapshot_path(week_start)
+    if os.path.exists(path):
+        raise ValueError(f'Неделя {week_start:%d.%m.%Y} уже заморожена')
+
+    frozen = []
+
+    def freeze(orders):
+        kept = unfrozen(orders)
+        frozen.append((write_snapshot(path, orders, week_start),
+                       sum(len(items) for day in kept.values() for items in day.values())))
+        orders.clear()
+        orders.update(kept)
+
+    update_orders(orders_file(), freeze, pretty=app.config['ORDERS_JSON_PRETTY'],
+                  fsync=app.config['ORDERS_FSYNC'])
+    return frozen[0]
+
+@app.route('/api/admin/weeks')
+@login_required
+@role_required('admin')
+def api_frozen_weeks():
+    """Последние замороженные недели: порции по дням и блюдам прямо из снапшотов"""
+    limit = min(max(request.args.get('limit', 12, type=int), 1), 104)
+    weeks = []
+    for week_start in reversed(frozen_weeks()[-limit:]):
+        snapshot = open_snapshot(week_snapshot_path(week_start))
+        weeks.append({
+            'week': week_start.isoformat(),
+            'frozen_at': snapshot.frozen_at.isoformat(),
+            'days': {day_name: sum(snapshot.totals(day_name)) for day_name in WEEKDAYS},
+            'items': snapshot.week_totals(),
+        })
+    return jsonify({'weeks': weeks})
+
+@app.cli.command('freeze-week')
+@click.option('--week', 'week_start', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Понедельник недели; по умолчанию ближайший (сегодня, если понедельник)')
+def freeze_week_command(week_start):
+    """Заморозить предзаказы недели после закрытия приёма (для запуска по cron)"""
+    today = datetime.utcnow().date()
+    week_start = week_start.date() if week_start else today + timedelta(days=-today.weekday() % 7)
+
+    def freeze(slug=None):
+        return freeze_orders_week(week_start)
+
+    def kept_note(kept):
+        return f'; в orders.json оставлено записей не по id ученика и блюда: {kept}' if kept else ''
+
+    if not tenants.enabled:
+        try:
+            snapshot, kept = freeze()
+        except ValueError as exc:
+            raise click.ClickException(str(exc))
+        click.echo(f'Неделя {week_start:%d.%m.%Y} заморожена: {snapshot!r}{kept_note(kept)}')
+        return
+    results, errors = tenants.fan_out(freeze)
+    for slug, (snapshot, kept) in results.items():
+        click.echo(f'{slug}: неделя {week_start:%d.%m.%Y} заморожена: {snapshot!r}{kept_note(kept)}')
+    for slug, error in errors.items():
+        click.echo(f'{slug}: ошибка: {error}', err=True)
+
+# ============ KITCHEN PREP SHEET ============
+
+PREP_SHEET_RETENTION_DAYS = 14
+
+def prep_sheet_cutoff(day):
+    """Момент (UTC), после которого предзаказы на day собираются в лист: PREP_SHEET_CUTOFF накануне"""
+    hours, minutes = (int(part) for part in app.config['PREP_SHEET_CUTOFF'].split(':'))
+    return datetime.combine(day - timedelta(days=1), datetime.min.time()).replace(hour=hours, minute=minutes)
+
+def _preorders_for(day, user_ids=None):
+    """{(user_id, menu_item_id): (класс, порции)} на day из снапшота или orders.json"""
+    wanted = {}
+    day_name = WEEKDAYS[day.weekday()]
+    snapshot = week_snapshot(day)
+    if snapshot is not None:
+        for user_id, menu_item_id, servings in snapshot.entries(day_name):
+            if user_ids is None or user_id in user_ids:
+                wanted[(user_id, menu_item_id)] = servings
+    else:
+        for user_key, items in read_orders(orders_file()).get(day_name, {}).items():
+            if not (user_key.startswith('user') and user_key[4:].isdigit()):
+                continue
+            user_id = int(user_key[4:])
+            if user_ids is not None and user_id not in user_ids:
+                continue
+            for item_key, servings in items.items():
+                if item_key.isdigit() and isinstance(servings, int) and servings > 0:
+                    wanted[(user_id, int(item_key))] = servings
+    if not wanted:
+        return {}
+
+    classes = {}
+    for chunk in _chunks({user_id for user_id, _ in wanted}, LIFECYCLE_CHUNK_SIZE):
+        classes.update(db.session.execute(db.select(User.id, User.student_class).where(User.id.in_(chunk))).all())
+    menu_item_ids = set(db.session.execute(db.select(MenuItem.id)).scalars())
+    return {(user_id, menu_item_id): (classes[user_id] or '', servings)
+            for (user_id, menu_item_id), servings in wanted.items()
+            if user_id in classes and menu_item_id in menu_item_ids}
+
+def _bump_prep_sheet(deltas):
+    """Прибавляет дельты {(date, menu_item_id, класс): n} к листам одним upsert. Не коммитит."""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    deltas = {key: n for key, n in deltas.items() if n}
+    if not deltas:
+        return
+    stmt = sqlite_insert(PrepSheet).values([
+        {'date': day, 'menu_item_id': menu_item_id, 'student_class': student_class, 'servings': n}
+        for (day, menu_item_id, student_class), n in deltas.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PrepSheet.date, PrepSheet.menu_item_id, PrepSheet.student_class],
+        set_={'servings': PrepSheet.servings + stmt.excluded.servings},
+    )
+    db.session.execute(stmt)
+    if any(n < 0 for n in deltas.values()):
+        days = {day for day, _, _ in deltas}
+        db.session.execute(db.delete(PrepSheet).where(PrepSheet.date.in_(days), PrepSheet.servings <= 0))
+
+def _sync_prep_sheet(day, user_ids=None):
+    """Приводит лист на day к предзаказам (идемпотентно). Не коммитит; возвращает число учеников с изменениями."""
+    query = db.select(PrepSheetEntry.user_id, PrepSheetEntry.menu_item_id,
+                      PrepSheetEntry.student_class, PrepSheetEntry.servings).where(PrepSheetEntry.date == day)
+    if user_ids is not None:
+        query = query.where(PrepSheetEntry.user_id.in_(user_ids))
+    current = {(user_id, menu_item_id): (student_class, servings)
+               for user_id, menu_item_id, student_class, servings in db.session.execute(query)}
+    wanted = _preorders_for(day, user_ids)
+
+    changed_users = {key[0] for key in current.keys() | wanted.keys() if current.get(key) != wanted.get(key)}
+    if not changed_users:
+        return 0
+
+    deltas = {}
+    for key, (student_class, servings) in current.items():
+        if key[0] in changed_users:
+            sheet_key = (day, key[1], student_class)
+            deltas[sheet_key] = deltas.get(sheet_key, 0) - servings
+    for key, (student_class, servings) in wanted.items():
+        if key[0] in changed_users:
+            sheet_key = (day, key[1], student_class)
+            deltas[sheet_key] = deltas.get(sheet_key, 0) + servings
+
+    for chunk in _chunks(changed_users, LIFECYCLE_CHUNK_SIZE):
+        db.session.execute(db.delete(PrepSheetEntry).where(PrepSheetEntry.date == day,
+                                                           PrepSheetEntry.user_id.in_(chunk)))
+    entries = [{'date': day, 'user_id': user_id, 'menu_item_id': menu_item_id,
+                'student_class': student_class, 'servings': servings}
+               for (user_id, menu_item_id), (student_class, servings) in wanted.items()
+               if user_id in changed_users]
+    if entries:
+        db.session.execute(db.insert(PrepSheetEntry), entries)
+    _bump_prep_sheet(deltas)
+    db.session.execute(db.update(PrepSheetBuild).where(PrepSheetBuild.date == day)
+                       .values(updated_at=datetime.utcnow()))
+    return len(changed_users)
+
+def build_prep_sheet(day):
+    """Формирует или досчитывает лист заготовки на day и коммитит"""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    now = datetime.utcnow()
+    # Upsert первым запросом берёт блокировку записи, и orders.json читается уже под ней:
+    # сборка и доставка поздних предзаказов видят файл в порядке своих транзакций
+    db.session.execute(
+        sqlite_insert(PrepSheetBuild).values(date=day, built_at=now, updated_at=now)
+        .on_conflict_do_update(index_elements=[PrepSheetBuild.date], set_={'updated_at': now})
+    )
+    changed = _sync_prep_sheet(day)
+    db.session.commit()
+    return changed
+
+def prep_sheet(day):
+    """Лист заготовки на day; None, если до cutoff он ещё не сформирован"""
+    query = (
+        db.select(PrepSheetBuild.built_at, PrepSheetBuild.updated_at, PrepSheet.menu_item_id,
+                  PrepSheet.student_class, PrepSheet.servings, MenuItem.name, MenuItem.meal_type)
+        .select_from(PrepSheetBuild)
+        .outerjoin(PrepSheet, PrepSheet.date == PrepSheetBuild.date)
+        .outerjoin(MenuItem, MenuItem.id == PrepSheet.menu_item_id)
+        .where(PrepSheetBuild.date == day)
+        .order_by(MenuItem.meal_type, MenuItem.name, PrepSheet.student_class)
+    )
+    rows = db.session.execute(query).all()
+    if not rows:
+        if datetime.utcnow() < prep_sheet_cutoff(day):
+            return None
+        build_prep_sheet(day)
+        rows = db.session.execute(query).all()
+
+    items, classes = {}, set()
+    for row in rows:
+        if row.menu_item_id is None:
+            continue
+        item = items.setdefault(row.menu_item_id, {
+            'menu_item_id': row.menu_item_id, 'name': row.name, 'meal_type': row.meal_type,
+            'total': 0, 'classes': {},
+        })
+        item['total'] += row.servings
+        item['classes'][row.student_class] = row.servings
+        classes.add(row.student_class)
+    return {
+        'built_at': rows[0].built_at,
+        'updated_at': rows[0].updated_at,
+        'classes': sorted(classes),
+        'items': list(items.values()),
+    }
+
+def _subtract_prep_sheet_users(user_ids):
+    """Убирает предзаказы удаляемых учеников из листов заготовки"""
+    totals = db.select(PrepSheetEntry.date, PrepSheetEntry.menu_item_id, PrepSheetEntry.student_class,
+                       db.func.sum(PrepSheetEntry.servings)) \
+        .where(PrepSheetEntry.user_id.in_(user_ids)) \
+        .group_by(PrepSheetEntry.date, PrepSheetEntry.menu_item_id, PrepSheetEntry.student_class)
+    _bump_prep_sheet({(day, menu_item_id, student_class): -servings
+                      for day, menu_item_id, student_class, servings in db.session.execute(totals)})
+    db.session.execute(db.delete(PrepSheetEntry).where(PrepSheetEntry.user_id.in_(user_ids)))
+
+def prune_prep_sheets(before=None):
+    """Удаляет листы старше PREP_SHEET_RETENTION_DAYS дней. Возвращает количество дат."""
+    before = before or datetime.utcnow().date() - timedelta(days=PREP_SHEET_RETENTION_DAYS)
+    db.session.execute(db.delete(PrepSheetEntry).where(PrepSheetEntry.date < before))
+    db.session.execute(db.delete(PrepSheet).where(PrepSheet.date < before))
+    result = db.session.execute(db.delete(PrepSheetBuild).where(PrepSheetBuild.date < before))
+    db.session.commit()
+    return result.rowcount
+
+@events.subscribe('prep_sheet', 'preorder.changed')
+def _apply_late_preorders(batch):
+    # До cutoff листа ещё нет — эти предзаказы учтёт сама сборка
+    by_day = preorder_users_by_day(batch)
+    built = db.session.execute(
+        db.select(PrepSheetBuild.date).where(PrepSheetBuild.date >= datetime.utcnow().date())
+    ).scalars().all()
+    for day in built:
+        user_ids = by_day.get(WEEKDAYS[day.weekday()])
+        if user_ids:
+            _sync_prep_sheet(day, user_ids)
+
+def _prep_day_arg():
+    """Дата листа из ?date=ГГГГ-ММ-ДД, по умолчанию завтра; None — неверный формат"""
+    value = request.args.get('date')
+    if not value:
+        return datetime.utcnow().date() + timedelta(days=1)
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+@app.route('/cook/prep')
+@login_required
+@role_required('cook')
+def cook_prep():
+    day = _prep_day_arg() or datetime.utcnow().date() + timedelta(days=1)
+    return render_template('cook/prep.html', day=day, sheet=prep_sheet(day),
+                           cutoff=prep_sheet_cutoff(day), timedelta=timedelta)
+
+@app.route('/api/cook/prep')
+@login_required
+@role_required('cook', 'admin')
+def api_cook_prep():
+    day = _prep_day_arg()
+    if day is None:
+        return jsonify({'success': False, 'message': 'Дата в формате ГГГГ-ММ-ДД'}), 400
+    sheet = prep_sheet(day)
+    response = {'date': day.isoformat(), 'cutoff': prep_sheet_cutoff(day).isoformat(), 'ready': sheet is not None}
+    if sheet is not None:
+        response.update(sheet, built_at=sheet['built_at'].isoformat(), updated_at=sheet['updated_at'].isoformat())
+    return jsonify(response)
+
+@app.cli.command('build-prep-sheet')
+@click.option('--date', 'day', type=click.DateTime(formats=['%Y-%m-%d']), help='По умолчанию — завтра')
+def build_prep_sheet_command(day):
+    """Сформировать лист заготовки (для запуска по cron сразу после PREP_SHEET_CUTOFF)"""
+    day = day.date() if day else datetime.utcnow().date() + timedelta(days=1)
+
+    def build(slug=None):
+        changed = build_prep_sheet(day)
+        prune_prep_sheets()
+        return changed
+
+    if not tenants.enabled:
+        click.echo(f'Лист заготовки на {day:%d.%m.%Y}: изменились предзаказы учеников: {build()}')
+        return
+    results, errors = tenants.fan_out(build)
+    for slug, changed in results.items():
+        click.echo(f'{slug}: лист заготовки на {day:%d.%m.%Y}, изменились предзаказы учеников: {changed}')
+    for slug, error in errors.items():
+        click.echo(f'{slug}: ошибка: {error}', err=True)
+
+# ============ MEAL REDEMPTION ============
+
+MEAL_TYPES = ('breakfast', 'lunch')
+# Сколько отложенных сканов принимаем за одну выгрузку
+REDEEM_BATCH_LIMIT = 500
+
+def ensure_redeem_token(user, rotate=False):
+    """Код ученика для сканирования на раздаче: 10 hex-символов, уникальный индекс"""
+    from sqlalchemy.exc import IntegrityError
+
+    if user.redeem_token and not rotate:
+        return user.redeem_token
+    for _ in range(3):
+        user.redeem_token = secrets.token_hex(5).upper()
+        try:
+            db.session.commit()
+            return user.redeem_token
+        except IntegrityError:
+            db.session.rollback()
+    raise RuntimeError('Не удалось выдать уникальный код')
+
+def redeem_meal(token, meal_type, scanned_at=None):
+    """Списывает приём пищи по коду ученика. Не коммитит; возвращает (статус, данные)."""
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+    scanned_at = scanned_at or datetime.utcnow()
+    token = (token or '').strip().upper()
+    user = db.session.execute(
+        db.select(User.id, User.name, User.student_class)
+        .where(User.redeem_token == token, User.is_active.is_(True))
+    ).first()
+    if not token or user is None:
+        return 'unknown_token', {}
+    student = {'name': user.name, 'student_class': user.student_class}
+
+    # Повторный скан того же ученика на тот же приём пищи — конфликт по уникальному ключу
+    redemption_id = db.session.execute(
+        sqlite_insert(MealRedemption).values(
+            user_id=user.id, date=scanned_at.date(), meal_type=meal_type, scanned_at=scanned_at
+        ).on_conflict_do_nothing().returning(MealRedemption.id)
+    ).scalar()
+    if redemption_id is None:
+        return 'already_redeemed', student
+
+    # Условный декремент: без SELECT ... и гонок между двумя кассами
+    remaining = db.session.execute(
+        db.update(Subscription)
+        .where(Subscription.user_id == user.id, Subscription.remaining_meals > 0)
+        .values(remaining_meals=Subscription.remaining_meals - 1)
+        .returning(Subscription.remaining_meals)
+    ).scalar()
+    if remaining is None:
+        db.session.execute(db.delete(MealRedemption).where(MealRedemption.id == redemption_id))
+        return 'no_meals', student
+
+    return 'ok', {**student, 'remaining_meals': remaining}
+
+REDEEM_MESSAGES = {
+    'ok': 'Питание выдано',
+    'unknown_token': 'Код не найден',
+    'already_redeemed': 'Уже получал питание сегодня',
+    'no_meals': 'Нет оплаченных приёмов пищи',
+}
+
+def _parse_scanned_at(value):
+    """ISO-время скана из офлайн-очереди -> naive UTC, как везде в базе"""
+    if not value:
+        return datetime.utcnow()
+    from datetime import timezone
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@app.route('/api/redeem', methods=['POST'])
+@login_required
+@role_required('cook')
+def api_redeem():
+    data = request.json or {}
+    meal_type = data.get('meal_type')
+    if meal_type not in MEAL_TYPES:
+        return jsonify({'success': False, 'message': 'Неверный тип питания'}), 400
+
+    scanned_at = datetime.utcnow()
+    status, payload = redeem_meal(data.get('token'), meal_type, scanned_at)
+    db.session.commit()
+    if status == 'ok':
+        served_counters.add(scanned_at.date(), meal_type)
+    return jsonify({'success': status == 'ok', 'status': status, 'message': REDEEM_MESSAGES[status],
+                    **payload, **served_today()})
+
+@app.route('/api/redeem/batch', methods=['POST'])
+@login_required
+@role_required('cook')
+def api_redeem_batch():
+    """Сканы, накопленные на раздаче без сети, одной транзакцией"""
+    scans = (request.json or {}).get('scans') or []
+    if len(scans) > REDEEM_BATCH_LIMIT:
+        return jsonify({'success': False, 'message': f'Не больше {REDEEM_BATCH_LIMIT} сканов за раз'}), 400
+
+    results = []
+    served = []
+    for scan in scans:
+        meal_type = scan.get('meal_type')
+        try:
+            scanned_at = _parse_scanned_at(scan.get('scanned_at'))
+        except (TypeError, ValueError):
+            scanned_at = None
+        if meal_type not in MEAL_TYPES or scanned_at is None:
+            results.append({'id': scan.get('id'), 'status': 'invalid', 'message': 'Неверные данные скана'})
+            continue
+        status, payload = redeem_meal(scan.get('token'), meal_type, scanned_at)
+        if status == 'ok':
+            served.append((scanned_at.date(), meal_type))
+        results.append({'id': scan.get('id'), 'status': status, 'message': REDEEM_MESSAGES[status], **payload})
+
+    db.session.commit()
+    for day, meal_type in served:
+        served_counters.add(day, meal_type)
+    return jsonify({'success': True, 'results': results, **served_today()})
+
+@app.route('/api/subscription/token', methods=['GET', 'POST'])
+@login_required
+@role_required('student')
+def subscription_token():
+    """GET — текущий код для раздачи (null, если не выпущен), POST — выпустить новый (старый перестаёт работать)"""
+    if request.method == 'GET':
+        return jsonify({'success': True, 'token': current_user.redeem_token})
+    token = ensure_redeem_token(current_user, rotate=True)
+    return jsonify({'success': True, 'token': token})
+
+# ============ INVENTORY ============
+
+def approve_purchase_requests(request_ids, approved_by):
+    """Одобряет pending-заявки одной транзакцией без гонок; возвращает одобренные id"""
+    request_ids = list(request_ids)
+    if not request_ids:
+        return []
+    # WHERE status='pending' RETURNING: параллельное одобрение той же заявки её не получит
+    approved = db.session.execute(
+        db.update(PurchaseRequest)
+        .where(PurchaseRequest.id.in_(request_ids), PurchaseRequest.status == 'pending')
+        .values(status='approved')
+        .returning(PurchaseRequest.id, PurchaseRequest.product_id)
+    ).all()
+    if not approved:
+        db.session.commit()
+        return []
+
+    approved_ids = [row.id for row in approved]
+    db.session.execute(db.insert(InventoryMovement).from_select(
+        ['product_id', 'delta', 'reason', 'purchase_request_id', 'created_by', 'created_at'],
+        db.select(
+            PurchaseRequest.product_id, PurchaseRequest.quantity, db.literal('purchase'),
+            PurchaseRequest.id, db.literal(approved_by), db.literal(datetime.utcnow()),
+        ).where(PurchaseRequest.id.in_(approved_ids))
+    ))
+    totals = db.select(db.func.sum(PurchaseRequest.quantity)).where(
+        PurchaseRequest.product_id == Product.id, PurchaseRequest.id.in_(approved_ids)
+    ).scalar_subquery()
+    # quantity = quantity + сумма без чтения в Python: параллельные одобрения не теряют приращения
+    db.session.execute(
+        db.update(Product)
+        .where(Product.id.in_({row.product_id for row in approved}))
+        .values(quantity=Product.quantity + totals)
+        .execution_options(synchronize_session=False)
+    )
+    bump_versions('inventory')
+    events.publish('purchase.approved', {'request_ids': approved_ids, 'approved_by': approved_by})
+    db.session.commit()
+    return approved_ids
+
+def reject_purchase_requests(request_ids):
+    rejected = db.session.execute(
+        db.update(PurchaseRequest)
+        .where(PurchaseRequest.id.in_(list(request_ids)), PurchaseRequest.status == 'pending')
+        .values(status='rejected')
+        .returning(PurchaseRequest.id)
+    ).scalars().all()
+    db.session.commit()
+    return rejected
+
 # ============ ADMIN ROUTES ============
 
 @app.route('/admin/dashboard')
@@ -702,8 +1915,11 @@ def admin_dashboard():
     # Subscriptions count
     subscriptions_count = Subscription.query.count()
     
-    # Average rating
-    avg_rating = db.session.query(func.avg(Review.rating)).scalar() or 0
+    # Average rating (из материализованной статистики блюд)
+    review_count, rating_sum = db.session.query(
+        func.sum(MenuItemStats.review_count), func.sum(MenuItemStats.rating_sum)
+    ).one()
+    avg_rating = rating_sum / review_count if review_count else 0
     
     # Weekly orders for chart
     weekly_orders = []
@@ -718,10 +1934,7 @@ def admin_dashboard():
     max_weekly = max([d['count'] for d in weekly_orders]) if weekly_orders else 1
     
     # Popular dishes
-    popular = db.session.query(
-        OrderItem.name, 
-        func.count(OrderItem.id).label('count')
-    ).group_by(OrderItem.name).order_by(func.count(OrderItem.id).desc()).limit(5).all()
+    popular = [(item.name, stats.order_count) for item, stats in top_menu_items(5)]
     
     max_popular = popular[0][1] if popular else 1
     
@@ -750,7 +1963,10 @@ def admin_dashboard():
 @login_required
 @role_required('admin')
 def admin_requests():
-    requests = PurchaseRequest.query.filter_by(status='pending').order_by(PurchaseRequest.created_at.desc()).all()
+    from sqlalchemy.orm import joinedload
+
+    requests = PurchaseRequest.query.options(joinedload(PurchaseRequest.product)) \
+        .filter_by(status='pending').order_by(PurchaseRequest.created_at.desc()).all()
     return render_template('admin/requests.html', requests=requests)
 
 @app.route('/admin/reports')
@@ -822,13 +2038,33 @@ def admin_reports():
                          received_count=received_count,
                          pending_count=pending_count)
 
+def _report_source():
+    """Предзаказы для отчёта: orders.json или снапшот недели ?week=ГГГГ-ММ-ДД"""
+    value = request.args.get('week')
+    if not value:
+        return orders_file(), None
+    try:
+        week_start = week_start_of(datetime.strptime(value, '%Y-%m-%d').date())
+    except ValueError:
+        abort(400)
+    snapshot = week_snapshot(week_start)
+    if snapshot is None:
+        abort(404)
+    return week_snapshot_path(week_start), snapshot.frozen_at
+
 @app.route('/admin/reports/export/weekly', methods=['GET'])
 @login_required
 @role_required('admin')
 def export_weekly_report():
     from instance.get_word import generate_report
 
-    report_path = generate_report()
+    source, as_of = _report_source()
+    report_path = generate_report(
+        json_file_path=source,
+        db_path=db.engine.url.database,
+        output_dir=reports_dir(),
+        as_of=as_of,
+    )
     return send_file(
         report_path,
         as_attachment=True,
@@ -840,38 +2076,184 @@ def export_weekly_report():
 @role_required('admin')
 def export_daily_report():
     from instance.get_word import generate_daily_reports 
-    report_path = generate_daily_reports()
+    source, as_of = _report_source()
+    report_path = generate_daily_reports(
+        json_file_path=source,
+        db_path=db.engine.url.database,
+        output_dir=reports_dir(),
+        as_of=as_of,
+    )
     return send_file(
         report_path,
         as_attachment=True,
         download_name=os.path.basename(report_path)
     )
 #sosal
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 200
+
 @app.route('/admin/users')
 @login_required
 @role_required('admin')
 def admin_users():
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    # Список пользователей подгружается постранично через /api/admin/users,
+    # здесь считаем только счётчики по ролям одним GROUP BY
+    role_counts = dict(db.session.query(User.role, db.func.count(User.id)).group_by(User.role).all())
+    return render_template('admin/users.html',
+                         role_counts=role_counts,
+                         total_users=sum(role_counts.values()),
+                         page_size=USERS_PAGE_SIZE)
+
+def _prefix_filter(column, prefix):
+    """
+    Префиксный поиск через диапазон [prefix, prefix с последним символом +1), чтобы SQLite
+    мог использовать индекс; строки сравниваются побайтово в UTF-8, то есть по кодовым точкам
+    """
+    last = ord(prefix[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:  # суррогаты в UTF-8 не кодируются
+        last = 0xE000
+    if last > sys.maxunicode:
+        return db.and_(column >= prefix, db.func.substr(column, 1, len(prefix)) == prefix)
+    return db.and_(column >= prefix, column < prefix[:-1] + chr(last))
+
+@db.event.listens_for(User, 'before_insert')
+@db.event.listens_for(User, 'before_update')
+def _sync_user_name_lower(mapper, connection, target):
+    if db.inspect(target).attrs.name.history.has_changes():
+        target.name_lower = target.name.lower()
+
+def rebuild_user_name_lower():
+    """name_lower из name (после миграции или массовых правок в обход ORM)"""
+    rows = db.session.execute(db.select(User.id, User.name, User.name_lower)).all()
+    updates = [{'id': row_id, 'name_lower': name.lower()} for row_id, name, name_lower in rows
+               if name_lower != name.lower()]
+    for chunk in _chunks(updates, LIFECYCLE_CHUNK_SIZE):
+        db.session.execute(db.update(User), chunk)
+    db.session.commit()
+
+def _user_to_dict(user):
+    return {
+        'id': user.id,
+        'name': user.name,
+        'email': user.email,
+        'role': user.role,
+        'student_class': user.student_class or '',
+        'balance': user.balance,
+        'is_active': user.is_active,
+    }
+
+@app.route('/api/admin/users')
+@login_required
+@role_required('admin')
+def api_admin_users():
+    """Пользователи с keyset-пагинацией: sort, order, role, student_class, q, limit, курсор after_*"""
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    role = request.args.get('role')
+    student_class = request.args.get('student_class')
+    q = (request.args.get('q') or '').strip()
+    limit = min(max(request.args.get('limit', USERS_PAGE_SIZE, type=int), 1), USERS_MAX_PAGE_SIZE)
+    after_id = request.args.get('after_id', type=int)
+    after_name = request.args.get('after_name')
+
+    if sort not in ('id', 'name') or order not in ('asc', 'desc'):
+        return jsonify({'success': False, 'message': 'Неверные параметры сортировки'}), 400
+
+    query = User.query
+    if role and role != 'all':
+        query = query.filter(User.role == role)
+    if student_class:
+        query = query.filter(User.student_class == student_class)
+    if q:
+        query = query.filter(db.or_(
+            _prefix_filter(User.name_lower, q.lower()),
+            _prefix_filter(User.email, q.lower()),
+            _prefix_filter(User.student_class, q.upper()),
+        ))
+
+    descending = order == 'desc'
+    if sort == 'name':
+        key = db.tuple_(User.name, User.id)
+        if after_id is not None and after_name is not None:
+            cursor = db.tuple_(after_name, after_id)
+            query = query.filter(key < cursor if descending else key > cursor)
+        order_by = (User.name.desc(), User.id.desc()) if descending else (User.name, User.id)
+    else:
+        if after_id is not None:
+            query = query.filter(User.id < after_id if descending else User.id > after_id)
+        order_by = (User.id.desc(),) if descending else (User.id,)
+
+    # Берём на одну запись больше, чтобы узнать, есть ли следующая страница
+    users = query.order_by(*order_by).limit(limit + 1).all()
+    has_more = len(users) > limit
+    users = users[:limit]
+
+    next_cursor = None
+    if has_more and users:
+        next_cursor = {'after_id': users[-1].id}
+        if sort == 'name':
+            next_cursor['after_name'] = users[-1].name
+
+    return jsonify({
+        'users': [_user_to_dict(u) for u in users],
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    })
 
 @app.route('/api/request/<int:request_id>/<action>', methods=['POST'])
 @login_required
 @role_required('admin')
 def handle_request(request_id, action):
-    pr = PurchaseRequest.query.get_or_404(request_id)
+    PurchaseRequest.query.get_or_404(request_id)
     
     if action == 'approve':
-        pr.status = 'approved'
-        # Add to inventory
-        pr.product.quantity += pr.quantity
+        done = approve_purchase_requests([request_id], current_user.name)
         message = 'Заявка одобрена'
     else:
-        pr.status = 'rejected'
+        done = reject_purchase_requests([request_id])
         message = 'Заявка отклонена'
     
-    db.session.commit()
+    if not done:
+        return jsonify({'success': False, 'message': 'Заявка уже обработана'})
     return jsonify({'success': True, 'message': message})
 
+@app.route('/api/requests/bulk', methods=['POST'])
+@login_required
+@role_required('admin')
+def handle_requests_bulk():
+    """Одобрение или отклонение нескольких заявок: {"ids": [...], "action": "approve"|"reject"}"""
+    data = request.get_json(silent=True) or {}
+    ids = _int_ids(data.get('ids') or [])
+    action = data.get('action')
+    if action not in ('approve', 'reject') or not ids:
+        return jsonify({'success': False, 'message': 'Неверные параметры'}), 400
+
+    if action == 'approve':
+        done = approve_purchase_requests(ids, current_user.name)
+        return jsonify({'success': True, 'ids': done, 'message': f'Одобрено заявок: {len(done)}'})
+    done = reject_purchase_requests(ids)
+    return jsonify({'success': True, 'ids': done, 'message': f'Отклонено заявок: {len(done)}'})
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    # Prometheus ходит с токеном, администратор — с обычной сессией
+    token = app.config.get('METRICS_TOKEN')
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and not (current_user.is_authenticated and current_user.role == 'admin'):
+        return 'Forbidden', 403
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/api/admin/metrics', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_metrics_toggle():
+    data = request.json
+    if 'enabled' in data:
+        metrics.set_enabled(data['enabled'])
+    if data.get('reset'):
+        metrics.reset()
+    return jsonify({'success': True, 'enabled': metrics.enabled})
+
 # ============ ADMIN USER MANAGEMENT ============
 
 @app.route('/api/admin/user/create', methods=['POST'])
@@ -934,17 +2316,351 @@ def admin_delete_user(user_id):
     if user.id == current_user.id:
         return jsonify({'success': False, 'message': 'Нельзя удалить свой аккаунт'})
     
-    # Delete related data
-    Order.query.filter_by(user_id=user_id).delete()
-    Review.query.filter_by(user_id=user_id).delete()
-    Notification.query.filter_by(user_id=user_id).delete()
-    Subscription.query.filter_by(user_id=user_id).delete()
-    
-    db.session.delete(user)
-    db.session.commit()
+    delete_users([user_id])
     
     return jsonify({'success': True, 'message': 'Пользователь удалён'})
 
+# ============ BULK USER IMPORT ============
+
+USER_ROLES = ('student', 'cook', 'admin')
+IMPORT_BATCH_SIZE = 500
+# Сколько потоков хешируют пароли; hashlib отпускает GIL, так что потоки реально параллельны
+IMPORT_HASH_WORKERS = os.cpu_count() or 4
+
+def _hash_passwords(passwords):
+    with ThreadPoolExecutor(max_workers=IMPORT_HASH_WORKERS) as executor:
+        return list(executor.map(generate_password_hash, passwords))
+
+def _existing_emails(emails):
+    """Какие из email (в нижнем регистре) уже заняты без учёта регистра — один IN-запрос на пачку"""
+    emails = list(emails)
+    existing = set()
+    email = db.func.lower(User.email)
+    for start in range(0, len(emails), IMPORT_BATCH_SIZE):
+        chunk = emails[start:start + IMPORT_BATCH_SIZE]
+        existing.update(e for (e,) in db.session.query(email).filter(email.in_(chunk)))
+    return existing
+
+def import_users_csv(stream, default_role='student'):
+    """Создаёт пользователей из CSV одной транзакцией; возвращает {'created', 'errors'}"""
+    reader = csv.DictReader(stream)
+    errors = []
+    rows = []
+    seen = set()
+
+    # Строка 1 — заголовок, данные начинаются со второй
+    for line_no, raw in enumerate(reader, start=2):
+        row = {k.strip().lower(): (v or '').strip() for k, v in raw.items() if k}
+        email = row.get('email', '').lower()
+        name = row.get('name', '')
+        role = row.get('role') or default_role
+
+        if not email or '@' not in email:
+            errors.append({'row': line_no, 'email': email, 'message': 'Некорректный email'})
+            continue
+        if not name:
+            errors.append({'row': line_no, 'email': email, 'message': 'Не указано ФИО'})
+            continue
+        if role not in USER_ROLES:
+            errors.append({'row': line_no, 'email': email, 'message': f'Неизвестная роль: {role}'})
+            continue
+        if email in seen:
+            errors.append({'row': line_no, 'email': email, 'message': 'Email повторяется в файле'})
+            continue
+        password = row.get('password', '')
+        if password and len(password) < 6:
+            errors.append({'row': line_no, 'email': email, 'message': 'Пароль короче 6 символов'})
+            continue
+        try:
+            balance = float(row.get('balance') or 0) if role == 'student' else 0
+        except ValueError:
+            errors.append({'row': line_no, 'email': email, 'message': 'Некорректный баланс'})
+            continue
+
+        seen.add(email)
+        rows.append({
+            'row': line_no,
+            'email': email,
+            'name': name,
+            'role': role,
+            'student_class': row.get('student_class', '') if role == 'student' else '',
+            'balance': balance,
+            'password': password,
+            'generated': not password,
+        })
+
+    existing = _existing_emails(r['email'] for r in rows)
+    new_rows = []
+    for r in rows:
+        if r['email'] in existing:
+            errors.append({'row': r['row'], 'email': r['email'], 'message': 'Пользователь с таким email уже существует'})
+        else:
+            if r['generated']:
+                r['password'] = secrets.token_urlsafe(8)
+            new_rows.append(r)
+
+    hashes = _hash_passwords([r['password'] for r in new_rows])
+    now = datetime.utcnow()
+    records = [{
+        'email': r['email'],
+        'name': r['name'],
+        'name_lower': r['name'].lower(),
+        'role': r['role'],
+        'student_class': r['student_class'],
+        'balance': r['balance'],
+        'allergies': '',
+        'password_hash': password_hash,
+        'created_at': now,
+    } for r, password_hash in zip(new_rows, hashes)]
+
+    try:
+        for start in range(0, len(records), IMPORT_BATCH_SIZE):
+            db.session.execute(db.insert(User), records[start:start + IMPORT_BATCH_SIZE])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    created = [{
+        'row': r['row'],
+        'email': r['email'],
+        'name': r['name'],
+        'student_class': r['student_class'],
+        'password': r['password'] if r['generated'] else None,
+    } for r in new_rows]
+    errors.sort(key=lambda e: e['row'])
+    return {'created': created, 'errors': errors}
+
+@app.route('/api/admin/users/import', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_import_users():
+    upload = request.files.get('file')
+    if upload:
+        text = upload.read().decode('utf-8-sig')
+    else:
+        text = request.get_data(as_text=True)
+    if not text.strip():
+        return jsonify({'success': False, 'message': 'Файл пуст'})
+
+    result = import_users_csv(io.StringIO(text), default_role=request.args.get('role', 'student'))
+    return jsonify({
+        'success': True,
+        'message': f"Создано пользователей: {len(result['created'])}, ошибок: {len(result['errors'])}",
+        'created': result['created'],
+        'errors': result['errors'],
+    })
+
+@app.cli.command('import-users')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--role', default='student', help='Роль для строк без колонки role')
+@click.option('--passwords-out', type=click.Path(dir_okay=False), help='Куда сохранить сгенерированные пароли (CSV)')
+@click.option('--school', help='Школа (slug); при нескольких школах обязательна')
+def import_users_command(csv_path, role, passwords_out, school):
+    """Массовый импорт пользователей из CSV"""
+    # Один список учеников не импортируется во все школы сразу
+    if tenants.enabled and not school:
+        raise click.UsageError('Укажите школу: --school <slug>')
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f, school_context(school):
+        result = import_users_csv(f, default_role=role)
+
+    for error in result['errors']:
+        click.echo(f"строка {error['row']} ({error['email']}): {error['message']}", err=True)
+    click.echo(f"Создано: {len(result['created'])}, ошибок: {len(result['errors'])}")
+
+    generated = [c for c in result['created'] if c['password']]
+    if passwords_out and generated:
+        with open(passwords_out, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['email', 'name', 'student_class', 'password'])
+            for c in generated:
+                writer.writerow([c['email'], c['name'], c['student_class'], c['password']])
+        click.echo(f'Пароли сохранены в {passwords_out}')
+
+# ============ USER LIFECYCLE ============
+
+LIFECYCLE_CHUNK_SIZE = 500
+
+def _int_ids(values):
+    """Список id из JSON; None, если это не список целых (строки-числа допускаются)"""
+    if not isinstance(values, list):
+        return None
+    ids = []
+    for value in values:
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            return None
+        try:
+            ids.append(int(value))
+        except ValueError:
+            return None
+    return ids
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _subtract_user_stats(user_ids, user_orders):
+    """Убирает отзывы и заказы удаляемых пользователей из статистики блюд"""
+    deltas = {}
+    reviews = db.select(Review.menu_item_id, db.func.count(Review.id), db.func.sum(Review.rating)) \
+        .where(Review.user_id.in_(user_ids)).group_by(Review.menu_item_id)
+    for menu_item_id, count, rating_sum in db.session.execute(reviews):
+        deltas.setdefault(menu_item_id, {}).update(review_count=-count, rating_sum=-(rating_sum or 0))
+    items = db.select(OrderItem.menu_item_id, db.func.count(OrderItem.id)) \
+        .where(OrderItem.order_id.in_(user_orders)).group_by(OrderItem.menu_item_id)
+    for menu_item_id, count in db.session.execute(items):
+        deltas.setdefault(menu_item_id, {})['order_count'] = -count
+    bump_menu_item_stats(deltas)
+
+def delete_users(user_ids):
+    """Удаляет пользователей со всеми зависимыми данными в одной транзакции"""
+    # Недоставленные события этих пользователей иначе вернули бы их заказы в статистику
+    events.drain(events.current_scope())
+    for chunk in _chunks(user_ids, LIFECYCLE_CHUNK_SIZE):
+        user_orders = db.select(Order.id).where(Order.user_id.in_(chunk))
+        _subtract_user_stats(chunk, user_orders)
+        _subtract_prep_sheet_users(chunk)
+        db.session.execute(db.delete(OrderItem).where(OrderItem.order_id.in_(user_orders)))
+        db.session.execute(db.delete(Order).where(Order.user_id.in_(chunk)))
+        db.session.execute(db.delete(Review).where(Review.user_id.in_(chunk)))
+        db.session.execute(db.delete(Notification).where(Notification.user_id.in_(chunk)))
+        db.session.execute(db.delete(Subscription).where(Subscription.user_id.in_(chunk)))
+        db.session.execute(db.delete(MealRedemption).where(MealRedemption.user_id.in_(chunk)))
+        db.session.execute(db.delete(UserMonthlySummary).where(UserMonthlySummary.user_id.in_(chunk)))
+        db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.user_id.in_(chunk)))
+        db.session.execute(db.delete(User).where(User.id.in_(chunk)))
+    db.session.commit()
+
+def set_users_active(user_ids, active):
+    for chunk in _chunks(user_ids, LIFECYCLE_CHUNK_SIZE):
+        db.session.execute(db.update(User).where(User.id.in_(chunk)).values(is_active=active))
+    db.session.commit()
+
+def archive_orders(user_ids=None, before=None, chunk_size=LIFECYCLE_CHUNK_SIZE):
+    """Переносит заказы в архив пачками по короткой транзакции; возвращает их количество"""
+    user_chunks = [None] if user_ids is None else _chunks(user_ids, LIFECYCLE_CHUNK_SIZE)
+    order_columns = ['id', 'user_id', 'total', 'meal_type', 'status', 'created_at']
+    item_columns = ['id', 'order_id', 'menu_item_id', 'name', 'price']
+    moved = 0
+
+    for users_chunk in user_chunks:
+        while True:
+            query = db.select(Order.id)
+            if users_chunk is not None:
+                query = query.where(Order.user_id.in_(users_chunk))
+            if before is not None:
+                query = query.where(Order.created_at < before)
+            order_ids = db.session.execute(query.limit(chunk_size)).scalars().all()
+            if not order_ids:
+                break
+
+            db.session.execute(db.insert(ArchivedOrder).from_select(
+                order_columns,
+                db.select(*[getattr(Order, c) for c in order_columns]).where(Order.id.in_(order_ids))
+            ))
+            db.session.execute(db.insert(ArchivedOrderItem).from_select(
+                item_columns,
+                db.select(*[getattr(OrderItem, c) for c in item_columns]).where(OrderItem.order_id.in_(order_ids))
+            ))
+            db.session.execute(db.delete(OrderItem).where(OrderItem.order_id.in_(order_ids)))
+            db.session.execute(db.delete(Order).where(Order.id.in_(order_ids)))
+            db.session.commit()
+            moved += len(order_ids)
+
+    return moved
+
+def archive_class(student_class, delete=False, chunk_size=LIFECYCLE_CHUNK_SIZE):
+    """Выпуск класса: заказы в архив, ученики отключаются (или удаляются при delete=True)"""
+    user_ids = db.session.execute(
+        db.select(User.id).where(User.student_class == student_class, User.role == 'student')
+    ).scalars().all()
+    moved = archive_orders(user_ids, chunk_size=chunk_size)
+    if delete:
+        delete_users(user_ids)
+    else:
+        set_users_active(user_ids, False)
+    return {'users': len(user_ids), 'orders': moved}
+
+def compact_database():
+    """VACUUM возвращает место после архивации, ANALYZE обновляет статистику планировщика"""
+    db.session.remove()
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql('VACUUM')
+        conn.exec_driver_sql('ANALYZE')
+
+@app.route('/api/admin/class/<path:student_class>/archive', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_archive_class(student_class):
+    data = request.get_json(silent=True) or {}
+    result = archive_class(student_class, delete=bool(data.get('delete')))
+    return jsonify({
+        'success': True,
+        'message': f"Класс {student_class}: пользователей {result['users']}, заказов в архиве {result['orders']}",
+        **result,
+    })
+
+@app.route('/api/admin/users/deactivate', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_deactivate_users():
+    data = request.get_json(silent=True) or {}
+    user_ids = _int_ids(data.get('user_ids', []))
+    if user_ids is None:
+        return jsonify({'success': False, 'message': 'user_ids должен быть списком id'}), 400
+    user_ids = [user_id for user_id in user_ids if user_id != current_user.id]
+    set_users_active(user_ids, bool(data.get('active', False)))
+    return jsonify({'success': True, 'message': f'Обновлено пользователей: {len(user_ids)}'})
+
+@app.cli.command('archive-class')
+@click.argument('student_class')
+@click.option('--delete', is_flag=True, help='Удалить учеников вместо отключения')
+@click.option('--chunk-size', default=LIFECYCLE_CHUNK_SIZE, show_default=True)
+@click.option('--compact/--no-compact', default=True, help='Выполнить VACUUM после архивации')
+@click.option('--school', help='Школа (slug); по умолчанию — все школы')
+def archive_class_command(student_class, delete, chunk_size, compact, school):
+    """Перенести заказы класса в архив и отключить (удалить) учеников"""
+    def archive():
+        result = archive_class(student_class, delete=delete, chunk_size=chunk_size)
+        message = f"Учеников: {result['users']}, заказов перенесено в архив: {result['orders']}"
+        if compact:
+            compact_database()
+            message += ', база данных сжата'
+        return message
+
+    each_school(school, archive)
+
+@app.cli.command('archive-orders')
+@click.option('--older-than-days', default=365, show_default=True)
+@click.option('--chunk-size', default=LIFECYCLE_CHUNK_SIZE, show_default=True)
+@click.option('--school', help='Школа (slug); по умолчанию — все школы')
+def archive_orders_command(older_than_days, chunk_size, school):
+    """Перенести в архив заказы старше N дней"""
+    before = datetime.utcnow() - timedelta(days=older_than_days)
+    each_school(school, lambda: f'Заказов перенесено в архив: {archive_orders(before=before, chunk_size=chunk_size)}')
+
+@app.cli.command('rebuild-stats')
+@click.option('--school', help='Школа (slug); по умолчанию — все школы')
+def rebuild_stats_command(school):
+    """Пересчитать статистику блюд (рейтинги и количество заказов) и месячные итоги учеников"""
+    def rebuild():
+        rebuild_menu_item_stats()
+        rebuild_user_monthly_summary()
+        return f'Статистика пересчитана для {MenuItemStats.query.count()} блюд'
+
+    each_school(school, rebuild)
+
+@app.cli.command('compact-db')
+@click.option('--school', help='Школа (slug); по умолчанию — все школы')
+def compact_db_command(school):
+    """VACUUM + ANALYZE базы данных"""
+    def compact():
+        compact_database()
+        return 'База данных сжата'
+
+    each_school(school, compact)
+
 # ============ PROFILE UPDATE ============
 
 @app.route('/api/profile/update', methods=['POST'])
@@ -970,13 +2686,78 @@ def update_profile():
     db.session.commit()
     return jsonify({'success': True, 'message': 'Профиль обновлён'})
 
+# ============ OFFLINE CLIENT ============
+
+@app.route('/sw.js')
+def service_worker():
+    """sw.js из корня сайта, чтобы его область не ограничилась /static/"""
+    response = send_file(os.path.join(app.static_folder, 'js', 'sw.js'), mimetype='text/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def prune_idempotency_keys(before=None):
+    """Удаляет сохранённые ответы старше before (по умолчанию IDEMPOTENCY_RETENTION_DAYS)"""
+    before = before or datetime.utcnow() - timedelta(days=IDEMPOTENCY_RETENTION_DAYS)
+    result = db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.created_at < before))
+    db.session.commit()
+    return result.rowcount
+
+@app.cli.command('prune-idempotency-keys')
+@click.option('--older-than-days', type=int, default=IDEMPOTENCY_RETENTION_DAYS, show_default=True)
+@click.option('--school', help='Школа (slug); по умолчанию — все школы')
+def prune_idempotency_keys_command(older_than_days, school):
+    """Удалить старые ключи идемпотентности (для запуска по cron)"""
+    before = datetime.utcnow() - timedelta(days=older_than_days)
+    each_school(school, lambda: f'Удалено ключей: {prune_idempotency_keys(before)}')
+
 # ============ NOTIFICATIONS ============
 
+# Уведомления старше этого срока удаляет flask prune-notifications
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_PRUNE_CHUNK_SIZE = 5000
+
+def _unread(user_id):
+    # Условие записано так же, как в частичном индексе ix_notification_user_unread
+    return db.and_(Notification.user_id == user_id, Notification.is_read == db.false())
+
+def broadcast_notification(text, role=None, student_class=None, user_ids=None, active_only=True):
+    """Уведомление выбранным пользователям одним INSERT ... SELECT. Не коммитит."""
+    query = db.select(User.id, db.literal(text), db.false(), db.literal(datetime.utcnow()))
+    if role:
+        query = query.where(User.role == role)
+    if student_class:
+        query = query.where(User.student_class == student_class)
+    if user_ids is not None:
+        query = query.where(User.id.in_(user_ids))
+    if active_only:
+        query = query.where(User.is_active.is_(True))
+    result = db.session.execute(
+        db.insert(Notification).from_select(['user_id', 'text', 'is_read', 'created_at'], query)
+    )
+    if result.rowcount:
+        bump_versions('notifications')
+    return result.rowcount
+
+def prune_notifications(before=None, chunk_size=NOTIFICATION_PRUNE_CHUNK_SIZE):
+    """Удаляет уведомления старше before пачками; возвращает количество удалённых"""
+    before = before or datetime.utcnow() - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    deleted = 0
+    while True:
+        chunk = db.select(Notification.id).where(Notification.created_at < before).limit(chunk_size)
+        result = db.session.execute(db.delete(Notification).where(Notification.id.in_(chunk)))
+        if result.rowcount:
+            bump_versions('notifications')
+        db.session.commit()
+        deleted += result.rowcount
+        if result.rowcount < chunk_size:
+            return deleted
+
 @app.route('/api/notifications')
 @login_required
+@conditional('notifications', lambda user: f'notifications:{user.id}')
 def get_notifications():
     notifications = Notification.query.filter_by(user_id=current_user.id).order_by(Notification.created_at.desc()).limit(10).all()
-    unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
+    unread_count = Notification.query.filter(_unread(current_user.id)).count()
     
     return jsonify({
         'notifications': [{
@@ -991,18 +2772,307 @@ def get_notifications():
 @app.route('/api/notifications/read', methods=['POST'])
 @login_required
 def mark_notifications_read():
-    Notification.query.filter_by(user_id=current_user.id).update({'is_read': True})
+    # Трогаем только непрочитанные строки, а не всю историю пользователя
+    updated = Notification.query.filter(_unread(current_user.id)).update({'is_read': True}, synchronize_session=False)
+    if updated:
+        bump_versions(f'notifications:{current_user.id}')
     db.session.commit()
     return jsonify({'success': True})
 
+@app.route('/api/admin/notifications/broadcast', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_broadcast_notification():
+    """Рассылка всем, роли или классу: {"text": ..., "role": ..., "student_class": ...}"""
+    data = request.json or {}
+    text = (data.get('text') or '').strip()
+    if not text or len(text) > 500:
+        return jsonify({'success': False, 'message': 'Текст уведомления должен быть от 1 до 500 символов'}), 400
+    role = data.get('role')
+    sent = broadcast_notification(text, role=None if role in (None, '', 'all') else role,
+                                  student_class=data.get('student_class') or None)
+    db.session.commit()
+    return jsonify({'success': True, 'sent': sent, 'message': f'Отправлено уведомлений: {sent}'})
+
+@app.cli.command('prune-notifications')
+@click.option('--older-than-days', type=int, default=NOTIFICATION_RETENTION_DAYS, show_default=True)
+@click.option('--chunk-size', type=int, default=NOTIFICATION_PRUNE_CHUNK_SIZE, show_default=True)
+@click.option('--school', help='Школа (slug); по умолчанию — все школы')
+def prune_notifications_command(older_than_days, chunk_size, school):
+    """Удалить старые уведомления (для запуска по cron)"""
+    before = datetime.utcnow() - timedelta(days=older_than_days)
+    each_school(school, lambda: f'Удалено уведомлений: {prune_notifications(before=before, chunk_size=chunk_size)}')
+
+# ============ SEARCH ============
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+# Слов по обе стороны от совпадения во фрагменте отзыва
+SEARCH_SNIPPET_TOKENS = 12
+# bm25 считается только для стольких самых новых подходящих отзывов: иначе частое слово
+# за годы работы даёт десятки тысяч совпадений, и ранжирование всех стоит сотни мс
+SEARCH_RANK_WINDOW = 200
+
+def ensure_search_index():
+    """Создаёт индексы FTS5 с триггерами и перестраивает их из menu_item и review"""
+    with db.engine.begin() as conn:
+        for statement in search.ddl() + search.rebuild_statements():
+            conn.exec_driver_sql(statement)
+
+def search_menu(query, limit=SEARCH_PAGE_SIZE, available_only=True):
+    """Блюда по запросу MATCH (см. search.match_query), лучшие совпадения первыми"""
+    sql = db.text(f"""
+        SELECT m.id, m.name, m.meal_type, m.price, m.image,
+               highlight(menu_item_fts, 0, :mark_start, :mark_end) AS name_html
+        FROM menu_item_fts JOIN menu_item m ON m.id = menu_item_fts.rowid
+        WHERE menu_item_fts MATCH :query {'AND m.available = 1' if available_only else ''}
+        ORDER BY bm25(menu_item_fts) LIMIT :limit
+    """)
+    rows = db.session.execute(sql, {'query': query, 'limit': limit,
+                                    'mark_start': search.MARK_START, 'mark_end': search.MARK_END})
+    return [{'id': row.id, 'name': row.name, 'meal_type': row.meal_type, 'price': row.price,
+             'image': row.image, 'name_html': search.highlighted(row.name_html)} for row in rows]
+
+def search_reviews(query, limit=SEARCH_PAGE_SIZE):
+    """Отзывы по запросу MATCH со сниппетом; ранжируются SEARCH_RANK_WINDOW самых новых совпадений"""
+    sql = db.text("""
+        SELECT r.id, r.menu_item_id, m.name AS menu_item_name, r.rating, r.created_at,
+               u.name AS user_name, u.student_class,
+               snippet(review_fts, 0, :mark_start, :mark_end, '…', :tokens) AS snippet
+        FROM review_fts
+        JOIN review r ON r.id = review_fts.rowid
+        JOIN menu_item m ON m.id = r.menu_item_id
+        JOIN "user" u ON u.id = r.user_id
+        WHERE review_fts MATCH :query AND review_fts.rowid >= (
+            SELECT coalesce(min(rowid), 0) FROM (
+                SELECT rowid FROM review_fts WHERE review_fts MATCH :query ORDER BY rowid DESC LIMIT :window
+            )
+        )
+        ORDER BY bm25(review_fts) LIMIT :limit
+    """).columns(created_at=db.DateTime)
+    rows = db.session.execute(sql, {'query': query, 'limit': limit, 'window': max(limit, SEARCH_RANK_WINDOW),
+                                    'tokens': SEARCH_SNIPPET_TOKENS,
+                                    'mark_start': search.MARK_START, 'mark_end': search.MARK_END})
+    return [{'id': row.id, 'menu_item_id': row.menu_item_id, 'menu_item_name': row.menu_item_name,
+             'rating': row.rating, 'user_name': row.user_name, 'student_class': row.student_class,
+             'created_at': row.created_at.strftime('%d.%m.%Y') if row.created_at else None,
+             'snippet_html': search.highlighted(row.snippet)} for row in rows]
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """Поиск по блюдам и (поварам и администраторам) отзывам; scope=menu|reviews|all"""
+    text = (request.args.get('q') or '').strip()
+    scope = request.args.get('scope', 'all')
+    limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE)
+    result = {'q': text, 'menu': [], 'reviews': []}
+    query = search.match_query(text)
+    if not query:
+        return jsonify(result)
+
+    if scope in ('all', 'menu'):
+        result['menu'] = search_menu(query, limit, available_only=current_user.role == 'student')
+    if scope in ('all', 'reviews') and current_user.role in ('cook', 'admin'):
+        result['reviews'] = search_reviews(query, limit)
+    return jsonify(result)
+
+@app.route('/admin/search')
+@login_required
+@role_required('admin')
+def admin_search():
+    return render_template('admin/search.html', q=request.args.get('q', ''))
+
+@app.cli.command('rebuild-search')
+@click.option('--school', help='Школа (slug); по умолчанию — все школы')
+def rebuild_search_command(school):
+    """Пересоздать полнотекстовые индексы блюд и отзывов"""
+    def rebuild():
+        ensure_search_index()
+        return 'Поисковые индексы перестроены'
+
+    each_school(school, rebuild)
+
+# ============ SCHOOLS (TENANTS) ============
+
+def orders_file():
+    """orders.json школы текущего запроса (или общий при одной школе)"""
+    tenant = tenants.current()
+    return tenant.orders_file if tenant else app.config['ORDERS_FILE']
+
+def reports_dir():
+    tenant = tenants.current()
+    return tenant.reports_dir if tenant else app.config['REPORTS_DIR']
+
+def weeks_dir():
+    tenant = tenants.current()
+    return tenant.weeks_dir if tenant else app.config['WEEKS_DIR']
+
+def _open_school(tenant):
+    # Схема школы проверяется один раз при открытии её базы в процессе (PRAGMA user_version)
+    init_db(seed_test_data=False)
+    # События, не доставленные до перезапуска процесса
+    events.schedule(tenant.slug)
+
+def school_summary():
+    """Показатели одной школы для сводки по району"""
+    now = datetime.utcnow()
+    day_start = datetime.combine(now.date(), datetime.min.time())
+    orders_today, revenue_today = db.session.execute(
+        db.select(db.func.count(Order.id), db.func.coalesce(db.func.sum(Order.total), 0.0))
+        .where(Order.created_at >= day_start)
+    ).one()
+    orders_month, revenue_month = db.session.execute(
+        db.select(db.func.coalesce(db.func.sum(UserMonthlySummary.order_count), 0),
+                  db.func.coalesce(db.func.sum(UserMonthlySummary.total_spent), 0.0))
+        .where(UserMonthlySummary.month == month_key(now))
+    ).one()
+    students = db.session.execute(
+        db.select(db.func.count()).where(User.role == 'student', User.is_active.is_(True))
+    ).scalar()
+    low_stock = db.session.execute(
+        db.select(db.func.count()).where(Product.quantity < Product.min_quantity)
+    ).scalar()
+    pending_requests = db.session.execute(
+        db.select(db.func.count()).where(PurchaseRequest.status == 'pending')
+    ).scalar()
+    served = served_today()
+    return {
+        'students': students,
+        'orders_today': orders_today,
+        'revenue_today': round(revenue_today, 2),
+        'orders_month': orders_month,
+        'revenue_month': round(revenue_month, 2),
+        'served_breakfast': served['breakfast'],
+        'served_lunch': served['lunch'],
+        'low_stock': low_stock,
+        'pending_requests': pending_requests,
+    }
+
+def district_summary():
+    """Сводка по всем школам: запросы к базам школ выполняются параллельно"""
+    schools, errors = tenants.fan_out(lambda slug: school_summary())
+    totals = {}
+    for summary in schools.values():
+        for key, value in summary.items():
+            totals[key] = totals.get(key, 0) + value
+    if 'revenue_today' in totals:
+        totals['revenue_today'] = round(totals['revenue_today'], 2)
+        totals['revenue_month'] = round(totals['revenue_month'], 2)
+    return {'schools': schools, 'totals': totals, 'errors': {slug: str(exc) for slug, exc in errors.items()}}
+
+tenants.init_app(app, on_open=_open_school)
+
+@contextmanager
+def school_context(school):
+    """Школа --school и свой app context для CLI-команды; неизвестная школа — ошибка команды"""
+    if school and not tenants.enabled:
+        raise click.UsageError('--school задаётся только при нескольких школах (TENANT_MODE)')
+    if school and not tenants.exists(school):
+        raise click.ClickException(f'Школа {school} не найдена')
+    with tenants.activate(school), app.app_context():
+        yield
+
+def each_school(school, fn):
+    """
+    CLI: fn() в школе --school или, если она не задана, во всех школах параллельно
+    (при одной школе — просто fn()). fn возвращает строку для вывода.
+    """
+    if school or not tenants.enabled:
+        with school_context(school):
+            click.echo(fn())
+        return
+    results, errors = tenants.fan_out(lambda slug: fn())
+    for slug, message in results.items():
+        click.echo(f'{slug}: {message}')
+    for slug, error in errors.items():
+        click.echo(f'{slug}: ошибка: {error}', err=True)
+
+@app.route('/api/admin/district')
+@login_required
+@role_required('admin')
+def api_district_summary():
+    if not tenants.enabled or current_user.email not in app.config['DISTRICT_ADMINS']:
+        return jsonify({'success': False, 'message': 'Доступ запрещён'}), 403
+    return jsonify(district_summary())
+
+@app.cli.command('create-school')
+@click.argument('slug')
+@click.option('--admin-email', required=True)
+@click.option('--admin-password', required=True)
+@click.option('--admin-name', default='Администратор', show_default=True)
+def create_school_command(slug, admin_email, admin_password, admin_name):
+    """Создать школу: папка с базой и первый администратор"""
+    from instance.tenants import SLUG_RE
+
+    if not SLUG_RE.match(slug):
+        raise click.BadParameter('латиница в нижнем регистре, цифры, - и _', param_hint='SLUG')
+    if tenants.exists(slug):
+        raise click.ClickException(f'Школа {slug} уже существует')
+    tenants.root.joinpath(slug).mkdir(parents=True)
+    with tenants.activate(slug), app.app_context():
+        db.session.add(User(email=admin_email, password_hash=generate_password_hash(admin_password),
+                            name=admin_name, role='admin'))
+        db.session.commit()
+    click.echo(f'Школа {slug} создана: {tenants.root / slug}')
+
+@app.cli.command('district-report')
+def district_report_command():
+    """Сводка по всем школам района"""
+    report = district_summary()
+    for slug, summary in report['schools'].items():
+        click.echo(f"{slug}: " + ', '.join(f'{k}={v}' for k, v in summary.items()))
+    for slug, error in report['errors'].items():
+        click.echo(f'{slug}: ошибка: {error}', err=True)
+    click.echo('итого: ' + ', '.join(f'{k}={v}' for k, v in report['totals'].items()))
+
 # ============ INIT DATABASE ============
 
-def init_db():
+# Увеличивать при любом изменении моделей: init_db пропускает create_all
+# и миграции, если PRAGMA user_version базы уже равен этому значению
+SCHEMA_VERSION = 14
+
+def get_schema_version():
+    with db.engine.connect() as conn:
+        return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+def set_schema_version(version):
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql(f'PRAGMA user_version = {int(version)}')
+
+def migrate_schema():
+    """Досоздаёт новые колонки и индексы в существующих таблицах"""
+    from sqlalchemy import inspect
+    from sqlalchemy.schema import CreateColumn
+
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {ddl}')
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+def init_db(force=False, seed_test_data=True):
     with app.app_context():
+        if not force and get_schema_version() == SCHEMA_VERSION:
+            return False
+
         db.create_all()
+        migrate_schema()
+        ensure_search_index()
+        seed_allergens()
+        rebuild_allergen_masks()
+        rebuild_user_name_lower()
+        backfill_price_history()
+        rebuild_menu_item_stats()
+        rebuild_user_monthly_summary()
         
         # Check if data exists
-        if User.query.first() is None:
+        if seed_test_data and User.query.first() is None:
             # Create test users
             users = [
                 User(email='student@school.ru', password_hash=generate_password_hash('123456'), 
@@ -1047,6 +3117,57 @@ def init_db():
             db.session.commit()
             print("Database initialized with test data!")
 
+        # Данные могли измениться в обход ORM — все ETag становятся недействительными
+        bump_versions(*DATA_VERSION_KEYS)
+        db.session.commit()
+        set_schema_version(SCHEMA_VERSION)
+        return True
+
+def create_app(init_database=None):
+    """Хук старта для gunicorn 'app:create_app()' (не фабрика): проверка схемы, фоновые задачи, ассеты"""
+    if 'app' not in BOOT_TIMINGS:
+        BOOT_TIMINGS['app'] = time.perf_counter() - _boot_started - BOOT_TIMINGS['imports']
+
+    if init_database is None:
+        init_database = os.environ.get('SKIP_INIT_DB') != '1'
+    started = time.perf_counter()
+    # При нескольких школах схема каждой проверяется при первом обращении к ней
+    migrated = init_db() if init_database and not tenants.enabled else False
+    if not tenants.enabled:
+        events.schedule(None)
+    BOOT_TIMINGS['init_db'] = time.perf_counter() - started
+
+    if app.config['ASSETS_AUTO_BUILD'] and assets_outdated(app.static_folder):
+        started = time.perf_counter()
+        build_assets(app.static_folder)
+        assets.reload()
+        BOOT_TIMINGS['assets'] = time.perf_counter() - started
+
+    app.logger.info(
+        'Старт за %.1f мс: импорты %.1f мс, приложение %.1f мс, init_db %.1f мс%s',
+        sum(BOOT_TIMINGS.values()) * 1000,
+        BOOT_TIMINGS['imports'] * 1000,
+        BOOT_TIMINGS['app'] * 1000,
+        BOOT_TIMINGS['init_db'] * 1000,
+        ' (схема обновлена)' if migrated else '',
+    )
+    return app
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Собрать CSS/JS с хешами в именах и сжатыми версиями в static/dist"""
+    manifest = build_assets(app.static_folder)
+    for source, target in manifest.items():
+        click.echo(f'{source} -> {target}')
+
+@app.cli.command('init-db')
+@click.option('--force', is_flag=True, help='Выполнить create_all и миграции даже при совпадающей версии схемы')
+def init_db_command(force):
+    """Создать или обновить схему базы данных"""
+    if init_db(force=force):
+        click.echo(f'Схема обновлена до версии {SCHEMA_VERSION}')
+    else:
+        click.echo(f'Схема уже актуальна (версия {SCHEMA_VERSION})')
+
 if __name__ == '__main__':
-    init_db()
-    app.run(debug=True)
+    create_app().run(debug=True)
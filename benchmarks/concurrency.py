@@ -0,0 +1,156 @@
+"""
+Проверка одобрения заявок на закупку под конкурентной нагрузкой.
+
+Несколько процессов одновременно одобряют пересекающиеся наборы заявок
+на одни и те же продукты через approve_purchase_requests. После этого
+проверяется, что каждая заявка одобрена ровно один раз, остаток каждого
+продукта вырос ровно на сумму его заявок и журнал движений с ним сходится.
+При расхождении процесс завершается с кодом 1.
+
+    python -m benchmarks.concurrency
+    python -m benchmarks.concurrency --workers 8 --requests 2000
+    python -m benchmarks.concurrency --legacy   # старый read-modify-write для сравнения
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.run import _configure_env, _import_app
+
+INITIAL_QUANTITY = 100.0
+
+
+def _prepare(app_module, products, requests, rng):
+    db = app_module.db
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        app_module.set_schema_version(app_module.SCHEMA_VERSION)
+        db.session.execute(db.insert(app_module.Product), [
+            {'name': f'Продукт {i}', 'unit': 'кг', 'quantity': INITIAL_QUANTITY, 'min_quantity': 10}
+            for i in range(products)
+        ])
+        product_ids = db.session.execute(db.select(app_module.Product.id)).scalars().all()
+        db.session.execute(db.insert(app_module.PurchaseRequest), [
+            {'product_id': rng.choice(product_ids), 'quantity': rng.randint(1, 20), 'status': 'pending',
+             'created_by': 'Повар Бенчмарк'}
+            for _ in range(requests)
+        ])
+        db.session.commit()
+        return db.session.execute(db.select(app_module.PurchaseRequest.id)).scalars().all()
+
+
+def _legacy_approve(app_module, request_ids):
+    """Прежняя логика handle_request: остаток читается и увеличивается в Python"""
+    approved = []
+    for request_id in request_ids:
+        pr = app_module.db.session.get(app_module.PurchaseRequest, request_id)
+        if pr.status != 'pending':
+            continue
+        pr.status = 'approved'
+        pr.product.quantity += pr.quantity
+        app_module.db.session.commit()
+        approved.append(request_id)
+    return approved
+
+
+def _worker(args):
+    workdir, request_ids, seed, batch, legacy = args
+    _configure_env(workdir)
+    app_module = _import_app()
+    rng = random.Random(seed)
+    # Каждый процесс одобряет все заявки, но в своём порядке и своими пачками,
+    # так что одни и те же заявки и продукты постоянно попадают в параллельные транзакции
+    ids = list(request_ids)
+    rng.shuffle(ids)
+    approved = []
+    with app_module.app.app_context():
+        for start in range(0, len(ids), batch):
+            chunk = ids[start:start + batch]
+            if legacy:
+                approved += _legacy_approve(app_module, chunk)
+            else:
+                approved += app_module.approve_purchase_requests(chunk, f'worker-{seed}')
+    return approved
+
+
+def _verify(app_module, approved):
+    db = app_module.db
+    Product, PurchaseRequest, InventoryMovement = \
+        app_module.Product, app_module.PurchaseRequest, app_module.InventoryMovement
+    problems = []
+
+    duplicates = [rid for rid, n in Counter(approved).items() if n > 1]
+    if duplicates:
+        problems.append(f'заявки одобрены больше одного раза: {len(duplicates)}')
+
+    with app_module.app.app_context():
+        pending = db.session.execute(
+            db.select(db.func.count()).where(PurchaseRequest.status == 'pending')
+        ).scalar()
+        if pending:
+            problems.append(f'остались неодобренные заявки: {pending}')
+
+        expected = dict(db.session.execute(
+            db.select(PurchaseRequest.product_id, db.func.sum(PurchaseRequest.quantity))
+            .where(PurchaseRequest.status == 'approved').group_by(PurchaseRequest.product_id)
+        ).all())
+        ledger = dict(db.session.execute(
+            db.select(InventoryMovement.product_id, db.func.sum(InventoryMovement.delta))
+            .group_by(InventoryMovement.product_id)
+        ).all())
+        drift = 0.0
+        for product_id, quantity in db.session.execute(db.select(Product.id, Product.quantity)):
+            want = INITIAL_QUANTITY + (expected.get(product_id) or 0)
+            if abs(quantity - want) > 1e-6:
+                drift += quantity - want
+                problems.append(f'продукт {product_id}: остаток {quantity}, ожидалось {want}')
+            if ledger and abs((ledger.get(product_id) or 0) - (expected.get(product_id) or 0)) > 1e-6:
+                problems.append(f'продукт {product_id}: журнал движений не сходится с заявками')
+        if drift:
+            problems.append(f'суммарное расхождение остатков: {drift:+g}')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Проверка одобрения заявок на гонки')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--products', type=int, default=5, help='Мало продуктов — больше конфликтов')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=10, help='Заявок в одном вызове одобрения')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--legacy', action='store_true', help='Одобрять по одной заявке с += в Python')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='school-food-concurrency-') as workdir:
+        _configure_env(workdir)
+        app_module = _import_app()
+        request_ids = _prepare(app_module, args.products, args.requests, random.Random(args.seed))
+
+        # spawn: у каждого процесса своё соединение с SQLite
+        mp = multiprocessing.get_context('spawn')
+        jobs = [(workdir, request_ids, args.seed + i, args.batch, args.legacy) for i in range(args.workers)]
+        start = time.perf_counter()
+        with mp.Pool(args.workers) as pool:
+            approved = [rid for part in pool.map(_worker, jobs) for rid in part]
+        elapsed = time.perf_counter() - start
+
+        problems = _verify(app_module, approved)
+
+    mode = 'legacy' if args.legacy else 'bulk'
+    print(f'{mode}: {args.workers} процессов, заявок {args.requests}, одобрено {len(approved)} за {elapsed:.2f} с')
+    if problems:
+        print('Ошибки:')
+        for problem in problems[:20]:
+            print(f'  {problem}')
+        return 1
+    print('Потерянных приращений нет')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Микробенчмарк сериализации JSON: прежний вариант (stdlib json с indent=2),
+stdlib в компактном виде и текущий бэкенд instance.jsonlib (orjson, если установлен).
+Полезная нагрузка — типичные ответы API и файл предзаказов на неделю.
+
+    python -m benchmarks.json_bench
+    python -m benchmarks.json_bench --students 3000 --repeat 50
+"""
+import argparse
+import json
+import random
+import timeit
+
+from benchmarks.seed import DAYS
+from instance import jsonlib
+
+
+def _notifications(rng):
+    return {
+        'notifications': [{'id': i, 'text': 'Абонемент заканчивается через 2 дня', 'is_read': rng.random() < 0.5,
+                           'date': '19.10.2026 12:30'} for i in range(10)],
+        'unread_count': 4,
+    }
+
+
+def _users_page(rng):
+    return {
+        'users': [{'id': i, 'name': f'Ученик {i:05d}', 'email': f'student{i}@school.ru', 'role': 'student',
+                   'student_class': f'{5 + i % 7}А', 'balance': rng.randint(0, 5000) / 10, 'is_active': True,
+                   'created_at': '01.09.2026'} for i in range(50)],
+        'next_cursor': {'after_id': 50, 'after_name': 'Ученик 00050'},
+        'has_more': True,
+    }
+
+
+def _orders_page(rng):
+    return {
+        'orders': [{'id': i, 'total': 260.0, 'meal_type': 'lunch', 'status': 'received',
+                    'created_at': '18.10.2026 12:40',
+                    'items': [{'name': 'Борщ украинский', 'price': 120.0},
+                              {'name': 'Котлета куриная с пюре', 'price': 150.0}]} for i in range(20)],
+        'next_cursor': {'before_created_at': '2026-09-20T12:40:00', 'before_id': 1234},
+        'has_more': True,
+    }
+
+
+def _orders_file(rng, students):
+    return {day: {f'user{user_id}': {str(rng.randint(1, 25)): rng.randint(1, 2) for _ in range(rng.randint(1, 3))}
+                  for user_id in range(students) if rng.random() < 0.6}
+            for day in DAYS}
+
+
+def _bench(fn, repeat):
+    number = max(1, int(0.2 / max(timeit.timeit(fn, number=1), 1e-7)))
+    best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+    return best * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Микробенчмарк JSON-сериализации')
+    parser.add_argument('--students', type=int, default=1000, help='Размер файла предзаказов')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    payloads = {
+        '/api/notifications': _notifications(rng),
+        '/api/admin/users': _users_page(rng),
+        '/api/student/orders': _orders_page(rng),
+        'orders.json': _orders_file(rng, args.students),
+    }
+
+    print(f'Бэкенд: {jsonlib.BACKEND}')
+    header = f"{'данные':<22}{'размер, КБ':>12}{'json indent=2':>15}{'json compact':>14}{'jsonlib':>10}{'ускорение':>11}"
+    print('\nСериализация, мкс')
+    print(header)
+    for name, obj in payloads.items():
+        old = _bench(lambda: json.dumps(obj, ensure_ascii=False, indent=2), args.repeat)
+        compact = _bench(lambda: json.dumps(obj, ensure_ascii=False, separators=(',', ':')), args.repeat)
+        new = _bench(lambda: jsonlib.dumpb(obj), args.repeat)
+        size = len(jsonlib.dumpb(obj)) / 1024
+        print(f'{name:<22}{size:>12.1f}{old:>15.1f}{compact:>14.1f}{new:>10.1f}{old / new:>10.1f}x')
+
+    print('\nРазбор, мкс')
+    print(f"{'данные':<22}{'json':>12}{'jsonlib':>10}{'ускорение':>11}")
+    for name, obj in payloads.items():
+        pretty = json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+        compact = jsonlib.dumpb(obj)
+        old = _bench(lambda: json.loads(pretty), args.repeat)
+        new = _bench(lambda: jsonlib.loads(compact), args.repeat)
+        print(f'{name:<22}{old:>12.1f}{new:>10.1f}{old / new:>10.1f}x')
+
+
+if __name__ == '__main__':
+    main()
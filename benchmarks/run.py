@@ -0,0 +1,366 @@
+"""
+Нагрузочный тест и бенчмарк основных сценариев столовой.
+
+Поднимает приложение на временной SQLite-базе с синтетической школой
+(см. benchmarks/seed.py), гоняет сценарии через Flask test client —
+последовательно и параллельно в нескольких процессах — и печатает
+p50/p95/p99 и пропускную способность. Результат сравнивается с
+сохранённым baseline: если p95 какого-либо запроса вырос больше
+допустимого, процесс завершается с кодом 1.
+
+Baseline зависит от машины: вместе с ним сохраняется окружение (CPU, Python,
+SQLite, коммит), и при сравнении на другом окружении печатается предупреждение.
+Коммит, который намеренно меняет производительность, перезаписывает baseline.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --students 3000 --days 90 --workers 4
+    python -m benchmarks.run --update-baseline
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BASE_DIR / 'baseline.json'
+
+# Сколько виртуальных пользователей каждого типа логинится в сценарии
+VIRTUAL_STUDENTS = 20
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, label, fn, *args, **kwargs):
+        start = time.perf_counter()
+        response = fn(*args, **kwargs)
+        self.latencies[label].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        return response
+
+    def merge(self, other):
+        for label, values in other['latencies'].items():
+            self.latencies[label].extend(values)
+        for label, count in other['errors'].items():
+            self.errors[label] += count
+
+    def dump(self):
+        return {'latencies': dict(self.latencies), 'errors': dict(self.errors)}
+
+
+def _login(app_module, email):
+    from benchmarks.seed import BENCH_PASSWORD
+
+    client = app_module.app.test_client()
+    response = client.post('/login', data={'email': email, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'Не удалось войти как {email}')
+    return client
+
+
+def _student_clients(app_module, student_ids):
+    with app_module.app.app_context():
+        emails = dict(app_module.db.session.execute(
+            app_module.db.select(app_module.User.id, app_module.User.email)
+            .where(app_module.User.id.in_(student_ids))
+        ).all())
+    return [(user_id, _login(app_module, emails[user_id])) for user_id in student_ids]
+
+
+# ============ СЦЕНАРИИ ============
+
+def scenario_lunch_rush(app_module, ctx, rng, iterations, rec):
+    """Большая перемена: ученик открывает меню и оплачивает корзину"""
+    students = _student_clients(app_module, rng.sample(ctx['students'], VIRTUAL_STUDENTS))
+    lunch = [m for m in ctx['menu'] if m['meal_type'] == 'lunch']
+    for i in range(iterations):
+        _, client = students[i % len(students)]
+        rec.call('GET /student/menu', client.get, '/student/menu')
+        items = [{'id': m['id'], 'name': m['name'], 'price': m['price'], 'type': 'lunch'}
+                 for m in rng.sample(lunch, rng.randint(1, 3))]
+        rec.call('POST /api/cart/checkout', client.post, '/api/cart/checkout', json={'items': items})
+
+
+def scenario_preorder(app_module, ctx, rng, iterations, rec):
+    """Предзаказ на неделю"""
+    from benchmarks.seed import DAYS
+
+    students = _student_clients(app_module, rng.sample(ctx['students'], VIRTUAL_STUDENTS))
+    lunch = [m for m in ctx['menu'] if m['meal_type'] == 'lunch']
+    for i in range(iterations):
+        user_id, client = students[i % len(students)]
+        payload = {day: {f'user{user_id}': {str(m['id']): 1 for m in rng.sample(lunch, 2)}} for day in DAYS}
+        rec.call('GET /student/create_order', client.get, '/student/create_order')
+        rec.call('POST /api/create_order', client.post, '/api/create_order', json=payload)
+
+
+def scenario_cook_serve(app_module, ctx, rng, iterations, rec):
+    """Повар на раздаче: экран выдачи, подтверждение заказов и счётчик порций"""
+    students = _student_clients(app_module, rng.sample(ctx['students'], VIRTUAL_STUDENTS))
+    with app_module.app.app_context():
+        cook_email = app_module.db.session.get(app_module.User, ctx['cooks'][0]).email
+    cook = _login(app_module, cook_email)
+    lunch = [m for m in ctx['menu'] if m['meal_type'] == 'lunch']
+    for i in range(iterations):
+        _, student = students[i % len(students)]
+        item = rng.choice(lunch)
+        student.post('/api/cart/checkout', json={'items': [
+            {'id': item['id'], 'name': item['name'], 'price': item['price'], 'type': 'lunch'}
+        ]})
+        with app_module.app.app_context():
+            order_id = app_module.db.session.execute(
+                app_module.db.select(app_module.db.func.max(app_module.Order.id))
+            ).scalar()
+        if i % 5 == 0:
+            rec.call('GET /cook/serve', cook.get, '/cook/serve')
+        rec.call('POST /api/order/<id>/confirm', cook.post, f'/api/order/{order_id}/confirm')
+        rec.call('POST /api/serve/<meal_type>', cook.post, '/api/serve/lunch', json={'count': 1})
+
+
+def scenario_redeem(app_module, ctx, rng, iterations, rec):
+    """Очередь на раздаче: повар списывает приёмы пищи по кодам, часть сканов — офлайн-пачкой"""
+    with app_module.app.app_context():
+        cook_email = app_module.db.session.get(app_module.User, ctx['cooks'][0]).email
+        tokens = app_module.db.session.execute(
+            app_module.db.select(app_module.User.redeem_token)
+            .where(app_module.User.id.in_(rng.sample(ctx['students'], min(iterations, len(ctx['students'])))))
+        ).scalars().all()
+    cook = _login(app_module, cook_email)
+    for i in range(iterations):
+        token = tokens[i % len(tokens)]
+        meal_type = 'lunch' if i < len(tokens) else 'breakfast'
+        rec.call('POST /api/redeem', cook.post, '/api/redeem', json={'token': token, 'meal_type': meal_type})
+    scans = [{'id': i, 'token': token, 'meal_type': 'lunch', 'scanned_at': f'2000-01-0{1 + i % 5}T12:00:00'}
+             for i, token in enumerate(tokens[:50])]
+    rec.call('POST /api/redeem/batch', cook.post, '/api/redeem/batch', json={'scans': scans})
+
+
+def scenario_reports(app_module, ctx, rng, iterations, rec):
+    """Администратор: дашборд, отчёты и выгрузки DOCX"""
+    with app_module.app.app_context():
+        admin_email = app_module.db.session.get(app_module.User, ctx['admin']).email
+    admin = _login(app_module, admin_email)
+    for i in range(max(1, iterations // 50)):
+        rec.call('GET /admin/dashboard', admin.get, '/admin/dashboard')
+        rec.call('GET /admin/reports', admin.get, '/admin/reports')
+        rec.call('GET /admin/reports/export/weekly', admin.get, '/admin/reports/export/weekly')
+        rec.call('GET /admin/reports/export/daily', admin.get, '/admin/reports/export/daily')
+
+
+SCENARIOS = {
+    'lunch_rush': scenario_lunch_rush,
+    'preorder': scenario_preorder,
+    'cook_serve': scenario_cook_serve,
+    'redeem': scenario_redeem,
+    'reports': scenario_reports,
+}
+
+# Сценарии, которые имеет смысл гонять параллельно в нескольких процессах
+PARALLEL_SCENARIOS = ('lunch_rush', 'preorder')
+
+
+# ============ ЗАПУСК ============
+
+def _configure_env(workdir):
+    os.environ['DATABASE_URL'] = f"sqlite:///{Path(workdir) / 'bench.db'}"
+    os.environ['ORDERS_FILE'] = str(Path(workdir) / 'orders.json')
+    os.environ['REPORTS_DIR'] = str(Path(workdir) / 'reports')
+    # Виртуальные ученики логинятся с одного адреса; лимиты входа здесь не измеряются
+    os.environ['RATE_LIMIT_ENABLED'] = '0'
+
+
+def _import_app():
+    sys.path.insert(0, str(BASE_DIR.parent))
+    import app as app_module
+    app_module.app.config['TESTING'] = True
+    return app_module
+
+
+def _worker(args):
+    workdir, scenario, ctx, seed, iterations = args
+    _configure_env(workdir)
+    app_module = _import_app()
+    rec = Recorder()
+    SCENARIOS[scenario](app_module, ctx, random.Random(seed), iterations, rec)
+    return rec.dump()
+
+
+def summarize(recorder, wall_seconds=None):
+    rows = {}
+    for label, values in sorted(recorder.latencies.items()):
+        rows[label] = {
+            'count': len(values),
+            'errors': recorder.errors.get(label, 0),
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p95_ms': round(percentile(values, 95) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+        }
+        if wall_seconds:
+            rows[label]['rps'] = round(len(values) / wall_seconds, 1)
+    return rows
+
+
+def print_table(title, rows):
+    print(f'\n== {title} ==')
+    print(f"{'запрос':<40} {'n':>6} {'ошибки':>7} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'rps':>8}")
+    for label, r in rows.items():
+        print(f"{label:<40} {r['count']:>6} {r['errors']:>7} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r.get('rps', 0):>8.1f}")
+
+
+def environment():
+    """Где сняты результаты: сравнивать p95 имеет смысл только на том же окружении"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR.parent,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor() or None,
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'commit': commit,
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance, slack_ms):
+    """Возвращает список регрессий: p95 вырос больше чем в tolerance раз (плюс абсолютный запас)"""
+    regressions = []
+    for section, rows in baseline.get('results', {}).items():
+        for label, base in rows.items():
+            current = results.get(section, {}).get(label)
+            if current is None:
+                continue
+            limit = base['p95_ms'] * tolerance + slack_ms
+            if current['p95_ms'] > limit:
+                regressions.append(f"{section} / {label}: p95 {current['p95_ms']:.2f} мс > {limit:.2f} мс "
+                                   f"(baseline {base['p95_ms']:.2f} мс)")
+            if current['errors'] > base.get('errors', 0):
+                regressions.append(f"{section} / {label}: ошибок {current['errors']} (baseline {base.get('errors', 0)})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк сценариев школьной столовой')
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=60, help='Сколько дней истории заказов сгенерировать')
+    parser.add_argument('--iterations', type=int, default=200, help='Итераций на сценарий')
+    parser.add_argument('--workers', type=int, default=4, help='Процессов для параллельной фазы (1 — не запускать)')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='Запустить только эти сценарии')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='Допустимый рост p95 (во сколько раз)')
+    parser.add_argument('--slack-ms', type=float, default=5.0, help='Абсолютный запас к порогу p95, мс')
+    parser.add_argument('--output', type=Path, help='Сохранить результаты в JSON')
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenario or list(SCENARIOS)
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='school-food-bench-') as workdir:
+        _configure_env(workdir)
+        app_module = _import_app()
+
+        from benchmarks.seed import seed as seed_school
+
+        start = time.perf_counter()
+        ctx = seed_school(app_module, students=args.students, days=args.days,
+                          orders_file=os.environ['ORDERS_FILE'], rng=random.Random(args.seed))
+        print(f"Сгенерировано: учеников {len(ctx['students'])}, заказов {ctx['orders']}, "
+              f"позиций меню {len(ctx['menu'])} за {time.perf_counter() - start:.1f} с")
+
+        for name in scenarios:
+            rec = Recorder()
+            start = time.perf_counter()
+            SCENARIOS[name](app_module, ctx, random.Random(args.seed), args.iterations, rec)
+            rows = summarize(rec, time.perf_counter() - start)
+            results[name] = rows
+            print_table(f'{name} (1 процесс)', rows)
+
+        if args.workers > 1:
+            # spawn, а не fork: у каждого процесса должен быть свой пул соединений SQLite
+            mp = multiprocessing.get_context('spawn')
+            for name in [s for s in scenarios if s in PARALLEL_SCENARIOS]:
+                jobs = [(workdir, name, ctx, args.seed + i, args.iterations) for i in range(args.workers)]
+                rec = Recorder()
+                with mp.Pool(args.workers) as pool:
+                    start = time.perf_counter()
+                    for dump in pool.map(_worker, jobs):
+                        rec.merge(dump)
+                    wall = time.perf_counter() - start
+                rows = summarize(rec, wall)
+                results[f'{name}_parallel'] = rows
+                print_table(f'{name} ({args.workers} процессов)', rows)
+
+        # Буфер счётчиков выдачи и outbox сбрасываем, пока временная база ещё существует
+        app_module.served_counters.flush()
+        app_module.events.dispatch_pending()
+
+    report = {
+        'params': {'students': args.students, 'days': args.days, 'iterations': args.iterations,
+                   'workers': args.workers, 'seed': args.seed},
+        'environment': environment(),
+        'results': results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f'\nBaseline обновлён: {args.baseline}')
+        return 0
+
+    if not args.baseline.exists():
+        print('\nBaseline не найден, сравнение пропущено (запустите с --update-baseline)')
+        return 0
+
+    baseline = json.loads(args.baseline.read_text(encoding='utf-8'))
+    if baseline.get('params') != report['params']:
+        print('\nВнимание: параметры запуска отличаются от baseline, сравнение может быть неточным')
+    base_env = baseline.get('environment')
+    if base_env is None:
+        print('\nВнимание: в baseline не записано окружение, пороги могут не подходить этой машине')
+    else:
+        differs = [key for key in ('platform', 'machine', 'processor', 'cpu_count', 'python', 'sqlite')
+                   if base_env.get(key) != report['environment'][key]]
+        if differs:
+            print(f"\nВнимание: baseline снят на другом окружении (коммит {base_env.get('commit')}), отличаются: "
+                  + ', '.join(f'{key} {base_env.get(key)} -> {report["environment"][key]}' for key in differs))
+    regressions = compare_with_baseline(results, baseline, args.tolerance, args.slack_ms)
+    if regressions:
+        print('\nРегрессии относительно baseline:')
+        for line in regressions:
+            print(f'  - {line}')
+        return 1
+    print('\nРегрессий относительно baseline нет')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Микробенчмарк поиска по отзывам: полнотекстовый индекс FTS5 (instance/search.py,
+ранжирование bm25 и фрагмент со snippet) против прежнего подхода LIKE '%слово%'
+с полным просмотром таблицы. FTS5 измеряется как в search_reviews (bm25 по окну
+самых новых совпадений) и с ранжированием всех совпадений для сравнения.
+Отзывы генерируются в отдельной базе SQLite, частоты слов — по закону Ципфа.
+
+    python -m benchmarks.search_bench
+    python -m benchmarks.search_bench --reviews 500000 --repeat 20
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from instance import search
+
+# По убыванию частоты
+WORDS = (
+    'очень', 'было', 'сегодня', 'вкусно', 'спасибо', 'суп', 'порция', 'мало', 'котлета', 'каша',
+    'борщ', 'много', 'холодный', 'компот', 'пюре', 'вчера', 'повар', 'салат', 'хлеб', 'горячий',
+    'макароны', 'омлет', 'очередь', 'добавки', 'невкусно', 'рыба', 'сметана', 'чай', 'сыр', 'сладкий',
+    'свежий', 'остывший', 'пересолено', 'недосолено', 'жёсткое', 'мягкое', 'большая', 'маленькая',
+    'понравилось', 'не', 'понравился', 'хотелось', 'бы', 'больше', 'меньше', 'соли', 'сахара',
+    'опять', 'снова', 'всегда', 'иногда', 'вкусный', 'вкусная', 'горячая', 'холодная', 'тёплый',
+    'блинчики', 'творог', 'йогурт', 'мюсли', 'запеканка', 'сырники', 'гуляш', 'плов', 'рис',
+    'гречка', 'курица', 'тефтели', 'пельмени', 'щи', 'солянка', 'рассольник', 'кисель', 'морс',
+)
+RARE_WORDS = ('волос', 'пригорело', 'аллергия', 'отравился', 'таракан')
+
+# (название, ввод пользователя, шаблон LIKE)
+QUERIES = (
+    ('частое слово', 'борщ', '%борщ%'),
+    ('редкое слово', 'пригорело', '%пригорело%'),
+    ('префикс', 'пересол', '%пересол%'),
+    ('два слова', 'холодный суп', '%холодный%суп%'),
+)
+LIMIT = 20
+
+
+WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+
+
+def _review_text(rng):
+    words = rng.choices(WORDS, WEIGHTS, k=rng.randint(3, 25))
+    if rng.random() < 0.002:
+        words.insert(rng.randrange(len(words)), rng.choice(RARE_WORDS))
+    return ' '.join(words).capitalize()
+
+
+def _prepare(path, reviews, rng):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE menu_item (id INTEGER PRIMARY KEY, name TEXT NOT NULL)')
+    conn.execute('CREATE TABLE review (id INTEGER PRIMARY KEY, menu_item_id INTEGER, rating INTEGER, text TEXT)')
+    for statement in search.ddl():
+        conn.execute(statement)
+    started = time.perf_counter()
+    conn.executemany('INSERT INTO review (menu_item_id, rating, text) VALUES (?, ?, ?)',
+                     ((rng.randint(1, 25), rng.randint(1, 5), _review_text(rng)) for _ in range(reviews)))
+    conn.commit()
+    return conn, time.perf_counter() - started
+
+
+def _like(conn, pattern):
+    return conn.execute(
+        'SELECT id, text FROM review WHERE text LIKE ? ORDER BY id DESC LIMIT ?', (pattern, LIMIT)
+    ).fetchall()
+
+
+def _fts(conn, text, window=None):
+    # Как search_reviews в app.py: bm25 только по window самых новых совпадений
+    window_filter = """
+        AND review_fts.rowid >= (SELECT coalesce(min(rowid), 0) FROM (
+            SELECT rowid FROM review_fts WHERE review_fts MATCH :query ORDER BY rowid DESC LIMIT :window))
+    """ if window else ''
+    return conn.execute(
+        f"""
+        SELECT r.id, snippet(review_fts, 0, :start, :end, '…', 12)
+        FROM review_fts JOIN review r ON r.id = review_fts.rowid
+        WHERE review_fts MATCH :query {window_filter}
+        ORDER BY bm25(review_fts) LIMIT :limit
+        """,
+        {'start': search.MARK_START, 'end': search.MARK_END, 'query': search.match_query(text),
+         'window': window, 'limit': LIMIT},
+    ).fetchall()
+
+
+def _median_ms(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Поиск по отзывам: FTS5 против LIKE')
+    parser.add_argument('--reviews', type=int, default=200_000, help='Отзывов в базе (годы работы школы)')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--window', type=int, default=200, help='SEARCH_RANK_WINDOW')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory(prefix='search_bench_') as workdir:
+        conn, insert_seconds = _prepare(str(Path(workdir) / 'search.db'), args.reviews, rng)
+        print(f'Отзывов: {args.reviews}, вставка вместе с индексом: {insert_seconds:.1f} с')
+        print(f"\n{'запрос':<16}{'найдено':>10}{'LIKE, мс':>12}{'FTS5 все, мс':>15}"
+              f"{'FTS5 окно, мс':>16}{'ускорение':>12}")
+        for name, text, pattern in QUERIES:
+            found = conn.execute(
+                'SELECT count(*) FROM review_fts WHERE review_fts MATCH ?', (search.match_query(text),)
+            ).fetchone()[0]
+            like_ms = _median_ms(lambda: _like(conn, pattern), args.repeat)
+            full_ms = _median_ms(lambda: _fts(conn, text), args.repeat)
+            fts_ms = _median_ms(lambda: _fts(conn, text, args.window), args.repeat)
+            print(f'{name:<16}{found:>10}{like_ms:>12.2f}{full_ms:>15.2f}{fts_ms:>16.2f}{like_ms / fts_ms:>11.1f}x')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""
+Генерация синтетической школы для бенчмарков: ученики по классам,
+полное меню, история заказов за несколько месяцев и предзаказы на неделю.
+Всё пишется во временную SQLite-базу и отдельный orders.json.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+BENCH_PASSWORD = 'bench-password'
+# Быстрый хеш, чтобы логин сотен виртуальных пользователей не упирался в scrypt
+BENCH_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday']
+CLASS_LETTERS = 'АБВГ'
+
+BREAKFAST = [
+    ('Каша овсяная с фруктами', 80, 'глютен,молоко'),
+    ('Каша рисовая молочная', 70, 'молоко'),
+    ('Омлет с сыром', 95, 'яйца,молоко'),
+    ('Блинчики с творогом', 110, 'глютен,молоко,яйца'),
+    ('Сырники со сметаной', 105, 'глютен,молоко,яйца'),
+    ('Йогурт с мюсли', 75, 'молоко,глютен'),
+    ('Бутерброд с сыром', 60, 'глютен,молоко'),
+    ('Запеканка творожная', 90, 'молоко,яйца'),
+    ('Какао', 40, 'молоко'),
+    ('Чай с лимоном', 20, ''),
+]
+LUNCH = [
+    ('Борщ украинский', 120, ''),
+    ('Суп куриный с лапшой', 110, 'глютен'),
+    ('Щи из свежей капусты', 100, ''),
+    ('Котлета куриная с пюре', 150, 'глютен,яйца'),
+    ('Рыба запеченная с овощами', 180, 'рыба'),
+    ('Макароны с сыром', 100, 'глютен,молоко'),
+    ('Плов с курицей', 160, ''),
+    ('Гуляш с гречкой', 170, 'глютен'),
+    ('Тефтели с рисом', 155, 'глютен,яйца'),
+    ('Салат овощной', 70, ''),
+    ('Салат винегрет', 65, ''),
+    ('Компот из сухофруктов', 30, ''),
+    ('Морс клюквенный', 35, ''),
+    ('Хлеб ржаной', 10, 'глютен'),
+    ('Пирожок с яблоком', 45, 'глютен,яйца'),
+]
+
+
+def seed(app_module, students=1000, days=60, orders_file=None, rng=None):
+    """
+    Наполняет базу app_module.db синтетическими данными.
+    Возвращает словарь с id учеников, поваров, админа и позиций меню.
+    """
+    rng = rng or random.Random(42)
+    db = app_module.db
+    User, MenuItem, Product = app_module.User, app_module.MenuItem, app_module.Product
+    Order, OrderItem = app_module.Order, app_module.OrderItem
+
+    with app_module.app.app_context():
+        db.drop_all()
+        db.create_all()
+        app_module.migrate_schema()
+        app_module.ensure_search_index()
+        app_module.set_schema_version(app_module.SCHEMA_VERSION)
+
+        password_hash = generate_password_hash(BENCH_PASSWORD, method=BENCH_HASH_METHOD)
+        now = datetime.utcnow()
+
+        staff = [
+            {'email': 'admin@bench.ru', 'name': 'Админ Бенчмарк', 'role': 'admin'},
+            {'email': 'cook1@bench.ru', 'name': 'Повар Первый', 'role': 'cook'},
+            {'email': 'cook2@bench.ru', 'name': 'Повар Второй', 'role': 'cook'},
+        ]
+        users = [{
+            **u, 'name_lower': u['name'].lower(), 'password_hash': password_hash, 'student_class': '', 'balance': 0,
+            'allergies': '', 'created_at': now,
+        } for u in staff]
+        allergens = ['глютен', 'молоко', 'яйца', 'орехи', 'рыба']
+        for i in range(students):
+            grade = 5 + i % 7
+            letter = CLASS_LETTERS[(i // 7) % len(CLASS_LETTERS)]
+            users.append({
+                'email': f'student{i}@bench.ru',
+                'name': f'Ученик {i:05d}',
+                'name_lower': f'ученик {i:05d}',
+                'role': 'student',
+                'student_class': f'{grade}{letter}',
+                'balance': 1_000_000,
+                'allergies': ','.join(rng.sample(allergens, rng.choice([0, 0, 0, 1, 2]))),
+                'password_hash': password_hash,
+                'created_at': now,
+                'redeem_token': f'B{i:09X}',
+            })
+        db.session.execute(db.insert(User), users)
+
+        menu = [{'name': n, 'meal_type': 'breakfast', 'price': p, 'calories': 250, 'allergens': a,
+                 'image': '🍽️', 'available': True} for n, p, a in BREAKFAST]
+        menu += [{'name': n, 'meal_type': 'lunch', 'price': p, 'calories': 400, 'allergens': a,
+                  'image': '🍽️', 'available': True} for n, p, a in LUNCH]
+        db.session.execute(db.insert(MenuItem), menu)
+
+        db.session.execute(db.insert(Product), [
+            {'name': f'Продукт {i}', 'unit': 'кг', 'quantity': 100, 'min_quantity': 20} for i in range(40)
+        ])
+        db.session.commit()
+        # Bulk insert идёт в обход ORM-событий, поэтому маски аллергенов считаем отдельно
+        app_module.seed_allergens()
+        app_module.rebuild_allergen_masks()
+        app_module.backfill_price_history()
+
+        student_ids = db.session.execute(
+            db.select(User.id).where(User.role == 'student').order_by(User.id)
+        ).scalars().all()
+        # У каждого ученика месячный абонемент — для сценария выдачи по коду
+        db.session.execute(db.insert(app_module.Subscription), [
+            {'user_id': user_id, 'sub_type': 'month', 'remaining_meals': 40, 'created_at': now}
+            for user_id in student_ids
+        ])
+        db.session.commit()
+        cook_ids = db.session.execute(db.select(User.id).where(User.role == 'cook')).scalars().all()
+        admin_id = db.session.execute(db.select(User.id).where(User.role == 'admin')).scalar()
+        menu_rows = db.session.execute(db.select(MenuItem.id, MenuItem.name, MenuItem.price, MenuItem.meal_type)).all()
+        by_type = {'breakfast': [], 'lunch': []}
+        for row in menu_rows:
+            by_type[row.meal_type].append(row)
+
+        # История заказов: примерно один заказ на ученика в учебный день
+        next_order_id = 1
+        orders, items = [], []
+        for day_offset in range(days, 0, -1):
+            day = now - timedelta(days=day_offset)
+            if day.weekday() == 6:
+                continue
+            for user_id in student_ids:
+                if rng.random() > 0.8:
+                    continue
+                meal_type = 'breakfast' if rng.random() < 0.35 else 'lunch'
+                chosen = rng.sample(by_type[meal_type], rng.randint(1, 3))
+                orders.append({
+                    'id': next_order_id, 'user_id': user_id, 'total': sum(c.price for c in chosen),
+                    'meal_type': meal_type, 'status': 'received',
+                    'created_at': day.replace(hour=rng.randint(8, 14), minute=rng.randint(0, 59)),
+                })
+                items += [{'order_id': next_order_id, 'menu_item_id': c.id, 'name': c.name, 'price': c.price}
+                          for c in chosen]
+                next_order_id += 1
+            if len(orders) > 20_000:
+                db.session.execute(db.insert(Order), orders)
+                db.session.execute(db.insert(OrderItem), items)
+                orders, items = [], []
+        if orders:
+            db.session.execute(db.insert(Order), orders)
+            db.session.execute(db.insert(OrderItem), items)
+        db.session.commit()
+        app_module.rebuild_menu_item_stats()
+        app_module.rebuild_user_monthly_summary()
+        app_module.bump_versions(*app_module.DATA_VERSION_KEYS)
+        db.session.commit()
+
+    if orders_file is not None:
+        week = {day: {} for day in DAYS}
+        for user_id in student_ids:
+            for day in DAYS:
+                if rng.random() < 0.6:
+                    chosen = rng.sample(by_type['lunch'], rng.randint(1, 3))
+                    week[day][f'user{user_id}'] = {str(c.id): rng.randint(1, 2) for c in chosen}
+        with open(orders_file, 'w', encoding='utf-8') as f:
+            json.dump(week, f, ensure_ascii=False)
+
+    return {
+        'students': student_ids,
+        'cooks': cook_ids,
+        'admin': admin_id,
+        'menu': [dict(row._mapping) for row in menu_rows],
+        'orders': next_order_id - 1,
+    }
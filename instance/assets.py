@@ -0,0 +1,127 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from pathlib import Path
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli в зависимостях проекта; без него собираются и отдаются только .gz
+    brotli = None
+
+# Файлы, которые подключаются из шаблонов и собираются в static/dist
+ASSET_FILES = ('css/style.css', 'css/auth.css', 'css/mobile.css', 'js/main.js')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# Собранные файлы неизменяемы (имя зависит от содержимого), кешируем на год
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def _hashed_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    return f'{path.stem}.{digest}{path.suffix}'
+
+
+def build_assets(static_folder, files=ASSET_FILES):
+    """
+    Собирает ассеты в static/dist: имя с хешем содержимого, рядом .gz и .br
+    (.br — только если установлен brotli). Возвращает манифест {исходный путь: путь в dist}.
+    """
+    static_folder = Path(static_folder)
+    dist = static_folder / DIST_DIR
+    manifest = {}
+
+    for name in files:
+        source = static_folder / name
+        content = source.read_bytes()
+        target_rel = Path(name).parent / _hashed_name(source, content)
+        target = dist / target_rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        if not target.exists():
+            target.write_bytes(content)
+        gz = target.with_name(target.name + '.gz')
+        if not gz.exists():
+            gz.write_bytes(gzip.compress(content, compresslevel=9, mtime=0))
+        # .br досоздаётся и для уже собранных файлов, если brotli поставили позже
+        br = target.with_name(target.name + '.br')
+        if brotli is not None and not br.exists():
+            br.write_bytes(brotli.compress(content, quality=11))
+        manifest[name] = target_rel.as_posix()
+
+    # Пишем манифест атомарно, чтобы воркеры не прочитали его наполовину
+    tmp = dist / (MANIFEST_NAME + '.tmp')
+    tmp.write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+    os.replace(tmp, dist / MANIFEST_NAME)
+    return manifest
+
+
+def assets_outdated(static_folder, files=ASSET_FILES):
+    static_folder = Path(static_folder)
+    manifest_path = static_folder / DIST_DIR / MANIFEST_NAME
+    if not manifest_path.exists():
+        return True
+    built_at = manifest_path.stat().st_mtime
+    return any((static_folder / name).stat().st_mtime > built_at for name in files)
+
+
+class AssetManifest:
+    """
+    Разрешает исходное имя ассета в имя с хешем. Если сборки нет,
+    возвращает обычный url_for('static'), так что dev-режим работает без build-шага.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self._mtime = None
+        self.static_folder = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = Path(app.static_folder)
+        self.reload()
+        app.jinja_env.globals['asset_url'] = self.url
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.extensions['assets'] = self
+
+    @property
+    def manifest_path(self):
+        return self.static_folder / DIST_DIR / MANIFEST_NAME
+
+    def reload(self):
+        try:
+            mtime = self.manifest_path.stat().st_mtime
+        except FileNotFoundError:
+            self.manifest, self._mtime = {}, None
+            return
+        if mtime != self._mtime:
+            self.manifest = json.loads(self.manifest_path.read_text(encoding='utf-8'))
+            self._mtime = mtime
+
+    def url(self, filename):
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for('static', filename=filename)
+        return url_for('assets', filename=hashed)
+
+    def serve(self, filename):
+        dist = self.static_folder / DIST_DIR
+        # Учитываем q: "br;q=0" — клиент brotli не принимает
+        accepted = request.accept_encodings
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] > 0 and (dist / (filename + suffix)).is_file():
+                response = send_from_directory(dist, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(dist, filename, mimetype=mimetype)
+
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
@@ -0,0 +1,172 @@
+import hashlib
+import math
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, flash, g, jsonify, make_response, redirect, render_template, request, session, url_for
+from flask_login import current_user
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Ключи идемпотентности хранятся столько, сколько офлайн-очередь держит запросы (см. sw.js)
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+IDEMPOTENCY_RETENTION_DAYS = 2
+
+
+def current_school():
+    """slug школы текущего запроса; None — режим одной школы"""
+    router = current_app.extensions.get('tenants')
+    tenant = router.current() if router is not None else None
+    return tenant.slug if tenant else None
+
+
+def queue_owner(user):
+    """Владелец офлайн-очереди sw.js: id в базах школ повторяются, поэтому вместе со школой"""
+    school = current_school()
+    return f'{school}:{user.id}' if school else str(user.id)
+
+
+def role_required(*roles):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_user.is_authenticated:
+                return redirect(url_for('login'))
+            if current_user.role not in roles:
+                flash('У вас нет доступа к этой странице', 'error')
+                return redirect(url_for('index'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def rate_limited(name, template, email=None, methods=('POST',), failures_only=False):
+    """
+    Лимиты RATE_LIMITS[name] по IP и email(); при превышении — 429 со страницей template.
+    failures_only: токен возвращается, если обработчик не вызвал count_failure()
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method not in methods:
+                return f(*args, **kwargs)
+            address = ((email() if email else None) or '').strip().lower() or None
+            limiter = current_app.extensions['rate_limiter']
+            identities = {'scope': current_school(), 'ip': request.remote_addr, 'email': address}
+            # Токен берётся до обработчика: проверка без списания пропустила бы параллельный перебор
+            retry_after = limiter.hit(name, **identities)
+            if not retry_after:
+                if not failures_only:
+                    return f(*args, **kwargs)
+                g.pop('_rate_limit_failure', None)
+                response = f(*args, **kwargs)
+                if not g.pop('_rate_limit_failure', False):
+                    limiter.refund(name, **identities)
+                return response
+            seconds = math.ceil(retry_after)
+            wait = f'{seconds} сек.' if seconds < 60 else f'{math.ceil(seconds / 60)} мин.'
+            flash(f'Слишком много попыток. Повторите через {wait}', 'error')
+            response = make_response(render_template(template, email=address), 429)
+            response.headers['Retry-After'] = str(seconds)
+            return response
+        return decorated_function
+    return decorator
+
+
+def count_failure():
+    """Неудачная попытка (неверный пароль) для rate_limited(failures_only=True)"""
+    g._rate_limit_failure = True
+
+
+def conditional(*keys, versions, release):
+    """
+    Условный GET: ETag из версий данных versions(keys) (ключ или функция от current_user),
+    выводимых полей пользователя и строки запроса; при совпадении — 304 без рендеринга
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # Одноразовые flash-сообщения делают страницу уникальной
+            if '_flashes' in session:
+                return f(*args, **kwargs)
+
+            current = versions([key(current_user) if callable(key) else key for key in keys])
+            fingerprint = (release, current_school(), request.full_path, sorted(current.items()),
+                           current_user.id, current_user.name, current_user.role,
+                           current_user.student_class, current_user.allergy_mask, current_user.balance)
+            etag = hashlib.sha1(repr(fingerprint).encode('utf-8')).hexdigest()[:20]
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+
+def idempotent(f, *, db, model):
+    """
+    Запрос с Idempotency-Key выполняется один раз, повтор получает сохранённый ответ;
+    пока первый не завершился — 409. Ключ в model, отдельными короткими транзакциями.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({'success': False, 'message': 'Слишком длинный Idempotency-Key'}), 400
+
+        # Запрос из очереди другого пользователя (сменился вход на устройстве) не выполняем
+        queued_for = request.headers.get('X-Queued-For')
+        if queued_for and queued_for != queue_owner(current_user):
+            return jsonify({'success': False, 'message': 'Запрос сохранён другим пользователем',
+                            'wrong_user': True}), 409
+
+        where = db.and_(model.user_id == current_user.id, model.key == key)
+        with db.engine.begin() as conn:
+            claimed = conn.execute(
+                sqlite_insert(model)
+                .values(user_id=current_user.id, key=key, endpoint=request.endpoint, created_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=['user_id', 'key'])
+                .returning(model.id)
+            ).scalar()
+            if claimed is None:
+                stored = conn.execute(
+                    db.select(model.endpoint, model.status_code, model.response).where(where)
+                ).one()
+
+        if claimed is None:
+            if stored.endpoint != request.endpoint:
+                return jsonify({'success': False, 'message': 'Idempotency-Key уже использован другим запросом'}), 422
+            if stored.status_code is None:
+                response = jsonify({'success': False, 'message': 'Запрос ещё обрабатывается', 'in_progress': True})
+                response.status_code = 409
+                response.headers['Retry-After'] = '1'
+                return response
+            response = current_app.response_class(stored.response, status=stored.status_code,
+                                                  mimetype='application/json')
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            with db.engine.begin() as conn:
+                conn.execute(db.delete(model).where(where))
+            raise
+
+        with db.engine.begin() as conn:
+            if response.status_code >= 500 or not response.is_json:
+                # Ошибка сервера или редирект на вход: повтор с тем же ключом должен выполниться заново
+                conn.execute(db.delete(model).where(where))
+            else:
+                conn.execute(db.update(model).where(where).values(
+                    status_code=response.status_code, response=response.get_data(as_text=True)))
+        return response
+    return decorated_function
@@ -0,0 +1,262 @@
+import atexit
+import os
+import threading
+from collections import namedtuple
+from contextlib import nullcontext
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from instance import jsonlib
+
+# Как часто фоновый поток проверяет outbox, секунд; 0 — доставлять сразу после commit
+DEFAULT_DISPATCH_INTERVAL = 0.5
+# Событий на одну транзакцию подписчика
+DEFAULT_BATCH_SIZE = 200
+
+Subscriber = namedtuple('Subscriber', 'name topics handler')
+Event = namedtuple('Event', 'id topic payload created_at')
+
+
+class EventBus:
+    """
+    Доменные события через transactional outbox: пачка и checkpoint подписчика
+    фиксируются одной транзакцией, поэтому доставка at-least-once без задвоений
+    """
+
+    def __init__(self, app=None, db=None, event_model=None, checkpoint_model=None, scope=None, activate=None):
+        self.dispatch_interval = DEFAULT_DISPATCH_INTERVAL
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.subscribers = {}
+        self.logger = None
+        self.app = None
+        self.db = db
+        self.event_model = event_model
+        self.checkpoint_model = checkpoint_model
+        self._scope = scope or (lambda: None)
+        self._activate = activate or (lambda scope: nullcontext())
+        self._dirty = set()  # базы, в которые публиковали после последнего обхода
+        self._pending = 0  # приблизительно: сколько commit с событиями с прошлого обхода
+        self._dirty_lock = threading.Lock()
+        # Один обход за раз: иначе два потока доставят одну пачку одному подписчику
+        self._dispatch_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app, db, event_model, checkpoint_model, scope, activate)
+
+    def init_app(self, app, db=None, event_model=None, checkpoint_model=None, scope=None, activate=None):
+        self.dispatch_interval = float(app.config.get('EVENTS_DISPATCH_INTERVAL', self.dispatch_interval))
+        self.batch_size = int(app.config.get('EVENTS_BATCH_SIZE', self.batch_size))
+        self.app = app
+        self.db = db or self.db
+        self.event_model = event_model or self.event_model
+        self.checkpoint_model = checkpoint_model or self.checkpoint_model
+        self._scope = scope or self._scope
+        self._activate = activate or self._activate
+        self.logger = app.logger
+        app.extensions['events'] = self
+        sa_event.listen(Session, 'after_commit', self._after_commit)
+        sa_event.listen(Session, 'after_rollback', self._after_rollback)
+        atexit.register(self.dispatch_pending)
+
+    def subscribe(self, name, *topics):
+        """Декоратор: handler(events) получает события с перечисленными темами по порядку id"""
+        def decorator(handler):
+            if name in self.subscribers:
+                raise ValueError(f'Подписчик {name} уже зарегистрирован')
+            self.subscribers[name] = Subscriber(name, frozenset(topics), handler)
+            return handler
+        return decorator
+
+    # ---------- Публикация ----------
+
+    def current_scope(self):
+        return self._scope()
+
+    def publish(self, topic, payload):
+        """Событие в outbox в текущей транзакции; доставка начнётся после её commit"""
+        session = self.db.session
+        session.add(self.event_model(topic=topic, payload=jsonlib.dumps(payload)))
+        session.info['outbox_scope'] = self._scope()
+
+    def _after_commit(self, session):
+        if 'outbox_scope' in session.info:
+            self.notify(session.info.pop('outbox_scope'))
+
+    def _after_rollback(self, session):
+        session.info.pop('outbox_scope', None)
+
+    @property
+    def synchronous(self):
+        return self.dispatch_interval <= 0
+
+    def notify(self, scope=None):
+        """В базе scope появились события (после commit): доставка пачкой раз в dispatch_interval"""
+        with self._dirty_lock:
+            self._dirty.add(scope)
+            self._pending += 1
+            full = self._pending >= self.batch_size
+        if self.synchronous:
+            self.dispatch_pending()
+            return
+        self._ensure_dispatcher()
+        if full:
+            self._wakeup.set()
+
+    def schedule(self, scope=None):
+        """Проверить outbox базы scope в фоне (например, после перезапуска процесса)"""
+        with self._dirty_lock:
+            self._dirty.add(scope)
+        if not self.synchronous:
+            self._ensure_dispatcher()
+            self._wakeup.set()
+
+    def drain(self, scope=None):
+        """Синхронно доставляет всё, что уже лежит в outbox базы scope (перед пересчётами и удалением)"""
+        with self._dirty_lock:
+            self._dirty.add(scope)
+        return self.dispatch_pending()
+
+    def dispatch_pending(self):
+        """Доставляет все накопленные события во всех отмеченных базах; возвращает их количество"""
+        with self._dispatch_lock:
+            with self._dirty_lock:
+                scopes, self._dirty = self._dirty, set()
+                self._pending = 0
+            delivered = 0
+            for scope in scopes:
+                for subscriber in self.subscribers.values():
+                    try:
+                        while True:
+                            count = self.dispatch(subscriber, scope, self.batch_size)
+                            delivered += count
+                            if count < self.batch_size:
+                                break
+                    except Exception:
+                        # Checkpoint не сдвинут: пачка придёт снова при следующем обходе
+                        with self._dirty_lock:
+                            self._dirty.add(scope)
+                        if self.logger is not None:
+                            self.logger.exception('Подписчик %s: ошибка доставки событий (%s)',
+                                                  subscriber.name, scope or 'основная база')
+            return delivered
+
+    def dispatch(self, subscriber, scope, limit):
+        """Одна пачка после checkpoint подписчика; возвращает, сколько событий outbox просмотрено"""
+        db, Outbox, Checkpoint = self.db, self.event_model, self.checkpoint_model
+        with self._activate(scope), self.app.app_context():
+            # Без блокировки записи: обычно подписчик уже догнал outbox
+            after_id, latest = db.session.execute(db.select(
+                db.select(Checkpoint.last_event_id).where(Checkpoint.subscriber == subscriber.name).scalar_subquery(),
+                db.select(db.func.max(Outbox.id)).scalar_subquery(),
+            )).one()
+            if latest is None or (after_id or 0) >= latest:
+                return 0
+
+            # Upsert checkpoint первым запросом берёт блокировку записи SQLite: диспетчер
+            # другого процесса прочитает уже сдвинутый checkpoint. Писатель один,
+            # поэтому id событий фиксируются по возрастанию
+            after_id = db.session.execute(
+                sqlite_insert(Checkpoint).values(subscriber=subscriber.name, last_event_id=0)
+                .on_conflict_do_update(index_elements=[Checkpoint.subscriber],
+                                       set_={'last_event_id': Checkpoint.last_event_id})
+                .returning(Checkpoint.last_event_id)
+            ).scalar()
+            rows = db.session.execute(
+                db.select(Outbox).where(Outbox.id > after_id).order_by(Outbox.id).limit(limit)
+            ).scalars().all()
+            if not rows:
+                db.session.rollback()
+                return 0
+
+            batch = [Event(row.id, row.topic, jsonlib.loads(row.payload), row.created_at)
+                     for row in rows if row.topic in subscriber.topics]
+            if batch:
+                subscriber.handler(batch)
+            db.session.execute(
+                db.update(Checkpoint).where(Checkpoint.subscriber == subscriber.name)
+                .values(last_event_id=rows[-1].id)
+            )
+            db.session.commit()
+            return len(rows)
+
+    # ---------- Checkpoint и очистка ----------
+
+    def set_checkpoint_to_latest(self, *names):
+        """После полного пересчёта: уже учтённые события не применятся повторно. Не коммитит."""
+        db, Checkpoint = self.db, self.checkpoint_model
+        latest = db.session.execute(db.select(db.func.coalesce(db.func.max(self.event_model.id), 0))).scalar()
+        for name in names:
+            db.session.execute(
+                sqlite_insert(Checkpoint).values(subscriber=name, last_event_id=latest)
+                .on_conflict_do_update(index_elements=[Checkpoint.subscriber], set_={'last_event_id': latest})
+            )
+
+    def prune(self):
+        """Удаляет события, обработанные всеми подписчиками. Возвращает количество удалённых."""
+        db, Checkpoint = self.db, self.checkpoint_model
+        checkpoints = dict(db.session.execute(db.select(Checkpoint.subscriber, Checkpoint.last_event_id)).all())
+        delivered = min((checkpoints.get(name, 0) for name in self.subscribers), default=0)
+        result = db.session.execute(db.delete(self.event_model).where(self.event_model.id <= delivered))
+        db.session.commit()
+        return result.rowcount
+
+    # ---------- Фоновая доставка ----------
+
+    def _ensure_dispatcher(self):
+        # После fork (prefork-серверы) поток родителя в дочернем процессе не существует
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._dirty_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='outbox-dispatch', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.dispatch_interval)
+            self._wakeup.clear()
+            if self._dirty:
+                self.dispatch_pending()
+
+
+# ---------- Свёртка пачек для подписчиков ----------
+
+def menu_item_stats_deltas(batch):
+    """order.created и review.created -> {menu_item_id: {столбец: прирост}}"""
+    deltas = {}
+    for event in batch:
+        if event.topic == 'order.created':
+            for menu_item_id in event.payload['menu_item_ids']:
+                d = deltas.setdefault(menu_item_id, {})
+                d['order_count'] = d.get('order_count', 0) + 1
+        else:
+            d = deltas.setdefault(event.payload['menu_item_id'], {})
+            d['review_count'] = d.get('review_count', 0) + 1
+            d['rating_sum'] = d.get('rating_sum', 0) + event.payload['rating']
+    return deltas
+
+
+def monthly_summary_deltas(batch):
+    """order.created -> {(user_id, месяц): {'order_count', 'total_spent'}}"""
+    deltas = {}
+    for event in batch:
+        d = deltas.setdefault((event.payload['user_id'], event.payload['month']),
+                              {'order_count': 0, 'total_spent': 0.0})
+        d['order_count'] += 1
+        d['total_spent'] += event.payload['total']
+    return deltas
+
+
+def preorder_users_by_day(batch):
+    """preorder.changed -> {день недели: {user_id}}"""
+    by_day = {}
+    for event in batch:
+        for day_name in event.payload['days']:
+            by_day.setdefault(day_name, set()).add(event.payload['user_id'])
+    return by_day
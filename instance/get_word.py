@@ -1,10 +1,13 @@
 import json
 import sqlite3
 from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
 
-from docx import Document
-from docx.shared import Inches, Pt
+from instance.order_snapshot import SUFFIX as SNAPSHOT_SUFFIX, WEEKDAYS, WeekSnapshot, open_snapshot
+from instance.orders_store import read_orders
+from instance.price_catalog import PriceCatalog
 
 BASE_DIR = Path(__file__).resolve().parent
 DEFAULT_JSON_PATH = BASE_DIR / "orders.json"
@@ -35,9 +38,19 @@ def _normalize_meal_name(name, unique_types):
         return "компот"
     return name
 
+def read_week(json_file_path=DEFAULT_JSON_PATH):
+    # Замороженная неделя (*.orders.bin) читается из снапшота, текущая — из orders.json
+    if str(json_file_path).endswith(SNAPSHOT_SUFFIX):
+        snapshot = open_snapshot(json_file_path)
+        if snapshot is None:
+            raise FileNotFoundError(json_file_path)
+        return snapshot
+    return read_orders(json_file_path)
+
 def week(json_file_path=DEFAULT_JSON_PATH):
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = read_week(json_file_path)
+    if isinstance(data, WeekSnapshot):
+        return data.week_totals()
 
     total_servings = {}
 
@@ -52,8 +65,7 @@ def week(json_file_path=DEFAULT_JSON_PATH):
     return total_servings
 
 def day(day_name, json_file_path=DEFAULT_JSON_PATH):
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = read_week(json_file_path)
 
     if day_name in data:
         return data[day_name]
@@ -61,8 +73,9 @@ def day(day_name, json_file_path=DEFAULT_JSON_PATH):
         return {}
 
 def day_product_totals(day_name, json_file_path=DEFAULT_JSON_PATH):
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = read_week(json_file_path)
+    if isinstance(data, WeekSnapshot):
+        return data.day_totals(day_name) if day_name in data else {}
 
     if day_name in data:
         day_data = data[day_name]
@@ -79,63 +92,60 @@ def day_product_totals(day_name, json_file_path=DEFAULT_JSON_PATH):
     else:
         return {}
 
-def get_user_info_from_db(user_id, db_path=DEFAULT_DB_PATH):
-    try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM user WHERE id = ?", (user_id,))
-        user_data = cursor.fetchone()
-        
-        conn.close()
-        
-        if user_data:
-            return user_data[4] if len(user_data) > 4 else "Unknown"
-        else:
-            return "Unknown"
-    except Exception as e:
-        print(f"Error retrieving user info for ID {user_id}: {e}")
-        return "Unknown"
+def _user_id(user_key):
+    # Ключи orders.json — "user<id пользователя>"
+    if isinstance(user_key, int):
+        return user_key
+    if isinstance(user_key, str) and user_key.startswith("user") and user_key[4:].isdigit():
+        return int(user_key[4:])
+    return None
 
 def get_user_by_index(index, db_path=DEFAULT_DB_PATH):
+    user_id = _user_id(index)
+    if user_id is None:
+        return None
     try:
         conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT * FROM user ORDER BY id")
-        all_users = cursor.fetchall()
-
-        conn.close()
-
-        if isinstance(index, str) and index.startswith("user"):
-            user_num = int(index.replace("user", ""))
-            idx = user_num - 1
-        elif isinstance(index, int):
-            idx = index - 1
-        else:
-            idx = -1
-
-        if 0 <= idx < len(all_users):
-            return all_users[idx]
-        else:
-            return None
+        try:
+            return conn.execute("SELECT * FROM user WHERE id = ?", (user_id,)).fetchone()
+        finally:
+            conn.close()
     except Exception as e:
         print(f"Error retrieving user info for index {index}: {e}")
         return None
 
-def generate_report(output_file_path=None, json_file_path=DEFAULT_JSON_PATH, prices=None):
-    if prices is None:
-
-        prices = {
-            'apple': 50,
-            'banana': 30,
-            'orange': 40,
-            'grape': 80,
-            'carrot': 25
-        }
-
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+def get_users(user_ids, db_path=DEFAULT_DB_PATH):
+    """{id: (name, role, student_class)} одним запросом; список id передаётся одним параметром"""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return {}
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT id, name, role, student_class FROM user WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(user_ids),),
+            ).fetchall()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"Error retrieving users: {e}")
+        return {}
+    return {user_id: (name, role, student_class) for user_id, name, role, student_class in rows}
+
+def _day_orders(data, day_name):
+    # [(ключ ученика, {блюдо: порции})]; из снапшота — без сборки словарей "user<N>"
+    if isinstance(data, WeekSnapshot):
+        if day_name not in WEEKDAYS:
+            return []
+        return [(user_id, {str(menu_item_id): servings for _, menu_item_id, servings in rows})
+                for user_id, rows in groupby(data.entries(day_name), key=itemgetter(0))]
+    return list(data.get(day_name, {}).items())
+
+def _new_document():
+    # python-docx тяжёлый, импортируем его только при генерации отчёта
+    from docx import Document
+    from docx.shared import Inches, Pt
 
     doc = Document()
     section = doc.sections[0]
@@ -145,6 +155,26 @@ def generate_report(output_file_path=None, json_file_path=DEFAULT_JSON_PATH, pri
     section.bottom_margin = Inches(0.2)
     doc.styles['Normal'].font.name = 'Times New Roman'
     doc.styles['Normal'].font.size = Pt(12)
+    return doc
+
+def _format_money(value):
+    return str(int(value)) if value == int(value) else f"{value:.2f}"
+
+def _price_catalog(prices, db_path, as_of):
+    # prices: готовый PriceCatalog, словарь {ключ: цена} или None — тогда цены из базы на дату as_of
+    if isinstance(prices, PriceCatalog):
+        return prices
+    if prices is not None:
+        return PriceCatalog.from_mapping(prices)
+    return PriceCatalog.load(db_path, as_of)
+
+def generate_report(output_file_path=None, json_file_path=DEFAULT_JSON_PATH, prices=None, output_dir=None,
+                    db_path=DEFAULT_DB_PATH, as_of=None):
+    catalog = _price_catalog(prices, db_path, as_of)
+
+    data = read_week(json_file_path)
+
+    doc = _new_document()
     
     doc.add_heading('Отчет по заказам за неделю', 0)
     
@@ -162,22 +192,18 @@ def generate_report(output_file_path=None, json_file_path=DEFAULT_JSON_PATH, pri
     hdr_cells[1].text = 'Количество заказов'
     hdr_cells[2].text = 'Выручка (руб.)'
     
-    total_week_revenue = 0
-    for product, quantity in total_servings.items():
+    revenues = catalog.line_revenues(total_servings)
+    total_week_revenue = sum(revenues)
+    for (product, quantity), revenue in zip(total_servings.items(), revenues):
         row_cells = table.add_row().cells
-        row_cells[0].text = product
+        row_cells[0].text = catalog.name(product)
         row_cells[1].text = str(quantity)
-        
-        price_per_unit = prices.get(product, 0)
-        revenue = quantity * price_per_unit
-        row_cells[2].text = str(revenue)
-        
-        total_week_revenue += revenue
+        row_cells[2].text = _format_money(revenue)
     
     total_row = table.add_row().cells
     total_row[0].text = 'ИТОГО за неделю'
     total_row[1].text = str(sum(total_servings.values()))
-    total_row[2].text = str(total_week_revenue)
+    total_row[2].text = _format_money(total_week_revenue)
     
     doc.add_heading('Выручка по дням недели', level=1)
     
@@ -193,28 +219,25 @@ def generate_report(output_file_path=None, json_file_path=DEFAULT_JSON_PATH, pri
     for day_name in data.keys():
         day_totals = day_product_totals(day_name, json_file_path)
         
-        daily_revenue = 0
-        daily_order_count = 0
-        for product, quantity in day_totals.items():
-            price_per_unit = prices.get(product, 0)
-            daily_revenue += quantity * price_per_unit
-            daily_order_count += quantity
+        daily_revenue = catalog.revenue(day_totals)
+        daily_order_count = sum(day_totals.values())
         
         total_daily_orders += daily_order_count
         
         daily_row_cells = daily_table.add_row().cells
         daily_row_cells[0].text = day_name.capitalize()
-        daily_row_cells[1].text = str(daily_revenue)
+        daily_row_cells[1].text = _format_money(daily_revenue)
         daily_row_cells[2].text = str(daily_order_count)
     
     daily_total_row = daily_table.add_row().cells
     daily_total_row[0].text = 'ИТОГО'
-    daily_total_row[1].text = str(total_week_revenue)
+    daily_total_row[1].text = _format_money(total_week_revenue)
     daily_total_row[2].text = str(total_daily_orders)
     
     if output_file_path is None:
-        DEFAULT_REPORTS_DIR.mkdir(parents=True, exist_ok=True)
-        output_file_path = DEFAULT_REPORTS_DIR / f"weekly_report_{datetime.now().strftime('%Y-%m-%d')}.docx"
+        output_dir = Path(output_dir) if output_dir is not None else DEFAULT_REPORTS_DIR
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_file_path = output_dir / f"weekly_report_{datetime.now().strftime('%Y-%m-%d')}.docx"
     output_file_path = Path(output_file_path)
     doc.save(output_file_path)
 
@@ -226,12 +249,13 @@ def generate_daily_reports(
     days_of_week=None,
     day_name=None,
     output_dir=None,
+    prices=None,
+    as_of=None,
 ):
     if days_of_week is None:
         days_of_week = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
 
-    with open(json_file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = read_week(json_file_path)
 
     if output_dir is None:
         output_dir = DEFAULT_REPORTS_DIR
@@ -243,17 +267,16 @@ def generate_daily_reports(
     else:
         days_to_generate = days_of_week
 
-    doc = Document()
-    section = doc.sections[0]
-    section.left_margin = Inches(0.2)
-    section.right_margin = Inches(0.2)
-    section.top_margin = Inches(0.2)
-    section.bottom_margin = Inches(0.2)
-    doc.styles['Normal'].font.name = 'Times New Roman'
-    doc.styles['Normal'].font.size = Pt(12)
+    catalog = _price_catalog(prices, db_path, as_of)
+    doc = _new_document()
+
+    orders_by_day = {day: _day_orders(data, day) for day in days_to_generate}
+    user_ids = {_user_id(user_key) for day_orders in orders_by_day.values() for user_key, _ in day_orders}
+    user_ids.discard(None)
+    users = get_users(user_ids, db_path)
 
     for idx, day_name in enumerate(days_to_generate):
-        day_data = data.get(day_name, {})
+        day_orders = orders_by_day[day_name]
 
         if idx > 0:
             doc.add_page_break()
@@ -261,30 +284,34 @@ def generate_daily_reports(
         doc.add_heading(f'Отчет по заказам на {day_name}', 0)
         doc.add_paragraph(f'Дата: {datetime.now().strftime("%d.%m.%Y")}')
 
+        day_totals = {}
+        for _, orders in day_orders:
+            for product, quantity in orders.items():
+                day_totals[product] = day_totals.get(product, 0) + quantity
+        doc.add_paragraph(f'Выручка за день: {_format_money(catalog.revenue(day_totals))} руб.')
+
         unique_types = {"soup": set(), "salad": set()}
-        for orders in day_data.values():
-            for product in orders.keys():
-                dish_type = _detect_dish_type(product)
-                if dish_type:
-                    unique_types[dish_type].add(product)
+        for product in day_totals:
+            dish_type = _detect_dish_type(catalog.name(product))
+            if dish_type:
+                unique_types[dish_type].add(product)
         unique_type_counts = {k: len(v) for k, v in unique_types.items()}
 
         user_orders = []
-        for user_key, orders in day_data.items():
-            user_info = get_user_by_index(user_key, db_path)
+        for user_key, orders in day_orders:
+            user_info = users.get(_user_id(user_key))
 
             if user_info:
-                user_name = user_info[3] if len(user_info) > 3 else user_key
-                user_role = user_info[4] if len(user_info) > 4 else "Unknown"
-                user_class = user_info[5] if len(user_info) > 5 else ""
+                user_name, user_role, user_class = user_info
+                user_class = user_class or ""
             else:
-                user_name = user_key
+                user_name = user_key if isinstance(user_key, str) else f"user{user_key}"
                 user_role = "Unknown"
                 user_class = ""
 
             meal_parts = []
             for product, quantity in orders.items():
-                short_name = _normalize_meal_name(product, unique_type_counts)
+                short_name = _normalize_meal_name(catalog.name(product), unique_type_counts)
                 if quantity > 1:
                     meal_parts.append(f"{short_name}({quantity})")
                 else:
@@ -322,8 +349,7 @@ def generate_daily_reports(
 
 if __name__ == "__main__":
     if DEFAULT_JSON_PATH.exists():
-        with open(DEFAULT_JSON_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        data = read_orders(DEFAULT_JSON_PATH)
 
         print("Data from orders.json:", data)
         print("Total servings for the week:", week())
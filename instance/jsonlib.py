@@ -0,0 +1,70 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен (extra fast-json): без него работает стандартный json
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def dumpb(obj, pretty=False, sort_keys=False, default=None):
+    """Сериализация в UTF-8 байты; по умолчанию компактно, pretty — отступ 2 пробела"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if default is not None:
+            # Даты отдаём в default, чтобы формат совпадал со стандартным провайдером Flask
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        return orjson.dumps(obj, default=default, option=option)
+    return dumps(obj, pretty=pretty, sort_keys=sort_keys, default=default).encode('utf-8')
+
+
+def dumps(obj, pretty=False, sort_keys=False, default=None):
+    if orjson is not None:
+        return dumpb(obj, pretty=pretty, sort_keys=sort_keys, default=default).decode('utf-8')
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=sort_keys, default=default)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys, default=default)
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(fp):
+    return loads(fp.read())
+
+
+def dump(obj, fp, pretty=False):
+    """Запись в файл, открытый в бинарном режиме ('wb')"""
+    fp.write(dumpb(obj, pretty=pretty))
+
+
+# orjson и json бросают разные исключения; orjson.JSONDecodeError — подкласс ValueError
+JSONDecodeError = orjson.JSONDecodeError if orjson is not None else json.JSONDecodeError
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON-провайдер Flask поверх dumps/loads этого модуля с поведением стандартного"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, pretty=bool(kwargs.get('indent')), sort_keys=kwargs.get('sort_keys', self.sort_keys),
+                     default=kwargs.get('default', self.default))
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = self.compact is False or (self.compact is None and self._app.debug)
+        pretty = self._app.config.get('JSONIFY_PRETTY', pretty)
+        body = dumpb(obj, pretty=pretty, sort_keys=self.sort_keys, default=self.default)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,192 @@
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Границы бакетов гистограмм в секундах (как у prometheus_client по умолчанию)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(bound)
+
+
+class Metrics:
+    """Профилирование: время ответа по эндпоинтам, SQL-запросы на запрос, детектор N+1"""
+
+    def __init__(self, app=None, enabled=False, n_plus_one_threshold=DEFAULT_N_PLUS_ONE_THRESHOLD):
+        self.enabled = False
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self._lock = threading.Lock()
+        self._listening = False
+        self.logger = None
+        self.boot_timings = {}
+        self.reset()
+        if app is not None:
+            self.init_app(app, enabled=enabled)
+
+    def init_app(self, app, enabled=None):
+        if enabled is None:
+            enabled = app.config.get('METRICS_ENABLED', False)
+        self.n_plus_one_threshold = app.config.get('METRICS_N_PLUS_ONE_THRESHOLD', self.n_plus_one_threshold)
+        self.logger = app.logger
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['metrics'] = self
+        self.set_enabled(enabled)
+
+    def reset(self):
+        with self._lock:
+            self.latency = defaultdict(Histogram)
+            self.requests = Counter()
+            self.sql_statements = Counter()
+            self.sql_seconds = defaultdict(float)
+            self.sql_per_request = defaultdict(lambda: Histogram(STATEMENT_BUCKETS))
+            self.n_plus_one = Counter()
+
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+        if self.enabled and not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        elif not self.enabled and self._listening:
+            event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = False
+
+    # ---------- HTTP ----------
+
+    def _before_request(self):
+        if not self.enabled:
+            return
+        g._metrics = {
+            'start': time.perf_counter(),
+            'statements': Counter(),
+            'sql_seconds': 0.0,
+        }
+
+    def _after_request(self, response):
+        state = g.pop('_metrics', None)
+        if state is None:
+            return response
+
+        elapsed = time.perf_counter() - state['start']
+        route = request.endpoint or 'unknown'
+        statements = state['statements']
+        statement_count = sum(statements.values())
+
+        suspects = [(sql, n) for sql, n in statements.items() if n > self.n_plus_one_threshold]
+        with self._lock:
+            self.latency[(route, request.method)].observe(elapsed)
+            self.requests[(route, request.method, response.status_code)] += 1
+            self.sql_statements[route] += statement_count
+            self.sql_seconds[route] += state['sql_seconds']
+            self.sql_per_request[route].observe(statement_count)
+            for _ in suspects:
+                self.n_plus_one[route] += 1
+
+        for sql, n in suspects:
+            self.logger.warning('N+1 в %s: запрос выполнен %d раз: %s', route, n, ' '.join(sql.split())[:300])
+        return response
+
+    # ---------- SQL ----------
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_metrics_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if not has_request_context():
+            return
+        state = g.get('_metrics')
+        if state is None:
+            return
+        state['statements'][statement] += 1
+        state['sql_seconds'] += elapsed
+
+    # ---------- Экспорт ----------
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_request_duration_seconds Время обработки запроса')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for (route, method), hist in sorted(self.latency.items()):
+                labels = f'route="{_escape_label(route)}",method="{method}"'
+                for bound, count in hist.cumulative():
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{_format_bound(bound)}"}} {count}')
+                lines.append(f'http_request_duration_seconds_sum{{{labels}}} {hist.total}')
+                lines.append(f'http_request_duration_seconds_count{{{labels}}} {hist.count}')
+
+            lines.append('# HELP http_requests_total Количество запросов')
+            lines.append('# TYPE http_requests_total counter')
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{route="{_escape_label(route)}",method="{method}",status="{status}"}} {count}')
+
+            lines.append('# HELP sql_statements_total Количество SQL-запросов')
+            lines.append('# TYPE sql_statements_total counter')
+            for route, count in sorted(self.sql_statements.items()):
+                lines.append(f'sql_statements_total{{route="{_escape_label(route)}"}} {count}')
+
+            lines.append('# HELP sql_duration_seconds_total Суммарное время SQL-запросов')
+            lines.append('# TYPE sql_duration_seconds_total counter')
+            for route, seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'sql_duration_seconds_total{{route="{_escape_label(route)}"}} {seconds}')
+
+            lines.append('# HELP sql_statements_per_request Количество SQL-запросов на один HTTP-запрос')
+            lines.append('# TYPE sql_statements_per_request histogram')
+            for route, hist in sorted(self.sql_per_request.items()):
+                labels = f'route="{_escape_label(route)}"'
+                for bound, count in hist.cumulative():
+                    lines.append(f'sql_statements_per_request_bucket{{{labels},le="{_format_bound(bound)}"}} {count}')
+                lines.append(f'sql_statements_per_request_sum{{{labels}}} {hist.total}')
+                lines.append(f'sql_statements_per_request_count{{{labels}}} {hist.count}')
+
+            lines.append('# HELP sql_n_plus_one_total Подозрения на N+1 (один запрос чаще порога)')
+            lines.append('# TYPE sql_n_plus_one_total counter')
+            for route, count in sorted(self.n_plus_one.items()):
+                lines.append(f'sql_n_plus_one_total{{route="{_escape_label(route)}"}} {count}')
+
+        lines.append(f'metrics_enabled {int(self.enabled)}')
+        for phase, seconds in self.boot_timings.items():
+            lines.append(f'app_boot_seconds{{phase="{phase}"}} {seconds}')
+        return '\n'.join(lines) + '\n'
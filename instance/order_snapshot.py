@@ -0,0 +1,231 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from types import MappingProxyType
+
+# Ключи дней в orders.json в порядке date.weekday()
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+MAGIC = b'SFWK'
+FORMAT_VERSION = 1
+SUFFIX = '.orders.bin'
+# Время заморозки хранится в секундах от эпохи, в наивном UTC, как остальные даты приложения
+EPOCH = datetime(1970, 1, 1)
+
+# magic, версия формата, дней, понедельник недели (date.toordinal), блюд, записей, время заморозки (unix)
+_HEADER = struct.Struct('<4sHHIIIQ')
+# Все массивы после заголовка — uint32 little-endian, выровненные по 4 байта
+_ITEM_SIZE = 4
+
+_cache = {}  # путь -> WeekSnapshot
+_cache_lock = threading.Lock()
+
+
+def _uint32(view):
+    """memoryview uint32 поверх байтов файла без копирования (на big-endian — копия)"""
+    if sys.byteorder == 'little':
+        return view.cast('I')
+    values = array('I', view.tobytes())
+    values.byteswap()
+    return memoryview(values)
+
+
+def _to_bytes(values):
+    values = array('I', values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _storable(user_key, item_key, servings):
+    """Запись, которую хранит снапшот: ученик user<N>, блюдо по id, целые порции"""
+    return (user_key.startswith('user') and user_key[4:].isdigit()
+            and item_key.isdigit() and isinstance(servings, int))
+
+
+def _entries(orders):
+    """(день, user_id, menu_item_id, порции) из структуры orders.json, отсортированные"""
+    entries = []
+    for day_index, day_name in enumerate(WEEKDAYS):
+        for user_key, items in orders.get(day_name, {}).items():
+            for item_key, servings in items.items():
+                if _storable(user_key, item_key, servings) and servings > 0:
+                    entries.append((day_index, int(user_key[4:]), int(item_key), servings))
+    entries.sort()
+    return entries
+
+
+def unfrozen(orders):
+    """
+    Записи orders.json, которых нет в снапшоте (ученик не user<N>, блюдо не по id,
+    порции не числом), в той же структуре: при заморозке они остаются в файле
+    """
+    rest = {}
+    for day_name in WEEKDAYS:
+        for user_key, items in orders.get(day_name, {}).items():
+            for item_key, servings in items.items():
+                if not _storable(user_key, item_key, servings):
+                    rest.setdefault(day_name, {}).setdefault(user_key, {})[item_key] = servings
+    return rest
+
+
+def write_snapshot(path, orders, week_start, frozen_at=None):
+    """Атомарно замораживает предзаказы недели в компактный файл path; возвращает WeekSnapshot"""
+    frozen_at = frozen_at or datetime.utcnow()
+    entries = _entries(orders)
+    item_ids = sorted({menu_item_id for _, _, menu_item_id, _ in entries})
+    position = {menu_item_id: index for index, menu_item_id in enumerate(item_ids)}
+
+    days = len(WEEKDAYS)
+    totals = [0] * (days * len(item_ids))
+    offsets = [0] * (days + 1)
+    for day_index, _, menu_item_id, servings in entries:
+        totals[day_index * len(item_ids) + position[menu_item_id]] += servings
+        offsets[day_index + 1] += 1
+    for day_index in range(days):
+        offsets[day_index + 1] += offsets[day_index]
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, days, week_start.toordinal(), len(item_ids), len(entries),
+                          int((frozen_at - EPOCH).total_seconds()))
+    parts = [header, _to_bytes(item_ids), _to_bytes(totals), _to_bytes(offsets),
+             _to_bytes(e[1] for e in entries), _to_bytes(e[2] for e in entries), _to_bytes(e[3] for e in entries)]
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(parts)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    return open_snapshot(path)
+
+
+def open_snapshot(path):
+    """
+    Снапшот недели, отображённый в память. Открытый файл кешируется на процесс
+    по (inode, mtime, размер), повторные вызовы ничего не читают. Нет файла — None.
+    """
+    path = str(Path(path))
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached.key == key:
+            return cached
+
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        snapshot = WeekSnapshot(f, (stat.st_ino, stat.st_mtime_ns, stat.st_size))
+    with _cache_lock:
+        _cache[path] = snapshot
+    return snapshot
+
+
+class WeekSnapshot(Mapping):
+    """Предзаказы замороженной недели поверх mmap; как Mapping повторяет структуру orders.json"""
+
+    def __init__(self, f, key):
+        self.key = key
+        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        magic, version, days, ordinal, n_items, n_entries, frozen_at = _HEADER.unpack_from(buf)
+        if magic != MAGIC or version != FORMAT_VERSION or days != len(WEEKDAYS):
+            raise ValueError(f'{f.name}: не снапшот недели или неизвестная версия формата')
+        if len(buf) != _HEADER.size + _ITEM_SIZE * (n_items * (days + 1) + days + 1 + 3 * n_entries):
+            raise ValueError(f'{f.name}: размер файла не совпадает с заголовком')
+
+        self.week_start = date.fromordinal(ordinal)
+        self.frozen_at = EPOCH + timedelta(seconds=frozen_at)
+        offset = _HEADER.size
+
+        def column(size):
+            nonlocal offset
+            view = _uint32(buf[offset:offset + _ITEM_SIZE * size])
+            offset += _ITEM_SIZE * size
+            return view
+
+        self.item_ids = column(n_items)
+        self._totals = column(days * n_items)
+        self._offsets = column(days + 1)
+        self._users = column(n_entries)
+        self._items = column(n_entries)
+        self._servings = column(n_entries)
+
+    def _range(self, day_name):
+        day_index = WEEKDAYS.index(day_name)
+        return self._offsets[day_index], self._offsets[day_index + 1]
+
+    def totals(self, day_name):
+        """Порции по блюдам за день: срез без копирования, по порядку item_ids"""
+        n_items = len(self.item_ids)
+        start = WEEKDAYS.index(day_name) * n_items
+        return self._totals[start:start + n_items]
+
+    def day_totals(self, day_name):
+        """{"<id блюда>": порции} за день, как day_product_totals для orders.json"""
+        return {str(menu_item_id): servings
+                for menu_item_id, servings in zip(self.item_ids, self.totals(day_name)) if servings}
+
+    def week_totals(self):
+        """{"<id блюда>": порции} за неделю"""
+        n_items = len(self.item_ids)
+        sums = [0] * n_items
+        for day_index in range(len(WEEKDAYS)):
+            for index, servings in enumerate(self._totals[day_index * n_items:(day_index + 1) * n_items]):
+                sums[index] += servings
+        return {str(menu_item_id): servings for menu_item_id, servings in zip(self.item_ids, sums) if servings}
+
+    def entries(self, day_name):
+        """(user_id, menu_item_id, порции) за день по возрастанию user_id"""
+        start, end = self._range(day_name)
+        return zip(self._users[start:end], self._items[start:end], self._servings[start:end])
+
+    def user_servings(self, day_name, user_id):
+        """{menu_item_id: порции} ученика за день двоичным поиском"""
+        start, end = self._range(day_name)
+        first = bisect_left(self._users, user_id, start, end)
+        last = bisect_right(self._users, user_id, first, end)
+        return dict(zip(self._items[first:last], self._servings[first:last]))
+
+    # ---------- Формат orders.json ----------
+
+    def _has_entries(self, day_name):
+        start, end = self._range(day_name)
+        return start != end
+
+    def __getitem__(self, day_name):
+        # Как в orders.json: есть только дни, на которые есть предзаказы
+        if day_name not in WEEKDAYS or not self._has_entries(day_name):
+            raise KeyError(day_name)
+        day = {}
+        for user_id, menu_item_id, servings in self.entries(day_name):
+            day.setdefault(f'user{user_id}', {})[str(menu_item_id)] = servings
+        return MappingProxyType({user_key: MappingProxyType(items) for user_key, items in day.items()})
+
+    def __iter__(self):
+        return (day_name for day_name in WEEKDAYS if self._has_entries(day_name))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f'<WeekSnapshot {self.week_start.isoformat()}: {len(self._users)} записей>'
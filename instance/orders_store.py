@@ -0,0 +1,184 @@
+import os
+import tempfile
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+from instance import jsonlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка только между потоками одного процесса
+    fcntl = None
+
+_cache = {}  # путь -> ((st_ino, st_mtime_ns, st_size), данные); данные в кеше никто не меняет
+_cache_lock = threading.Lock()
+_write_locks = {}  # путь -> блокировка записи между потоками процесса; между процессами — flock
+_write_locks_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+_SCALARS = frozenset({str, int, float, bool, type(None)})
+
+
+class FrozenView(Mapping):
+    """Только для чтения поверх разобранного JSON: вложенные dict/list оборачиваются при обращении"""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        return _view(self._data[key])
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenView):
+            other = other._data
+        return self._data == other
+
+    def __repr__(self):
+        return f'FrozenView({self._data!r})'
+
+
+def _view(value):
+    if type(value) is dict:
+        return FrozenView(value)
+    if type(value) is list:
+        return tuple(_view(v) for v in value)
+    return value
+
+
+EMPTY = FrozenView({})
+
+
+def _copy(value):
+    """Изменяемая копия разобранного JSON: копируются только dict/list, скаляры переиспользуются"""
+    if type(value) is dict:
+        return {k: v if type(v) in _SCALARS else _copy(v) for k, v in value.items()}
+    if type(value) is list:
+        return [v if type(v) in _SCALARS else _copy(v) for v in value]
+    return value
+
+
+def thaw(value):
+    """Изменяемая копия структуры, возвращённой read_orders"""
+    if isinstance(value, FrozenView):
+        return _copy(value._data)
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return _copy(value)
+
+
+def _key(stat):
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def read_orders(path):
+    """Предзаказы из orders.json (кеш на процесс по inode, mtime и размеру) как FrozenView"""
+    path = str(Path(path))
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return EMPTY
+
+    key = _key(stat)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == key:
+            _stats['hits'] += 1
+            return FrozenView(cached[1])
+    return FrozenView(_load(path))
+
+
+def _load(path):
+    with open(path, 'rb') as f:
+        # Ключ берём от того же открытого файла: после os.replace путь может указывать на новый
+        key = _key(os.fstat(f.fileno()))
+        data = jsonlib.load(f)
+    with _cache_lock:
+        _stats['misses'] += 1
+        _cache[path] = (key, data)
+    return data
+
+
+def _parse(path):
+    """Свежий разбор файла мимо кеша: изменяемые данные, которые ни с кем не разделяются; нет файла — {}"""
+    try:
+        with open(path, 'rb') as f:
+            return jsonlib.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_orders(path, orders, pretty=False, fsync=False):
+    """Атомарная запись через os.replace; fsync=True — ещё и сброс файла и папки на диск"""
+    if isinstance(orders, FrozenView):
+        orders = orders._data
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            jsonlib.dump(orders, f, pretty=pretty)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+    if fsync and hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    with _cache_lock:
+        _cache[str(path)] = (_key(os.stat(path)), orders)
+    return FrozenView(orders)
+
+
+def _write_lock(path):
+    key = str(path.resolve())
+    with _write_locks_lock:
+        lock = _write_locks.get(key)
+        if lock is None:
+            lock = _write_locks[key] = threading.Lock()
+        return lock
+
+
+def update_orders(path, update, pretty=False, fsync=False):
+    """
+    Чтение, update(orders) и запись под блокировкой потоков и flock;
+    изменяемая копия — повторный разбор файла, он дешевле глубокого копирования
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _write_lock(path), open(path.with_name(path.name + '.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            orders = _parse(path)
+            update(orders)
+            return write_orders(path, orders, pretty=pretty, fsync=fsync)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def cache_info():
+    with _cache_lock:
+        return dict(_stats, files=len(_cache))
@@ -0,0 +1,89 @@
+import math
+import sqlite3
+from array import array
+from datetime import datetime
+from operator import mul
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_DB_PATH = BASE_DIR / "school_food.db"
+
+# Формат, в котором SQLAlchemy хранит DateTime в SQLite
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class PriceCatalog:
+    """Цены блюд на момент as_of в плотном массиве по id блюда"""
+
+    def __init__(self, prices, names, overrides=None):
+        self.prices = prices
+        self.names = names
+        # Цены по произвольному ключу (например, старые заказы по названию продукта)
+        self.overrides = overrides or {}
+
+    @classmethod
+    def load(cls, db_path=DEFAULT_DB_PATH, as_of=None):
+        as_of = as_of or datetime.utcnow()
+        conn = sqlite3.connect(db_path)
+        try:
+            try:
+                rows = conn.execute(
+                    """
+                    SELECT m.id, m.name, COALESCE(
+                        (SELECT p.price FROM menu_item_price p
+                         WHERE p.menu_item_id = m.id AND p.valid_from <= ?
+                         ORDER BY p.valid_from DESC LIMIT 1),
+                        m.price)
+                    FROM menu_item m
+                    """,
+                    (as_of.strftime(SQLITE_DATETIME_FORMAT),),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                # База без истории цен — берём текущие
+                rows = conn.execute("SELECT id, name, price FROM menu_item").fetchall()
+        finally:
+            conn.close()
+
+        size = max((row[0] for row in rows), default=0) + 1
+        prices = array('d', bytes(8 * size))
+        names = [None] * size
+        for item_id, name, price in rows:
+            prices[item_id] = price or 0.0
+            names[item_id] = name
+        return cls(prices, names)
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        return cls(array('d'), [], overrides=dict(mapping))
+
+    def _index(self, key):
+        try:
+            idx = int(key)
+        except (TypeError, ValueError):
+            return None
+        return idx if 0 <= idx < len(self.prices) else None
+
+    def price(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        idx = self._index(key)
+        return self.prices[idx] if idx is not None else 0.0
+
+    def name(self, key):
+        idx = self._index(key)
+        if idx is not None and self.names[idx]:
+            return self.names[idx]
+        return str(key)
+
+    def price_vector(self, keys):
+        return array('d', (self.price(k) for k in keys))
+
+    def line_revenues(self, quantities):
+        """{ключ: количество} -> список выручки по строкам (в порядке ключей)"""
+        return list(map(mul, quantities.values(), self.price_vector(quantities.keys())))
+
+    def revenue(self, quantities):
+        """Выручка по {ключ: количество} — скалярное произведение векторов"""
+        if not quantities:
+            return 0.0
+        return math.sumprod(quantities.values(), self.price_vector(quantities.keys()))
@@ -0,0 +1,234 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+# "10/minute", "3/hour", "5/10 minutes": столько запросов подряд, затем по одному
+# в (период / количество); ёмкость ведра — количество, скорость пополнения — количество/период
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d+)?\s*(second|minute|hour|day)s?\s*$')
+
+# Как часто (секунд) SqliteBackend удаляет полностью пополнившиеся вёдра
+DEFAULT_SWEEP_INTERVAL = 60.0
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+
+class Limit:
+    """Параметры ведра: capacity токенов, пополнение rate токенов в секунду"""
+
+    __slots__ = ('capacity', 'period', 'rate')
+
+    def __init__(self, capacity, period):
+        if capacity < 1 or period <= 0:
+            raise ValueError('Лимит должен быть не меньше 1 запроса за положительный период')
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def parse(spec):
+        match = _LIMIT_RE.match(spec)
+        if not match:
+            raise ValueError(f'Неверный лимит {spec!r}, ожидается вида "10/minute"')
+        count, multiplier, unit = match.groups()
+        return Limit(int(count), int(multiplier or 1) * PERIODS[unit])
+
+    def __repr__(self):
+        return f'<Limit {self.capacity}/{self.period}s>'
+
+
+class MemoryBackend:
+    """Вёдра в памяти процесса; полностью пополнившиеся снимаются с начала OrderedDict"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # (capacity, period) -> OrderedDict ключ -> (токены, время)
+
+    def take(self, key, limit, now, cost=1):
+        with self._lock:
+            buckets = self._buckets.setdefault((limit.capacity, limit.period), OrderedDict())
+            while buckets:
+                oldest_key, (_, updated_at) = next(iter(buckets.items()))
+                if now - updated_at < limit.period:
+                    break
+                del buckets[oldest_key]
+
+            tokens, updated_at = buckets.pop(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + max(now - updated_at, 0) * limit.rate)
+            if tokens < cost:
+                # Отказ не тратит токены и не сдвигает время пополнения
+                buckets[key] = (tokens, now)
+                return (cost - tokens) / limit.rate
+            buckets[key] = (tokens - cost, now)
+            return 0.0
+
+    def peek(self, key, limit, now, cost=1):
+        with self._lock:
+            buckets = self._buckets.get((limit.capacity, limit.period), {})
+            tokens, updated_at = buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + max(now - updated_at, 0) * limit.rate)
+            return max(cost - tokens, 0) / limit.rate
+
+    def refund(self, key, limit, now, cost=1):
+        with self._lock:
+            buckets = self._buckets.get((limit.capacity, limit.period), {})
+            if key in buckets:
+                tokens, updated_at = buckets[key]
+                buckets[key] = (min(limit.capacity, tokens + cost), updated_at)
+
+    def __len__(self):
+        return sum(len(buckets) for buckets in self._buckets.values())
+
+
+class SqliteBackend:
+    """Вёдра в файле SQLite, общем для воркеров: списание — один UPSERT ... RETURNING"""
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS rate_bucket ('
+        'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, expires_at REAL NOT NULL'
+        ') WITHOUT ROWID',
+        'CREATE INDEX IF NOT EXISTS ix_rate_bucket_expires_at ON rate_bucket (expires_at)',
+    )
+    # В SET и WHERE столбцы — значения до обновления; часы воркеров могут расходиться, отсюда max(..., 0)
+    _TAKE = """
+        INSERT INTO rate_bucket (key, tokens, updated_at, expires_at)
+        VALUES (:key, :capacity - :cost, :now, :now + :cost / :rate)
+        ON CONFLICT (key) DO UPDATE SET
+            tokens = min(:capacity, tokens + max(:now - updated_at, 0) * :rate) - :cost,
+            updated_at = :now,
+            expires_at = :now + (:capacity - min(:capacity, tokens + max(:now - updated_at, 0) * :rate) + :cost) / :rate
+        WHERE min(:capacity, tokens + max(:now - updated_at, 0) * :rate) >= :cost
+        RETURNING tokens
+    """
+    _AVAILABLE = 'SELECT min(:capacity, tokens + max(:now - updated_at, 0) * :rate) FROM rate_bucket WHERE key = :key'
+    _REFUND = """
+        UPDATE rate_bucket SET
+            tokens = min(:capacity, tokens + :cost),
+            expires_at = updated_at + (:capacity - min(:capacity, tokens + :cost)) / :rate
+        WHERE key = :key
+    """
+
+    def __init__(self, path, sweep_interval=DEFAULT_SWEEP_INTERVAL):
+        self.path = str(path)
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _conn(self):
+        # Соединение на поток; после fork (prefork-серверы) — новое
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    def take(self, key, limit, now, cost=1):
+        conn = self._conn()
+        params = {'key': key, 'capacity': limit.capacity, 'rate': limit.rate, 'cost': cost, 'now': now}
+        taken = conn.execute(self._TAKE, params).fetchall()
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.sweep(now)
+        if taken:
+            return 0.0
+        return self.peek(key, limit, now, cost)
+
+    def peek(self, key, limit, now, cost=1):
+        params = {'key': key, 'capacity': limit.capacity, 'rate': limit.rate, 'now': now}
+        row = self._conn().execute(self._AVAILABLE, params).fetchone()
+        available = row[0] if row else limit.capacity
+        return max(cost - available, 0) / limit.rate
+
+    def refund(self, key, limit, now, cost=1):
+        params = {'key': key, 'capacity': limit.capacity, 'rate': limit.rate, 'cost': cost}
+        self._conn().execute(self._REFUND, params)
+
+    def sweep(self, now=None):
+        """Удаляет полностью пополнившиеся вёдра; возвращает их число"""
+        now = time.time() if now is None else now
+        return self._conn().execute('DELETE FROM rate_bucket WHERE expires_at <= ?', (now,)).rowcount
+
+    def __len__(self):
+        return self._conn().execute('SELECT count(*) FROM rate_bucket').fetchone()[0]
+
+
+def create_backend(storage):
+    """'memory' или 'sqlite:///путь/к/файлу.db'"""
+    if storage == 'memory':
+        return MemoryBackend()
+    if storage.startswith('sqlite:///'):
+        return SqliteBackend(storage[len('sqlite:///'):])
+    raise ValueError(f'Неизвестное хранилище лимитов {storage!r}: ожидается memory или sqlite:///путь')
+
+
+class RateLimiter:
+    """Токен-бакеты по RATE_LIMITS[имя][вид ключа]; hit() возвращает, через сколько секунд повторить"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = MemoryBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = create_backend(app.config.get('RATE_LIMIT_STORAGE', 'memory'))
+        app.extensions['rate_limiter'] = self
+
+    def _buckets(self, name, scope, identities):
+        limits = self.app.config.get('RATE_LIMITS', {}).get(name, {})
+        prefix = f'{scope}:{name}' if scope else name
+        for kind, value in identities.items():
+            spec = limits.get(kind)
+            if spec is not None and value:
+                yield f'{prefix}:{kind}:{value}', Limit.parse(spec)
+
+    def check(self, name, now=None, scope=None, **identities):
+        """Как hit, но без списания: через сколько секунд в каждом ведре найдётся токен"""
+        if not self.app.config.get('RATE_LIMIT_ENABLED', True):
+            return 0.0
+        now = time.time() if now is None else now
+        return max((self.backend.peek(key, limit, now) for key, limit in self._buckets(name, scope, identities)),
+                   default=0.0)
+
+    def hit(self, name, now=None, scope=None, **identities):
+        if not self.app.config.get('RATE_LIMIT_ENABLED', True):
+            return 0.0
+        now = time.time() if now is None else now
+        taken = []
+        for key, limit in self._buckets(name, scope, identities):
+            wait = self.backend.take(key, limit, now)
+            if wait:
+                # Отклонённый запрос не тратит токены: уже списанные из других вёдер возвращаем
+                for taken_key, taken_limit in taken:
+                    self.backend.refund(taken_key, taken_limit, now)
+                return wait
+            taken.append((key, limit))
+        return 0.0
+
+    def refund(self, name, now=None, scope=None, **identities):
+        """Возвращает токены, списанные hit() с теми же аргументами"""
+        if not self.app.config.get('RATE_LIMIT_ENABLED', True):
+            return
+        now = time.time() if now is None else now
+        for key, limit in self._buckets(name, scope, identities):
+            self.backend.refund(key, limit, now)
@@ -0,0 +1,64 @@
+import re
+
+from markupsafe import escape
+
+# Полнотекстовые индексы FTS5 над menu_item.name и review.text. Таблицы external content:
+# текст хранится только в исходных таблицах, индекс поддерживают триггеры на любые
+# INSERT/UPDATE/DELETE, в том числе массовые запросы мимо ORM.
+# unicode61 приводит кириллицу к нижнему регистру; prefix — готовые списки документов
+# для префиксов из 2–4 букв, иначе запрос "бор*" сливает списки всех слов на "бор".
+TOKENIZE = "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'"
+
+INDEXES = {
+    # имя индекса: (таблица, колонка)
+    'menu_item_fts': ('menu_item', 'name'),
+    'review_fts': ('review', 'text'),
+}
+
+# Маркеры совпадений в highlight/snippet: символы из области частного использования,
+# которых нет в тексте; после экранирования HTML заменяются на <mark>
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+MAX_TERMS = 8
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def ddl():
+    """CREATE-запросы индексов и триггеров (идемпотентные)"""
+    statements = []
+    for index, (table, column) in INDEXES.items():
+        statements.append(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5('
+            f"{column}, content='{table}', content_rowid='id', {TOKENIZE})"
+        )
+        statements.append(
+            f'CREATE TRIGGER IF NOT EXISTS {index}_ai AFTER INSERT ON "{table}" BEGIN '
+            f'INSERT INTO {index}(rowid, {column}) VALUES (new.id, new.{column}); END'
+        )
+        statements.append(
+            f'CREATE TRIGGER IF NOT EXISTS {index}_ad AFTER DELETE ON "{table}" BEGIN '
+            f"INSERT INTO {index}({index}, rowid, {column}) VALUES ('delete', old.id, old.{column}); END"
+        )
+        statements.append(
+            f'CREATE TRIGGER IF NOT EXISTS {index}_au AFTER UPDATE OF {column} ON "{table}" BEGIN '
+            f"INSERT INTO {index}({index}, rowid, {column}) VALUES ('delete', old.id, old.{column}); "
+            f'INSERT INTO {index}(rowid, {column}) VALUES (new.id, new.{column}); END'
+        )
+    return statements
+
+
+def rebuild_statements():
+    """Полное перестроение индексов из исходных таблиц"""
+    return [f"INSERT INTO {index}({index}) VALUES ('rebuild')" for index in INDEXES]
+
+
+def match_query(text):
+    """Запрос MATCH из ввода: каждое слово в кавычках как префикс; пустой ввод — пустая строка"""
+    words = _WORD_RE.findall(text.lower())[:MAX_TERMS]
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def highlighted(value):
+    """Результат highlight()/snippet() -> безопасный HTML с совпадениями в <mark>"""
+    return str(escape(value or '')).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
@@ -0,0 +1,171 @@
+import atexit
+import itertools
+import os
+import threading
+from collections import Counter
+
+MEAL_TYPES = ('breakfast', 'lunch')
+DEFAULT_SHARDS = 8
+# Окно потери данных при падении процесса, секунд; 0 — писать сразу
+DEFAULT_FLUSH_INTERVAL = 1.0
+# Сколько порций накопить, чтобы сбросить буфер раньше интервала
+DEFAULT_FLUSH_THRESHOLD = 50
+
+
+class _Shard:
+    __slots__ = ('lock', 'deltas')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.deltas = Counter()  # (scope, date, meal_type) -> порций
+
+
+class ServedCounters:
+    """
+    Счётчики выданных порций: дельты копятся в шардах процесса и сбрасываются
+    в базу одним UPDATE на день через flush(counts, scope)
+    """
+
+    def __init__(self, app=None, flush=None, read=None, scope=None):
+        self.flush_interval = DEFAULT_FLUSH_INTERVAL
+        self.flush_threshold = DEFAULT_FLUSH_THRESHOLD
+        self.shards = [_Shard() for _ in range(DEFAULT_SHARDS)]
+        self.logger = None
+        self._flush = flush
+        self._read = read
+        self._scope = scope or (lambda: None)
+        # Потоку — свой шард: get_ident() кратен 8 и отправил бы все потоки в нулевой
+        self._thread_index = itertools.count()
+        self._local = threading.local()
+        self._flush_lock = threading.Lock()
+        # +1 на каждый сброс: totals() по нему узнаёт, что сброс прошёл во время чтения базы
+        self._generation = 0
+        self._pending = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app, flush=flush, read=read, scope=scope)
+
+    def init_app(self, app, flush=None, read=None, scope=None):
+        self.flush_interval = float(app.config.get('SERVED_FLUSH_INTERVAL', self.flush_interval))
+        self.flush_threshold = int(app.config.get('SERVED_FLUSH_THRESHOLD', self.flush_threshold))
+        shards = int(app.config.get('SERVED_COUNTER_SHARDS', len(self.shards)))
+        self.shards = [_Shard() for _ in range(max(1, shards))]
+        self._flush = flush or self._flush
+        self._read = read or self._read
+        self._scope = scope or self._scope
+        self.logger = app.logger
+        app.extensions['served_counters'] = self
+        atexit.register(self.flush)
+
+    @property
+    def write_through(self):
+        return self.flush_interval <= 0
+
+    def add(self, day, meal_type, count=1):
+        """
+        Прибавляет порции. Вызывать после commit транзакции запроса:
+        в режиме write_through сброс идёт сразу отдельным соединением.
+        """
+        if meal_type not in MEAL_TYPES or not count:
+            return
+        key = (self._scope(), day, meal_type)
+        shard = self._shard()
+        with shard.lock:
+            shard.deltas[key] += count
+        self._pending += abs(count)  # приблизительно: только для порога
+
+        if self.write_through:
+            self.flush()
+        elif self._pending >= self.flush_threshold:
+            self._ensure_flusher()
+            self._wakeup.set()
+        else:
+            self._ensure_flusher()
+
+    def _shard(self):
+        index = getattr(self._local, 'index', None)
+        if index is None:
+            index = self._local.index = next(self._thread_index)
+        return self.shards[index % len(self.shards)]
+
+    def pending(self, day=None, scope=None):
+        """Несброшенные дельты {(date, meal_type): n} одной базы"""
+        result = Counter()
+        for shard in self.shards:
+            with shard.lock:
+                for (s, d, meal_type), n in shard.deltas.items():
+                    if s == scope and (day is None or d == day):
+                        result[(d, meal_type)] += n
+        return result
+
+    def totals(self, day):
+        """Итоги за день с учётом несброшенных дельт (read-your-writes в пределах процесса)"""
+        scope = self._scope()
+        # База читается без блокировки сброса; если сброс начался до конца чтения,
+        # дельта могла попасть и в базу, и в снимок буфера — читаем заново
+        while True:
+            with self._flush_lock:
+                generation = self._generation
+                pending = self.pending(day, scope)
+            stored = self._read(day, scope)
+            if self._generation == generation:
+                break
+        return {meal_type: (stored.get(meal_type) or 0) + pending[(day, meal_type)] for meal_type in MEAL_TYPES}
+
+    def _drain(self):
+        drained = Counter()
+        for shard in self.shards:
+            with shard.lock:
+                drained.update(shard.deltas)
+                shard.deltas.clear()
+        self._pending = 0
+        return drained
+
+    def _restore(self, drained):
+        shard = self.shards[0]
+        with shard.lock:
+            shard.deltas.update(drained)
+
+    def flush(self):
+        """Сбрасывает все буферы в базу; при ошибке дельты базы возвращаются в буфер"""
+        with self._flush_lock:
+            drained = self._drain()
+            if drained:
+                self._generation += 1
+            by_scope = {}
+            for (scope, day, meal_type), n in drained.items():
+                if n:
+                    by_scope.setdefault(scope, {}).setdefault(day, {})[meal_type] = n
+            flushed = 0
+            for scope, counts in by_scope.items():
+                try:
+                    self._flush(counts, scope)
+                except Exception:
+                    self._restore(Counter({(scope, day, meal_type): n for day, by_type in counts.items()
+                                           for meal_type, n in by_type.items()}))
+                    if self.logger is not None:
+                        self.logger.exception('Не удалось сохранить счётчики выдачи (%s)', scope or 'основная база')
+                    continue
+                flushed += sum(abs(n) for by_type in counts.values() for n in by_type.values())
+            return flushed
+
+    # ---------- Фоновый сброс ----------
+
+    def _ensure_flusher(self):
+        # После fork (prefork-серверы) поток родителя в дочернем процессе не существует
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._flush_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='served-counters-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
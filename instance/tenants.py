@@ -0,0 +1,333 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from types import MappingProxyType
+
+from flask import abort, g, request, session
+from flask.sessions import SecureCookieSessionInterface
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine
+
+# Имя школы в URL и на диске: латиница, цифры, дефис и подчёркивание
+SLUG_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,62}$')
+# В режиме path школа выбирается префиксом /s/<slug>/...
+PATH_PREFIX = 's'
+ENVIRON_KEY = 'school_food.tenant'
+DATABASE_NAME = 'school_food.db'
+ORDERS_NAME = 'orders.json'
+REPORTS_NAME = 'reports'
+WEEKS_NAME = 'weeks'
+# Через сколько секунд без запросов соединения школы закрываются
+DEFAULT_IDLE_TIMEOUT = 300.0
+DEFAULT_FANOUT_WORKERS = 8
+
+_current = contextvars.ContextVar('tenant', default=None)
+
+
+class Tenant:
+    """Школа: своя папка с базой SQLite, файлом предзаказов, замороженными неделями и отчётами, свой пул соединений"""
+
+    def __init__(self, slug, root):
+        self.slug = slug
+        self.root = Path(root)
+        self.engine = None
+        self.engines = MappingProxyType({})
+        self.ready = False  # движок создан и on_open завершился
+        self.active = 0  # запросов и фоновых задач, использующих школу сейчас
+        self.last_used = time.monotonic()
+        self.open_lock = threading.Lock()
+
+    @property
+    def database_path(self):
+        return self.root / DATABASE_NAME
+
+    @property
+    def orders_file(self):
+        return str(self.root / ORDERS_NAME)
+
+    @property
+    def reports_dir(self):
+        return str(self.root / REPORTS_NAME)
+
+    @property
+    def weeks_dir(self):
+        return str(self.root / WEEKS_NAME)
+
+    def __repr__(self):
+        return f'<Tenant {self.slug}>'
+
+
+class _PathPrefixMiddleware:
+    """/s/<slug>/menu -> PATH_INFO=/menu, SCRIPT_NAME=/s/<slug>: url_for сам добавляет префикс"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        parts = environ.get('PATH_INFO', '').split('/', 3)
+        if len(parts) >= 3 and parts[1] == PATH_PREFIX and SLUG_RE.match(parts[2]):
+            environ[ENVIRON_KEY] = parts[2]
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + f'/{PATH_PREFIX}/{parts[2]}'
+            environ['PATH_INFO'] = '/' + (parts[3] if len(parts) > 3 else '')
+        return self.wsgi_app(environ, start_response)
+
+
+class _TenantSessionInterface(SecureCookieSessionInterface):
+    """Одна cookie на все школы, у каждой школы свой раздел сессии"""
+
+    def __init__(self, router):
+        self.router = router
+
+    def open_session(self, app, request):
+        outer = super().open_session(app, request)
+        if outer is None:
+            return None
+        slug = self.router.url_slug(request)
+        if slug is None and self.router.mode == 'path':
+            slug = outer.get('tenant')
+        session = self.session_class((outer.get('schools') or {}).get(slug) or {})
+        session.outer = outer
+        session.tenant = slug
+        return session
+
+    def save_session(self, app, session, response):
+        outer = session.outer
+        if session.modified and session.tenant is not None:
+            schools = dict(outer.get('schools') or {})
+            if session:
+                schools[session.tenant] = dict(session)
+            else:
+                schools.pop(session.tenant, None)
+            outer['schools'] = schools
+        if session.accessed:
+            outer.accessed = True
+        super().save_session(app, outer, response)
+
+
+class TenantRouter:
+    """
+    Несколько школ: у каждой папка TENANTS_DIR/<slug> с базой и своим пулом;
+    школа выбирается по хосту (TENANT_MODE=host) или префиксу /s/<slug>/ (TENANT_MODE=path)
+    """
+
+    def __init__(self, app=None, on_open=None):
+        self.mode = None
+        self.root = None
+        self.hosts = {}
+        self.base_domain = None
+        self.idle_timeout = DEFAULT_IDLE_TIMEOUT
+        self.fanout_workers = DEFAULT_FANOUT_WORKERS
+        self.engine_options = {}
+        self.on_open = on_open
+        self.app = None
+        self._tenants = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        if app is not None:
+            self.init_app(app, on_open=on_open)
+
+    def init_app(self, app, on_open=None):
+        self.app = app
+        self.mode = app.config.get('TENANT_MODE') or None
+        if self.mode not in (None, 'host', 'path'):
+            raise ValueError(f'Неизвестный TENANT_MODE: {self.mode}')
+        self.root = Path(app.config.get('TENANTS_DIR') or os.path.join(app.instance_path, 'tenants'))
+        self.hosts = {host.lower(): slug for host, slug in (app.config.get('TENANT_HOSTS') or {}).items()}
+        self.base_domain = (app.config.get('TENANT_BASE_DOMAIN') or '').strip('.').lower() or None
+        self.idle_timeout = float(app.config.get('TENANT_IDLE_TIMEOUT', self.idle_timeout))
+        self.fanout_workers = int(app.config.get('TENANT_FANOUT_WORKERS', self.fanout_workers))
+        self.engine_options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        self.on_open = on_open or self.on_open
+        app.extensions['tenants'] = self
+        if self.mode is None:
+            return
+        if self.mode == 'host' and not (self.hosts or self.base_domain):
+            raise ValueError('TENANT_MODE=host требует TENANT_HOSTS или TENANT_BASE_DOMAIN')
+
+        app.session_interface = _TenantSessionInterface(self)
+        if self.mode == 'path':
+            app.wsgi_app = _PathPrefixMiddleware(app.wsgi_app)
+        # Школа выбирается раньше остальных обработчиков: они уже могут обращаться к базе
+        app.before_request_funcs.setdefault(None, []).insert(0, self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    # ---------- Выбор школы ----------
+
+    def current(self):
+        """Школа текущего запроса или контекста activate(); None — режим одной школы"""
+        return _current.get()
+
+    def url_slug(self, req):
+        """Школа из хоста или префикса пути; None — адрес не указывает на школу"""
+        if self.mode == 'path':
+            return req.environ.get(ENVIRON_KEY)
+        host = req.host.split(':', 1)[0].lower()
+        if host in self.hosts:
+            return self.hosts[host]
+        # Только <slug>.base_domain: www., голый IP и чужие домены школой не считаются
+        if self.base_domain and host.endswith('.' + self.base_domain):
+            label = host[:-len(self.base_domain) - 1]
+            if '.' not in label:
+                return label
+        return None
+
+    def slug_for_request(self):
+        # Префикса нет у абсолютных ссылок из JS (/api/...): берём школу, открытую последней
+        return getattr(session, 'tenant', None) or self.url_slug(request)
+
+    def exists(self, slug):
+        return bool(slug) and SLUG_RE.match(slug) is not None and self.root.joinpath(slug).is_dir()
+
+    def slugs(self):
+        if not self.root.is_dir():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir() and SLUG_RE.match(p.name))
+
+    def _before_request(self):
+        slug = self.slug_for_request()
+        if not self.exists(slug):
+            abort(404)
+        g._tenant = self.acquire(slug)
+        g._tenant_token = _current.set(g._tenant)
+        outer = getattr(session, 'outer', None)
+        if outer is not None and outer.get('tenant') != slug:
+            outer['tenant'] = slug
+
+    def _teardown_request(self, exc=None):
+        token = g.pop('_tenant_token', None)
+        tenant = g.pop('_tenant', None)
+        if token is not None:
+            _current.reset(token)
+        if tenant is not None:
+            self.release(tenant)
+
+    # ---------- Открытие и закрытие ----------
+
+    def acquire(self, slug):
+        """Школа с открытым движком; парный вызов release обязателен"""
+        now = time.monotonic()
+        with self._lock:
+            tenant = self._tenants.get(slug)
+            if tenant is None:
+                tenant = self._tenants[slug] = Tenant(slug, self.root / slug)
+            tenant.active += 1
+            tenant.last_used = now
+            sweep = now >= self._next_sweep
+            if sweep:
+                self._next_sweep = now + self.idle_timeout / 2
+        if not tenant.ready:
+            # Открытие (и миграция схемы) одной школы не держит общую блокировку
+            try:
+                with tenant.open_lock:
+                    if not tenant.ready:
+                        self._open(tenant)
+            except BaseException:
+                self.release(tenant)
+                raise
+        if sweep:
+            self.close_idle()
+        return tenant
+
+    def release(self, tenant):
+        with self._lock:
+            tenant.active -= 1
+            tenant.last_used = time.monotonic()
+
+    def _open(self, tenant):
+        tenant.root.mkdir(parents=True, exist_ok=True)
+        engine = create_engine(f'sqlite:///{tenant.database_path}', **self.engine_options)
+        tenant.engines = MappingProxyType({None: engine})
+        token = _current.set(tenant)
+        try:
+            tenant.engine = engine
+            if self.on_open is not None:
+                self.on_open(tenant)
+            tenant.ready = True
+        except BaseException:
+            tenant.engine = None
+            tenant.engines = MappingProxyType({})
+            engine.dispose()
+            raise
+        finally:
+            _current.reset(token)
+
+    def close_idle(self, idle_timeout=None):
+        """Закрывает пулы школ без запросов дольше idle_timeout секунд; возвращает их slug"""
+        idle_timeout = self.idle_timeout if idle_timeout is None else idle_timeout
+        deadline = time.monotonic() - idle_timeout
+        with self._lock:
+            idle = [t for t in self._tenants.values() if t.active == 0 and t.last_used <= deadline]
+            for tenant in idle:
+                # Следующий acquire создаст новый Tenant, этот движок больше никому не выдаётся
+                del self._tenants[tenant.slug]
+        for tenant in idle:
+            with tenant.open_lock:
+                if tenant.engine is not None:
+                    tenant.ready = False
+                    tenant.engine.dispose()
+                    tenant.engine = None
+        return [tenant.slug for tenant in idle]
+
+    def open_slugs(self):
+        with self._lock:
+            return sorted(slug for slug, t in self._tenants.items() if t.ready)
+
+    @contextmanager
+    def activate(self, slug):
+        """Контекст школы вне запроса (CLI, фоновые задачи); None — режим одной школы"""
+        if slug is None:
+            yield None
+            return
+        tenant = self.acquire(slug)
+        token = _current.set(tenant)
+        try:
+            yield tenant
+        finally:
+            _current.reset(token)
+            self.release(tenant)
+
+    # ---------- Запросы ко всем школам ----------
+
+    def fan_out(self, fn, slugs=None):
+        """
+        fn(slug) параллельно для каждой школы, в её контексте и своём app context.
+        Возвращает ({slug: результат}, {slug: исключение}).
+        """
+        slugs = self.slugs() if slugs is None else list(slugs)
+
+        def run(slug):
+            with self.activate(slug), self.app.app_context():
+                return fn(slug)
+
+        results, errors = {}, {}
+        if not slugs:
+            return results, errors
+        with ThreadPoolExecutor(max_workers=min(self.fanout_workers, len(slugs))) as executor:
+            futures = {slug: executor.submit(run, slug) for slug in slugs}
+            for slug, future in futures.items():
+                try:
+                    results[slug] = future.result()
+                except Exception as exc:
+                    errors[slug] = exc
+                    self.app.logger.exception('Школа %s: ошибка при обходе всех школ', slug)
+        return results, errors
+
+
+class TenantSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy, у которого движок по умолчанию — движок школы текущего запроса"""
+
+    @property
+    def engines(self):
+        tenant = _current.get()
+        if tenant is not None and tenant.engine is not None:
+            return tenant.engines
+        return super().engines
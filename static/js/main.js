@@ -87,8 +87,7 @@ function toggleNotifications() {
 }
 
 function loadNotifications() {
-    fetch('/api/notifications')
-        .then(res => res.json())
+    conditionalFetch('/api/notifications')
         .then(data => {
             const list = document.getElementById('notifications-list');
             const badge = document.getElementById('notification-badge');
@@ -113,8 +112,10 @@ function loadNotifications() {
                 badge.classList.remove('flex');
             }
             
-            // Mark as read
-            fetch('/api/notifications/read', { method: 'POST' });
+            // Mark as read (только если есть что отмечать)
+            if (data.unread_count > 0) {
+                fetch('/api/notifications/read', { method: 'POST' });
+            }
         })
         .catch(err => {
             console.error('Error loading notifications:', err);
@@ -170,12 +171,18 @@ document.addEventListener('keydown', (e) => {
 // ============================================
 // FETCH HELPER
 // ============================================
+// Дольше таймаута service worker'а: записи без связи он успевает поставить в очередь
+const API_TIMEOUT_MS = 10000;
+
 async function apiRequest(url, method = 'GET', data = null) {
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), API_TIMEOUT_MS);
     const options = {
         method,
         headers: {
             'Content-Type': 'application/json',
         },
+        signal: controller.signal,
     };
     
     if (data) {
@@ -185,12 +192,80 @@ async function apiRequest(url, method = 'GET', data = null) {
     try {
         const response = await fetch(url, options);
         const result = await response.json();
+        if (result && result.queued) {
+            showToast(result.message, 'info');
+        }
         return result;
     } catch (error) {
         console.error('API Error:', error);
-        showToast('Произошла ошибка', 'error');
+        showToast(error.name === 'AbortError' ? 'Сервер не отвечает, попробуйте позже' : 'Произошла ошибка', 'error');
         return null;
+    } finally {
+        clearTimeout(timer);
+    }
+}
+
+// GET с валидатором: ETag и тело ответа хранятся в sessionStorage,
+// при неизменных данных сервер отвечает 304 без тела и берётся сохранённая копия
+async function conditionalFetch(url) {
+    const cacheKey = 'etag:' + url;
+    const cached = JSON.parse(sessionStorage.getItem(cacheKey) || 'null');
+    const headers = cached ? { 'If-None-Match': cached.etag } : {};
+    const response = await fetch(url, { headers });
+
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (etag) {
+        try {
+            sessionStorage.setItem(cacheKey, JSON.stringify({ etag, data }));
+        } catch (e) {
+            // Переполненное хранилище — просто работаем без кеша
+        }
     }
+    return data;
+}
+
+// ============================================
+// SERVICE WORKER (offline)
+// ============================================
+// Сообщает service worker'у текущего пользователя и ассеты страницы
+function syncServiceWorkerSession(registration) {
+    const worker = navigator.serviceWorker.controller || registration.active;
+    if (!worker) return;
+    const assets = [
+        ...document.querySelectorAll('link[rel="stylesheet"][href]'),
+        ...document.querySelectorAll('script[src]'),
+    ].map(el => el.href || el.src);
+    worker.postMessage({ type: 'session', userId: document.body.dataset.userId || null, assets });
+}
+
+function registerServiceWorker() {
+    if (!('serviceWorker' in navigator)) return;
+
+    navigator.serviceWorker.register('/sw.js')
+        .then(() => navigator.serviceWorker.ready)
+        .then(syncServiceWorkerSession)
+        .catch(err => console.error('Service worker registration failed:', err));
+
+    // Результаты запросов, отправленных из офлайн-очереди
+    navigator.serviceWorker.addEventListener('message', (event) => {
+        const message = event.data || {};
+        if (message.type === 'queue-replayed') {
+            const data = message.data || {};
+            showToast(data.message || 'Отложенный запрос отправлен', data.success ? 'success' : 'error');
+        } else if (message.type === 'queue-expired') {
+            showToast('Отложенный запрос устарел и не был отправлен', 'error');
+        }
+    });
+
+    window.addEventListener('online', () => {
+        if (navigator.serviceWorker.controller) {
+            navigator.serviceWorker.controller.postMessage({ type: 'replay' });
+        }
+    });
 }
 
 // ============================================
@@ -318,6 +393,8 @@ function removeFromStorage(key) {
 // INITIALIZATION
 // ============================================
 document.addEventListener('DOMContentLoaded', () => {
+    registerServiceWorker();
+
     // Auto-hide flash messages after 5 seconds
     const alerts = document.querySelectorAll('.alert');
     alerts.forEach(alert => {
@@ -331,8 +408,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // Load notification count on page load
     const notificationBadge = document.getElementById('notification-badge');
     if (notificationBadge) {
-        fetch('/api/notifications')
-            .then(res => res.json())
+        conditionalFetch('/api/notifications')
             .then(data => {
                 if (data.unread_count > 0) {
                     notificationBadge.textContent = data.unread_count;
@@ -352,6 +428,7 @@ window.toggleNotifications = toggleNotifications;
 window.openModal = openModal;
 window.closeModal = closeModal;
 window.apiRequest = apiRequest;
+window.conditionalFetch = conditionalFetch;
 window.formatCurrency = formatCurrency;
 window.formatDate = formatDate;
 window.formatDateTime = formatDateTime;
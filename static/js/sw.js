@@ -0,0 +1,383 @@
+/* ============================================
+   SCHOOL FOOD SYSTEM - SERVICE WORKER
+   ============================================
+   Отдаётся из корня (/sw.js), чтобы управлять всеми страницами.
+   - ассеты и CDN-скрипты: из кеша, сеть — только при промахе;
+   - меню и страница предзаказа: последний снимок сразу, обновление в фоне;
+   - оформление заказа, предзаказ и отзыв без связи: в очередь IndexedDB
+     с Idempotency-Key и повторная отправка пачками, когда связь вернётся.
+   При изменении логики кеширования увеличить CACHE_VERSION. */
+
+const CACHE_VERSION = 'v1';
+const ASSET_CACHE = `assets-${CACHE_VERSION}`;
+const PAGE_CACHE = `pages-${CACHE_VERSION}`;
+const ASSET_CACHE_LIMIT = 40;
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'cdnjs.cloudflare.com'];
+
+// Страницы, которые отдаются из кеша сразу и обновляются в фоне
+const SNAPSHOT_PAGES = ['/student/menu', '/student/create_order'];
+// Записи, которые без связи откладываются в очередь
+const QUEUED_WRITES = ['/api/cart/checkout', '/api/create_order', '/api/review'];
+// Ответы, после которых запрос из очереди стоит повторить позже
+const RETRY_STATUSES = [429, 502, 503, 504];
+
+const NETWORK_TIMEOUT_MS = 8000;
+// Меньше IDEMPOTENCY_RETENTION_DAYS на сервере: пока запрос в очереди, сервер помнит его ключ.
+// Более старые заказы уже неактуальны и удаляются без отправки
+const QUEUE_MAX_AGE_MS = 12 * 60 * 60 * 1000;
+const REPLAY_BATCH_SIZE = 5;
+const REPLAY_PAUSE_MS = 1000;
+const REPLAY_MIN_BACKOFF_MS = 2000;
+const REPLAY_MAX_BACKOFF_MS = 60000;
+
+const DB_NAME = 'school-food-offline';
+const SYNC_TAG = 'replay-queue';
+
+// ============================================
+// LIFECYCLE
+// ============================================
+self.addEventListener('install', () => {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const keep = [ASSET_CACHE, PAGE_CACHE];
+        const names = await caches.keys();
+        await Promise.all(names.filter(name => !keep.includes(name)).map(name => caches.delete(name)));
+        await self.clients.claim();
+    })());
+});
+
+// ============================================
+// INDEXEDDB
+// ============================================
+let dbPromise = null;
+
+function openDb() {
+    if (!dbPromise) {
+        dbPromise = new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                db.createObjectStore('queue', { keyPath: 'key' }).createIndex('created', 'created');
+                db.createObjectStore('meta', { keyPath: 'name' });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => {
+                dbPromise = null;
+                reject(request.error);
+            };
+        });
+    }
+    return dbPromise;
+}
+
+// Одна транзакция над хранилищем; fn возвращает IDBRequest, результат — его result
+async function idb(storeName, mode, fn) {
+    const db = await openDb();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(storeName, mode);
+        const request = fn(tx.objectStore(storeName));
+        tx.oncomplete = () => resolve(request ? request.result : undefined);
+        tx.onerror = () => reject(tx.error);
+        tx.onabort = () => reject(tx.error);
+    });
+}
+
+const enqueue = (item) => idb('queue', 'readwrite', store => store.put(item));
+const removeQueued = (key) => idb('queue', 'readwrite', store => store.delete(key));
+const queuedItems = () => idb('queue', 'readonly', store => store.index('created').getAll());
+
+async function currentUserId() {
+    const row = await idb('meta', 'readonly', store => store.get('userId'));
+    return row ? row.value : null;
+}
+
+const setCurrentUserId = (userId) => idb('meta', 'readwrite', store => store.put({ name: 'userId', value: userId }));
+
+// ============================================
+// NETWORK HELPERS
+// ============================================
+function fetchWithTimeout(resource, options = {}) {
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), NETWORK_TIMEOUT_MS);
+    return fetch(resource, { ...options, signal: controller.signal }).finally(() => clearTimeout(timer));
+}
+
+function jsonResponse(data, status) {
+    return new Response(JSON.stringify(data), {
+        status,
+        headers: { 'Content-Type': 'application/json' },
+    });
+}
+
+function offlinePage() {
+    return new Response(
+        '<!DOCTYPE html><html lang="ru"><meta charset="UTF-8"><title>Нет связи</title>' +
+        '<body style="font-family:sans-serif;text-align:center;padding:3rem">' +
+        '<h1>Нет связи с сервером</h1><p>Страница откроется, когда связь восстановится.</p></body></html>',
+        { status: 503, headers: { 'Content-Type': 'text/html; charset=utf-8' } }
+    );
+}
+
+// Страница пригодна для снимка: не редирект на вход и не ошибка
+function cacheable(response) {
+    return response.ok && !response.redirected && response.type === 'basic';
+}
+
+async function trimCache(name, limit) {
+    const cache = await caches.open(name);
+    const keys = await cache.keys();
+    await Promise.all(keys.slice(0, Math.max(0, keys.length - limit)).map(key => cache.delete(key)));
+}
+
+// ============================================
+// CACHING STRATEGIES
+// ============================================
+async function cacheFirst(request) {
+    const cache = await caches.open(ASSET_CACHE);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+
+    const response = await fetch(request);
+    if (response.ok) {
+        await cache.put(request, response.clone());
+        trimCache(ASSET_CACHE, ASSET_CACHE_LIMIT);
+    }
+    return response;
+}
+
+async function staleWhileRevalidate(event, cacheName) {
+    const request = event.request;
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+
+    const network = fetchWithTimeout(request).then(async (response) => {
+        if (cacheable(response)) {
+            await cache.put(request, response.clone());
+        }
+        return response;
+    });
+
+    if (cached) {
+        event.waitUntil(network.catch(() => {}));
+        return cached;
+    }
+    return network.catch(() => (request.mode === 'navigate' ? offlinePage() : Response.error()));
+}
+
+async function networkFirst(request) {
+    try {
+        return await fetchWithTimeout(request);
+    } catch (e) {
+        const cached = await caches.match(request);
+        return cached || offlinePage();
+    }
+}
+
+// ============================================
+// OFFLINE WRITE QUEUE
+// ============================================
+function sendQueued(item) {
+    const headers = { 'Content-Type': item.contentType, 'Idempotency-Key': item.key };
+    if (item.userId) {
+        headers['X-Queued-For'] = item.userId;
+    }
+    return fetchWithTimeout(item.url, {
+        method: 'POST',
+        headers,
+        body: item.body,
+        credentials: 'same-origin',
+    });
+}
+
+async function sendOrQueue(request) {
+    const item = {
+        // Ключ выдаётся один раз: первая попытка и все повторы сервер выполнит не больше одного раза
+        key: request.headers.get('Idempotency-Key') || crypto.randomUUID(),
+        url: request.url,
+        contentType: request.headers.get('Content-Type') || 'application/json',
+        body: await request.text(),
+        userId: await currentUserId(),
+        created: Date.now(),
+    };
+
+    try {
+        const response = await sendQueued(item);
+        if (!RETRY_STATUSES.includes(response.status)) {
+            return response;
+        }
+    } catch (e) {
+        // Нет сети или сервер не ответил за NETWORK_TIMEOUT_MS — запрос мог и дойти, ключ это покроет
+    }
+
+    await enqueue(item);
+    requestReplay();
+    return jsonResponse({
+        success: true,
+        queued: true,
+        message: 'Нет связи: запрос сохранён и будет отправлен автоматически',
+    }, 202);
+}
+
+async function readJson(response) {
+    // Истёкшая сессия: login_required перенаправляет на страницу входа
+    if (response.redirected || !(response.headers.get('Content-Type') || '').includes('application/json')) {
+        return null;
+    }
+    try {
+        return await response.json();
+    } catch (e) {
+        return null;
+    }
+}
+
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage(message));
+}
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+// Случайный разброс, чтобы устройства класса не повторяли запросы одновременно
+const jitter = (ms) => ms * (0.5 + Math.random());
+
+let replaying = null;
+let replayTimer = null;
+let backoff = 0;
+
+function requestReplay(delay = 0) {
+    if (self.registration.sync) {
+        self.registration.sync.register(SYNC_TAG).catch(() => {});
+    }
+    if (replayTimer) return;
+    replayTimer = setTimeout(() => {
+        replayTimer = null;
+        replayQueue();
+    }, jitter(delay || REPLAY_PAUSE_MS));
+}
+
+function retryLater(retryAfterSeconds = 0) {
+    backoff = Math.min(Math.max(backoff * 2, REPLAY_MIN_BACKOFF_MS, retryAfterSeconds * 1000), REPLAY_MAX_BACKOFF_MS);
+    requestReplay(backoff);
+}
+
+// Отправляет очередь по REPLAY_BATCH_SIZE запросов с паузой между пачками;
+// при первой сетевой ошибке останавливается и ждёт с экспоненциальной задержкой
+function replayQueue() {
+    if (replaying) return replaying;
+    replaying = (async () => {
+        const userId = await currentUserId();
+        if (!userId) return;  // не выполнен вход: повторим, когда страница сообщит о сессии
+        const items = await queuedItems();
+
+        for (let start = 0; start < items.length; start += REPLAY_BATCH_SIZE) {
+            if (start > 0) {
+                await sleep(jitter(REPLAY_PAUSE_MS));
+            }
+            for (const item of items.slice(start, start + REPLAY_BATCH_SIZE)) {
+                if (Date.now() - item.created > QUEUE_MAX_AGE_MS) {
+                    await removeQueued(item.key);
+                    notifyClients({ type: 'queue-expired', url: item.url });
+                    continue;
+                }
+                if (item.userId && item.userId !== userId) {
+                    continue;  // запрос другого пользователя ждёт его входа
+                }
+
+                let response;
+                try {
+                    response = await sendQueued(item);
+                } catch (e) {
+                    return retryLater();
+                }
+                const data = await readJson(response);
+                if (data === null || RETRY_STATUSES.includes(response.status) || (data && data.in_progress)) {
+                    return retryLater(Number(response.headers.get('Retry-After')) || 0);
+                }
+                if (data.wrong_user) {
+                    continue;
+                }
+                await removeQueued(item.key);
+                notifyClients({ type: 'queue-replayed', url: item.url, status: response.status, data });
+            }
+        }
+        backoff = 0;
+    })().finally(() => {
+        replaying = null;
+    });
+    return replaying;
+}
+
+// ============================================
+// EVENTS
+// ============================================
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    const url = new URL(request.url);
+    const sameOrigin = url.origin === self.location.origin;
+
+    if (request.method === 'POST' && sameOrigin && QUEUED_WRITES.includes(url.pathname)) {
+        event.respondWith(sendOrQueue(request));
+        return;
+    }
+    if (request.method !== 'GET') return;
+
+    if ((sameOrigin && url.pathname.startsWith('/assets/')) || CDN_HOSTS.includes(url.hostname)) {
+        // Имена собранных ассетов содержат хеш, CDN-ссылки — версию
+        event.respondWith(cacheFirst(request));
+    } else if (sameOrigin && url.pathname.startsWith('/static/')) {
+        event.respondWith(staleWhileRevalidate(event, ASSET_CACHE));
+    } else if (request.mode === 'navigate' && sameOrigin && SNAPSHOT_PAGES.includes(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(event, PAGE_CACHE));
+    } else if (request.mode === 'navigate' && sameOrigin) {
+        event.respondWith(networkFirst(request));
+    }
+});
+
+self.addEventListener('sync', (event) => {
+    if (event.tag === SYNC_TAG) {
+        event.waitUntil(replayQueue());
+    }
+});
+
+async function warmCaches(assets, userId) {
+    const assetCache = await caches.open(ASSET_CACHE);
+    await Promise.all(assets.map(async (url) => {
+        if (!(await assetCache.match(url))) {
+            await assetCache.add(url).catch(() => {});
+        }
+    }));
+    if (!userId) return;
+
+    // Снимки страниц — заранее, чтобы меню открылось и без связи; чужие роли получат редирект и не сохранятся
+    const pageCache = await caches.open(PAGE_CACHE);
+    await Promise.all(SNAPSHOT_PAGES.map(async (path) => {
+        if (await pageCache.match(path)) return;
+        try {
+            const response = await fetchWithTimeout(path, { credentials: 'same-origin' });
+            if (cacheable(response)) {
+                await pageCache.put(path, response);
+            }
+        } catch (e) {
+            // Нет связи — снимок появится при следующем открытии страницы
+        }
+    }));
+}
+
+self.addEventListener('message', (event) => {
+    const message = event.data || {};
+    if (message.type === 'session') {
+        // Страница сообщает текущего пользователя и ассеты, которые она подключила
+        const userId = message.userId || null;
+        event.waitUntil(
+            currentUserId()
+                .then(previous => (previous && previous !== userId ? caches.delete(PAGE_CACHE) : null))
+                .then(() => setCurrentUserId(userId))
+                .then(() => warmCaches(message.assets || [], userId))
+                .then(() => replayQueue())
+        );
+    } else if (message.type === 'replay') {
+        event.waitUntil(replayQueue());
+    }
+});
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# app.py читает настройки из окружения при импорте, поэтому всё задаётся до import app:
+# база и файлы — во временной папке, фоновые потоки выдачи и событий пишут сразу
+WORKDIR = tempfile.mkdtemp(prefix='school-food-tests-')
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+    'ORDERS_FILE': os.path.join(WORKDIR, 'orders.json'),
+    'REPORTS_DIR': os.path.join(WORKDIR, 'reports'),
+    'WEEKS_DIR': os.path.join(WORKDIR, 'weeks'),
+    'TENANTS_DIR': os.path.join(WORKDIR, 'tenants'),
+    'EVENTS_DISPATCH_INTERVAL': '0',
+    'SERVED_FLUSH_INTERVAL': '0',
+    'ASSETS_AUTO_BUILD': '0',
+    # Лимиты проверяются отдельными тестами: остальные логинятся много раз с одного адреса
+    'RATE_LIMIT_ENABLED': '0',
+})
+os.environ.pop('TENANT_MODE', None)
+
+PASSWORD = '123456'
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app as app_module
+
+    app_module.app.config['TESTING'] = True
+    yield app_module
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def fresh_db(app_module):
+    """Пустая база с тестовыми данными init_db (ученик, повар, админ, меню, продукты)"""
+    with app_module.app.app_context():
+        app_module.db.session.remove()
+        app_module.db.drop_all()
+    if os.path.exists(app_module.app.config['ORDERS_FILE']):
+        os.remove(app_module.app.config['ORDERS_FILE'])
+    app_module.init_db(force=True)
+    return app_module
+
+
+@pytest.fixture
+def login(fresh_db):
+    """login('student@school.ru') -> test client с открытой сессией"""
+    def login(email, password=PASSWORD):
+        client = fresh_db.app.test_client()
+        response = client.post('/login', data={'email': email, 'password': password})
+        assert response.status_code == 302, f'не удалось войти как {email}'
+        return client
+    return login
@@ -0,0 +1,35 @@
+import io
+
+PASSWORD_HASH = 'x'
+
+
+def _add_user(app_module, **fields):
+    with app_module.app.app_context():
+        app_module.db.session.add(app_module.User(password_hash=PASSWORD_HASH, **fields))
+        app_module.db.session.commit()
+
+
+def test_import_skips_existing_email_in_other_case(fresh_db):
+    _add_user(fresh_db, email='Pavel.Orlov@School.ru', name='Орлов Павел', role='student')
+    csv_text = 'email,name\npavel.orlov@school.ru,Орлов Павел\nnew@school.ru,Новый Ученик\n'
+    with fresh_db.app.app_context():
+        result = fresh_db.import_users_csv(io.StringIO(csv_text))
+    assert [c['email'] for c in result['created']] == ['new@school.ru']
+    assert [e['email'] for e in result['errors']] == ['pavel.orlov@school.ru']
+
+
+def _search(client, q):
+    response = client.get('/api/admin/users', query_string={'q': q, 'sort': 'id'})
+    assert response.status_code == 200
+    return [u['name'] for u in response.get_json()['users']]
+
+
+def test_name_search_ignores_case(login):
+    client = login('admin@school.ru')
+    assert _search(client, 'петров') == ['Петров Алексей']
+    assert _search(client, 'ПЕТРОВ АЛ') == ['Петров Алексей']
+
+
+def test_name_search_finds_characters_past_bmp(fresh_db, login):
+    _add_user(fresh_db, email='li@school.ru', name='Ли😀', role='student')
+    assert _search(login('admin@school.ru'), 'ли') == ['Ли😀']
@@ -0,0 +1,30 @@
+def _student(login):
+    student = login('student@school.ru')
+    # Первая страница после входа показывает flash и идёт без ETag
+    student.get('/student/menu')
+    return student
+
+
+def test_menu_revalidates_until_data_changes(login):
+    student = _student(login)
+    first = student.get('/student/menu')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    cached = student.get('/student/menu', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == etag
+
+
+def test_balance_change_invalidates_menu_etag(login):
+    student = _student(login)
+    etag = student.get('/student/menu').headers['ETag']
+
+    # Баланс выводится в шапке меню, но не входит в версии данных
+    response = student.post('/api/topup', json={'amount': 100})
+    assert response.get_json()['success']
+
+    refreshed = student.get('/student/menu', headers={'If-None-Match': etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers['ETag'] != etag
+    assert '1600' in refreshed.get_data(as_text=True)
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+
+def _checkout_payload(app_module):
+    with app_module.app.app_context():
+        item = app_module.MenuItem.query.filter_by(available=True).first()
+        return {'items': [{'id': item.id, 'name': item.name, 'price': item.price, 'type': item.meal_type}]}
+
+
+def _order_count(app_module):
+    with app_module.app.app_context():
+        return app_module.Order.query.count()
+
+
+def test_retry_replays_stored_response(login, fresh_db):
+    student = login('student@school.ru')
+    payload = _checkout_payload(fresh_db)
+    headers = {'Idempotency-Key': 'checkout-1'}
+
+    first = student.post('/api/cart/checkout', json=payload, headers=headers)
+    assert first.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+
+    replay = student.post('/api/cart/checkout', json=payload, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.get_json() == first.get_json()
+    # Заказ создан и баланс списан один раз
+    assert _order_count(fresh_db) == 1
+
+    student.post('/api/cart/checkout', json=payload, headers={'Idempotency-Key': 'checkout-2'})
+    assert _order_count(fresh_db) == 2
+
+
+def test_key_in_progress_gets_409(login, fresh_db):
+    student = login('student@school.ru')
+    with fresh_db.app.app_context():
+        user = fresh_db.User.query.filter_by(email='student@school.ru').one()
+        # Первый запрос с этим ключом занял его, но ещё не сохранил ответ
+        fresh_db.db.session.add(fresh_db.IdempotencyKey(user_id=user.id, key='busy', endpoint='checkout',
+                                                        created_at=datetime.utcnow()))
+        fresh_db.db.session.commit()
+
+    response = student.post('/api/cart/checkout', json=_checkout_payload(fresh_db),
+                            headers={'Idempotency-Key': 'busy'})
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert response.get_json()['in_progress']
+    assert _order_count(fresh_db) == 0
+
+
+def test_key_reused_for_other_endpoint_gets_422(login, fresh_db):
+    student = login('student@school.ru')
+    payload = _checkout_payload(fresh_db)
+    headers = {'Idempotency-Key': 'shared'}
+    assert student.post('/api/cart/checkout', json=payload, headers=headers).status_code == 200
+
+    response = student.post('/api/review', json={'menu_item_id': payload['items'][0]['id'], 'rating': 5},
+                            headers=headers)
+    assert response.status_code == 422
+    with fresh_db.app.app_context():
+        assert fresh_db.Review.query.count() == 0
+
+
+def test_queued_request_of_other_user_is_rejected(login, fresh_db):
+    student = login('student@school.ru')
+    response = student.post('/api/cart/checkout', json=_checkout_payload(fresh_db),
+                            headers={'Idempotency-Key': 'queued', 'X-Queued-For': '999'})
+    assert response.status_code == 409
+    assert response.get_json()['wrong_user']
+    assert _order_count(fresh_db) == 0
@@ -0,0 +1,19 @@
+import threading
+
+from instance.orders_store import read_orders, update_orders
+
+
+def test_writes_to_different_files_do_not_wait_for_each_other(tmp_path):
+    first, second = tmp_path / 'a' / 'orders.json', tmp_path / 'b' / 'orders.json'
+
+    def write_second(orders):
+        # Пока держится блокировка первого файла, второй записывается из другого потока
+        writer = threading.Thread(target=update_orders, args=(second, lambda o: o.update(monday={})), daemon=True)
+        writer.start()
+        writer.join(timeout=2)
+        assert not writer.is_alive(), 'запись второго файла ждёт блокировку первого'
+        orders['monday'] = {'user1': {'1': 1}}
+
+    update_orders(first, write_second)
+    assert read_orders(first) == {'monday': {'user1': {'1': 1}}}
+    assert read_orders(second) == {'monday': {}}
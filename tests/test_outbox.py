@@ -0,0 +1,95 @@
+import pytest
+
+from instance.events import Subscriber
+
+
+@pytest.fixture
+def bus(fresh_db, monkeypatch):
+    """Подписчики теста регистрируются на время теста; в конфиге тестов доставка синхронная"""
+    monkeypatch.setattr(fresh_db.events, 'subscribers', dict(fresh_db.events.subscribers))
+    return fresh_db.events
+
+
+def _publish(app_module, topic, **payload):
+    with app_module.app.app_context():
+        app_module.events.publish(topic, payload)
+        app_module.db.session.commit()
+
+
+def _checkpoint(app_module, name):
+    with app_module.app.app_context():
+        row = app_module.db.session.get(app_module.OutboxCheckpoint, name)
+        return row and row.last_event_id
+
+
+def _latest_event_id(app_module):
+    with app_module.app.app_context():
+        db = app_module.db
+        return db.session.execute(db.select(db.func.max(app_module.OutboxEvent.id))).scalar()
+
+
+def test_failed_batch_is_redelivered(fresh_db, bus):
+    received, failures = [], [RuntimeError('первая доставка')]
+
+    @bus.subscribe('test_flaky', 'test.ping')
+    def flaky(batch):
+        received.append([event.payload['n'] for event in batch])
+        if failures:
+            raise failures.pop()
+
+    _publish(fresh_db, 'test.ping', n=1)
+    # Ошибка подписчика не сдвигает checkpoint, пачка остаётся в очереди на доставку
+    assert received == [[1]]
+    assert _checkpoint(fresh_db, 'test_flaky') is None
+
+    bus.dispatch_pending()
+    assert received == [[1], [1]]
+    assert _checkpoint(fresh_db, 'test_flaky') == _latest_event_id(fresh_db)
+
+
+def test_checkpoint_advances_past_other_topics(fresh_db, bus):
+    received = []
+    bus.subscribe('test_pings', 'test.ping')(lambda batch: received.extend(e.payload['n'] for e in batch))
+
+    _publish(fresh_db, 'test.other', n=1)
+    _publish(fresh_db, 'test.ping', n=2)
+    _publish(fresh_db, 'test.other', n=3)
+
+    assert received == [2]
+    assert _checkpoint(fresh_db, 'test_pings') == _latest_event_id(fresh_db)
+    # Повторный обход после checkpoint ничего не доставляет
+    assert bus.dispatch(bus.subscribers['test_pings'], None, bus.batch_size) == 0
+    assert received == [2]
+
+
+def _order_count(app_module, item_id):
+    with app_module.app.app_context():
+        stats = app_module.db.session.get(app_module.MenuItemStats, item_id)
+        return stats.order_count if stats else 0
+
+
+def test_redelivery_does_not_apply_changes_twice(login, fresh_db, bus):
+    # Подписчик успевает записать изменения и падает: они откатываются вместе с checkpoint
+    stats = bus.subscribers['menu_item_stats']
+    failures = [RuntimeError('после записи')]
+
+    def apply_then_fail(batch):
+        stats.handler(batch)
+        if failures:
+            raise failures.pop()
+
+    bus.subscribers['menu_item_stats'] = Subscriber(stats.name, stats.topics, apply_then_fail)
+
+    with fresh_db.app.app_context():
+        item = fresh_db.MenuItem.query.filter_by(available=True).first()
+        item_id, payload = item.id, {'items': [{'id': item.id, 'name': item.name, 'price': item.price,
+                                                'type': item.meal_type}]}
+    before = _order_count(fresh_db, item_id)
+
+    student = login('student@school.ru')
+    assert student.post('/api/cart/checkout', json=payload).get_json()['success']
+    bus.dispatch_pending()
+
+    assert not failures
+    assert _order_count(fresh_db, item_id) == before + 1
+    assert _checkpoint(fresh_db, 'menu_item_stats') == _latest_event_id(fresh_db)
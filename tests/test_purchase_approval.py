@@ -0,0 +1,60 @@
+import multiprocessing
+import random
+from collections import Counter
+
+from benchmarks.concurrency import INITIAL_QUANTITY, _prepare, _verify
+
+WORKERS = 4
+PRODUCTS = 3
+REQUESTS = 200
+BATCH = 10
+
+
+def _approve(seed_and_ids):
+    # Отдельный процесс (spawn) с тем же окружением, что у тестов, — та же файловая база
+    seed, request_ids = seed_and_ids
+    import app as app_module
+
+    rng = random.Random(seed)
+    ids = list(request_ids)
+    rng.shuffle(ids)
+    approved = []
+    with app_module.app.app_context():
+        for start in range(0, len(ids), BATCH):
+            approved += app_module.approve_purchase_requests(ids[start:start + BATCH], f'worker-{seed}')
+    return approved
+
+
+def test_parallel_approval_is_exactly_once(fresh_db):
+    request_ids = _prepare(fresh_db, PRODUCTS, REQUESTS, random.Random(1))
+
+    with multiprocessing.get_context('spawn').Pool(WORKERS) as pool:
+        parts = pool.map(_approve, [(seed, request_ids) for seed in range(WORKERS)])
+    approved = [request_id for part in parts for request_id in part]
+
+    assert Counter(approved) == Counter(request_ids)
+    assert _verify(fresh_db, approved) == []
+
+
+def test_approval_updates_stock_and_ledger(fresh_db):
+    app_module = fresh_db
+    db = app_module.db
+    request_ids = _prepare(app_module, 1, 3, random.Random(2))
+
+    with app_module.app.app_context():
+        assert app_module.approve_purchase_requests(request_ids[:2], 'admin') == request_ids[:2]
+        # Повторное одобрение уже одобренных заявок ничего не меняет
+        assert app_module.approve_purchase_requests(request_ids, 'admin') == request_ids[2:]
+        assert app_module.approve_purchase_requests(request_ids, 'admin') == []
+
+        total = db.session.execute(db.select(db.func.sum(app_module.PurchaseRequest.quantity))).scalar()
+        product = db.session.execute(db.select(app_module.Product)).scalar_one()
+        assert product.quantity == INITIAL_QUANTITY + total
+        ledger = db.session.execute(db.select(db.func.sum(app_module.InventoryMovement.delta))).scalar()
+        assert ledger == total
+
+
+def test_bulk_endpoint_rejects_bad_ids(login):
+    admin = login('admin@school.ru')
+    response = admin.post('/api/requests/bulk', json={'ids': ['x'], 'action': 'approve'})
+    assert response.status_code == 400
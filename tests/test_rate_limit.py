@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from instance.rate_limit import Limit, MemoryBackend, RateLimiter, SqliteBackend
+
+LIMIT = Limit.parse('3/minute')  # ведро на 3 токена, один токен в 20 секунд
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBackend()
+    return SqliteBackend(tmp_path / 'limits.db', sweep_interval=3600)
+
+
+def test_parse():
+    assert (LIMIT.capacity, LIMIT.period) == (3, 60)
+    assert Limit.parse('5/10 minutes').period == 600
+    with pytest.raises(ValueError):
+        Limit.parse('often')
+
+
+def test_bucket_empties_and_refills(backend):
+    assert [backend.take('k', LIMIT, now=0) for _ in range(3)] == [0, 0, 0]
+    assert backend.take('k', LIMIT, now=0) == pytest.approx(20)
+    # Отказ не тратит токен: ждать по-прежнему до 20-й секунды
+    assert backend.take('k', LIMIT, now=5) == pytest.approx(15)
+    assert backend.take('k', LIMIT, now=20) == 0
+    assert backend.take('k', LIMIT, now=20) > 0
+    assert backend.take('other', LIMIT, now=20) == 0
+
+
+def test_peek_and_refund(backend):
+    assert backend.peek('k', LIMIT, now=0) == 0
+    for _ in range(3):
+        backend.take('k', LIMIT, now=0)
+    assert backend.peek('k', LIMIT, now=0) == pytest.approx(20)
+    assert backend.peek('k', LIMIT, now=0) == pytest.approx(20)
+    backend.refund('k', LIMIT, now=0)
+    assert backend.peek('k', LIMIT, now=0) == 0
+    assert backend.take('k', LIMIT, now=0) == 0
+    assert backend.take('k', LIMIT, now=0) > 0
+
+
+def test_refilled_buckets_expire(backend):
+    for key in ('a', 'b'):
+        backend.take(key, LIMIT, now=0)
+    backend.take('c', LIMIT, now=50)
+    assert len(backend) == 3
+
+    # Через период ведро пополнилось полностью и удаляется; недавнее остаётся
+    if isinstance(backend, SqliteBackend):
+        assert backend.sweep(now=60) == 2
+    else:
+        backend.take('d', LIMIT, now=60)
+        assert len(backend) == 2  # c и новое d
+    assert backend.take('c', LIMIT, now=60) == 0
+
+
+def test_rejected_hit_refunds_other_buckets():
+    app = Flask(__name__)
+    app.config['RATE_LIMITS'] = {'register': {'ip': '2/hour', 'email': '1/hour'}}
+    limiter = RateLimiter(app)
+
+    assert limiter.hit('register', now=0, ip='10.0.0.1', email='a@x') == 0
+    # Email исчерпан: IP-токен этого запроса возвращается
+    assert limiter.hit('register', now=0, ip='10.0.0.1', email='a@x') > 0
+    assert limiter.hit('register', now=0, ip='10.0.0.1', email='b@x') == 0
+    assert limiter.check('register', now=0, ip='10.0.0.1') > 0
+
+
+@pytest.fixture
+def limited_app(fresh_db, monkeypatch):
+    app = fresh_db.app
+    monkeypatch.setitem(app.config, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(app.config, 'RATE_LIMITS', {'login': {'ip': '5/minute', 'email': '2/minute'}})
+    monkeypatch.setattr(fresh_db.rate_limiter, 'backend', MemoryBackend())
+    return app
+
+
+def _login(app, email, password):
+    return app.test_client().post('/login', data={'email': email, 'password': password})
+
+
+def test_successful_logins_are_not_limited(limited_app):
+    # Класс за одним NAT: входы с верным паролем токенов не тратят
+    for _ in range(10):
+        assert _login(limited_app, 'student@school.ru', '123456').status_code == 302
+
+
+def test_failed_logins_are_limited_per_email(limited_app):
+    assert [_login(limited_app, 'student@school.ru', 'wrong').status_code for _ in range(3)] == [200, 200, 429]
+    response = _login(limited_app, 'student@school.ru', '123456')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    # Другие ученики с того же адреса входят
+    assert _login(limited_app, 'cook@school.ru', '123456').status_code == 302
+
+
+def test_parallel_failed_logins_are_limited(limited_app, fresh_db, monkeypatch):
+    check_password_hash = fresh_db.check_password_hash
+
+    def slow_check(password_hash, password):
+        time.sleep(0.05)  # как настоящий хеш: все запросы успевают начаться до первой неудачи
+        return check_password_hash(password_hash, password)
+
+    monkeypatch.setattr(fresh_db, 'check_password_hash', slow_check)
+    barrier = threading.Barrier(8)
+    statuses = []
+
+    def attempt():
+        barrier.wait()
+        statuses.append(_login(limited_app, 'student@school.ru', 'wrong').status_code)
+
+    threads = [threading.Thread(target=attempt) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # email: 2/minute — пароль проверен не больше двух раз
+    assert sorted(statuses) == [200, 200] + [429] * 6
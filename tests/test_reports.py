@@ -0,0 +1,69 @@
+import json
+import sqlite3
+from datetime import date
+
+from docx import Document
+
+from instance.get_word import generate_daily_reports, get_user_by_index, get_users
+from instance.order_snapshot import write_snapshot
+
+ORDERS = {
+    'monday': {'user1': {'1': 1}, 'user3': {'1': 2, '2': 1}},
+    'tuesday': {'user3': {'2': 1}, 'legacy': {'1': 1}},
+}
+
+
+def _database(tmp_path):
+    path = tmp_path / 'school.db'
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE user (id INTEGER PRIMARY KEY, email, password_hash, name, role, student_class)')
+    conn.execute('CREATE TABLE menu_item (id INTEGER PRIMARY KEY, name, price)')
+    conn.executemany('INSERT INTO user VALUES (?, ?, ?, ?, ?, ?)', [
+        (1, 'a@x', '', 'Анна', 'student', '5А'),
+        (3, 'v@x', '', 'Вера', 'student', '7Б'),  # id 2 удалён: user3 — это id 3, а не третья строка
+    ])
+    conn.executemany('INSERT INTO menu_item VALUES (?, ?, ?)', [(1, 'Котлета', 150), (2, 'Компот', 20)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_user_key_is_resolved_by_id(tmp_path):
+    db_path = _database(tmp_path)
+    assert get_user_by_index('user3', db_path)[3] == 'Вера'
+    assert get_user_by_index('user2', db_path) is None
+    assert get_users([1, 2, 3], db_path) == {1: ('Анна', 'student', '5А'), 3: ('Вера', 'student', '7Б')}
+
+
+def test_daily_report_is_same_for_orders_json_and_snapshot(tmp_path):
+    db_path = _database(tmp_path)
+    orders_path = tmp_path / 'orders.json'
+    orders_path.write_text(json.dumps(ORDERS))
+    snapshot_path = tmp_path / '2026-01-05.orders.bin'
+    write_snapshot(snapshot_path, ORDERS, date(2026, 1, 5))
+
+    def lines(source, name):
+        path = generate_daily_reports(source, db_path, days_of_week=['monday', 'tuesday'],
+                                      output_dir=tmp_path / name)
+        return [p.text for p in Document(path).paragraphs if ' - ' in p.text]
+
+    from_json = lines(orders_path, 'json')
+    assert from_json == ['Анна 5А - Котлета', 'Вера 7Б - Котлета(2)+компот', 'Вера 7Б - компот', 'legacy  - Котлета']
+    # Снапшот не хранит ключи не вида user<N>, остальное совпадает
+    assert lines(snapshot_path, 'snapshot') == from_json[:-1]
+
+
+def test_freeze_keeps_entries_snapshot_cannot_store(fresh_db):
+    orders_file = fresh_db.app.config['ORDERS_FILE']
+    with open(orders_file, 'w') as f:
+        json.dump({**ORDERS, 'wednesday': {'user1': {'orange': 3, '2': 1}}}, f)
+
+    result = fresh_db.app.test_cli_runner().invoke(args=['freeze-week', '--week', '2026-01-05'])
+    assert result.exit_code == 0, result.output
+    assert 'оставлено записей не по id ученика и блюда: 2' in result.output
+
+    with open(orders_file) as f:
+        assert json.load(f) == {'tuesday': {'legacy': {'1': 1}}, 'wednesday': {'user1': {'orange': 3}}}
+    with fresh_db.app.app_context():
+        snapshot = fresh_db.open_snapshot(fresh_db.week_snapshot_path(date(2026, 1, 5)))
+    assert snapshot.week_totals() == {'1': 3, '2': 3}
@@ -0,0 +1,55 @@
+import threading
+from collections import Counter
+from datetime import date
+
+from instance.served_counters import ServedCounters
+
+DAY = date(2024, 9, 2)
+
+
+def make_counters(stored):
+    counters = ServedCounters(flush=lambda counts, scope: stored.update(
+        {(day, meal_type): n for day, by_type in counts.items() for meal_type, n in by_type.items()}),
+        read=lambda day, scope: {meal_type: stored[(day, meal_type)] for meal_type in ('breakfast', 'lunch')})
+    counters.flush_interval = 3600
+    counters.flush_threshold = 10 ** 6
+    return counters
+
+
+def test_threads_spread_over_shards():
+    counters = make_counters(Counter())
+    barrier = threading.Barrier(4)
+
+    def work():
+        barrier.wait()  # все потоки живы одновременно: идентификаторы не переиспользуются
+        for _ in range(10):
+            counters.add(DAY, 'lunch')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    used = [shard for shard in counters.shards if shard.deltas]
+    assert len(used) == 4
+    assert counters.totals(DAY) == {'breakfast': 0, 'lunch': 40}
+
+
+def test_totals_survive_flush_during_read():
+    stored = Counter()
+    counters = make_counters(stored)
+    counters.add(DAY, 'breakfast', 3)
+    read = counters._read
+
+    def read_and_flush(day, scope):
+        # Сброс между снимком буфера и чтением базы не должен посчитать дельту дважды
+        if stored[(day, 'breakfast')] == 0:
+            flusher = threading.Thread(target=counters.flush, daemon=True)
+            flusher.start()
+            flusher.join(timeout=1)
+            assert not flusher.is_alive(), 'чтение базы держит блокировку сброса'
+        return read(day, scope)
+
+    counters._read = read_and_flush
+    assert counters.totals(DAY) == {'breakfast': 3, 'lunch': 0}
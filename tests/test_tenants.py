@@ -0,0 +1,78 @@
+import pytest
+from flask import Flask, session
+
+from instance.rate_limit import RateLimiter
+from instance.tenants import TenantRouter
+
+
+def _make_app(tmp_path, **config):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='test', TENANTS_DIR=str(tmp_path), **config)
+    for slug in ('alpha', 'beta'):
+        tmp_path.joinpath(slug).mkdir()
+    router = TenantRouter(app)
+
+    @app.route('/login/<name>')
+    def login(name):
+        session['user'] = name
+        return 'ok'
+
+    @app.route('/whoami')
+    def whoami():
+        return f'{router.current().slug}:{session.get("user", "-")}'
+
+    return app
+
+
+def test_path_mode_keeps_sessions_per_school(tmp_path):
+    client = _make_app(tmp_path, TENANT_MODE='path').test_client()
+
+    client.get('/s/alpha/login/anna')
+    assert client.get('/s/alpha/whoami').text == 'alpha:anna'
+    # Вход в одной школе не действует в другой и не сбрасывается переходом в неё
+    assert client.get('/s/beta/whoami').text == 'beta:-'
+    client.get('/s/beta/login/boris')
+    assert client.get('/s/alpha/whoami').text == 'alpha:anna'
+    assert client.get('/s/beta/whoami').text == 'beta:boris'
+
+
+def test_path_mode_unprefixed_request_uses_last_school(tmp_path):
+    client = _make_app(tmp_path, TENANT_MODE='path').test_client()
+    client.get('/s/alpha/login/anna')
+    client.get('/s/beta/login/boris')
+
+    assert client.get('/whoami').text == 'beta:boris'
+    client.get('/s/alpha/whoami')
+    assert client.get('/whoami').text == 'alpha:anna'
+
+
+def test_path_mode_unknown_school_is_404(tmp_path):
+    client = _make_app(tmp_path, TENANT_MODE='path').test_client()
+    assert client.get('/s/gamma/whoami').status_code == 404
+    assert client.get('/whoami').status_code == 404
+
+
+def test_host_mode_resolves_only_configured_hosts(tmp_path):
+    app = _make_app(tmp_path, TENANT_MODE='host', TENANT_BASE_DOMAIN='food.example',
+                    TENANT_HOSTS={'Canteen.School.ru': 'beta'})
+    client = app.test_client()
+
+    assert client.get('/whoami', base_url='http://alpha.food.example').text == 'alpha:-'
+    assert client.get('/whoami', base_url='http://canteen.school.ru:8080').text == 'beta:-'
+    for host in ('www.example.org', '10.0.0.1', 'food.example', 'x.alpha.food.example', 'alpha.other.example'):
+        assert client.get('/whoami', base_url=f'http://{host}').status_code == 404, host
+
+
+def test_host_mode_requires_host_configuration(tmp_path):
+    with pytest.raises(ValueError):
+        _make_app(tmp_path, TENANT_MODE='host')
+
+
+def test_rate_limit_buckets_are_per_school():
+    app = Flask(__name__)
+    app.config['RATE_LIMITS'] = {'login': {'ip': '1/minute'}}
+    limiter = RateLimiter(app)
+
+    assert limiter.hit('login', now=0, scope='alpha', ip='10.0.0.1') == 0
+    assert limiter.hit('login', now=0, scope='alpha', ip='10.0.0.1') > 0
+    assert limiter.hit('login', now=0, scope='beta', ip='10.0.0.1') == 0